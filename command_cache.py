@@ -0,0 +1,138 @@
+import os
+import hashlib
+import marshal
+
+import command_catalog
+
+# bump this when the shape of `Command` (or anything it references) changes
+CACHE_VERSION = 2
+
+# changes to these files can change how commands are built, so they are part of the fingerprint
+_BUILDER_FILES = ("definitions.py", "git_filtering_internal.py", "command_cache.py", "command_catalog.py")
+
+# commands already loaded by this process, keyed by cache path; only reused across queries by `git_filtering_server.py`
+_memory = {}
+
+
+def cache_dir():
+    """
+    Returns the folder used for the compiled command cache, or None if caching is unavailable.
+
+    Alfred sets `alfred_workflow_cache` for every script it runs; outside of Alfred nothing is cached.
+    """
+    base = os.getenv('alfred_workflow_cache')
+    if not base:
+        return None
+    return os.path.join(base, "commands")
+
+
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def _source_identity(kind, value):
+    if kind == 'path':
+        return (kind, os.path.abspath(value))
+    return (kind, hashlib.sha1(value.encode('utf-8')).hexdigest())
+
+
+def _fingerprint(sources):
+    here = os.path.dirname(os.path.abspath(__file__))
+    builder = tuple(_file_fingerprint(os.path.join(here, name)) for name in _BUILDER_FILES)
+
+    # string sources are identified by their content hash, so only files need a stat
+    sources_fingerprint = tuple(
+        _file_fingerprint(identity[1]) if identity[0] == 'path' else None
+        for identity in (_source_identity(kind, value) for kind, value in sources)
+    )
+    return (CACHE_VERSION, command_catalog.FORMAT_VERSION, builder, sources_fingerprint)
+
+
+def _cache_path(folder, sources):
+    identities = repr([_source_identity(kind, value) for kind, value in sources])
+    name = hashlib.sha1(identities.encode('utf-8')).hexdigest()
+    return os.path.join(folder, f"{name}.catalog")
+
+
+def _write(path, fingerprint, commands):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        marshal.dump((fingerprint, command_catalog.compile_commands(commands)), file)
+    os.replace(tmp_path, path)
+
+
+def store_commands(sources, build, folder=None):
+    """
+    Builds the commands for `sources` and stores them where `load_commands` looks for them, replacing what's there.
+
+    Parameters:
+        sources (List[tuple]): as for `load_commands`.
+        build (Callable): builds the command list for `sources`.
+        folder (str): the cache folder, `cache_dir()` by default.
+
+    Returns:
+        tuple: the path of the stored catalog and the commands.
+    """
+    sources = [(kind, value) for kind, value in sources if value]
+    folder = folder or cache_dir()
+    if not folder:
+        raise ValueError("alfred_workflow_cache is not set")
+
+    path = _cache_path(folder, sources)
+    fingerprint = _fingerprint(sources)
+    commands = build(sources)
+    _write(path, fingerprint, commands)
+    return path, commands
+
+
+def load_commands(sources, build):
+    """
+    Returns the commands for `sources`, using the compiled cache when it is still valid.
+
+    The returned commands may be shared with later calls, so callers must not mutate them.
+
+    Parameters:
+        sources (List[tuple]): `('path', config_path)` or `('string', yaml_string)` entries, in load order.
+        build (Callable): builds the command list for `sources` when the cache is cold.
+
+    Returns:
+        List[Command]: the fully built command tree.
+    """
+    sources = [(kind, value) for kind, value in sources if value]
+    folder = cache_dir()
+    if not folder or not sources:
+        return build(sources)
+
+    path = _cache_path(folder, sources)
+    fingerprint = _fingerprint(sources)
+
+    cached = _memory.get(path)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    try:
+        with open(path, 'rb') as file:
+            cached_fingerprint, data = marshal.load(file)
+        if cached_fingerprint == fingerprint:
+            # only the top level commands are built here, the rest as queries reach them
+            commands = command_catalog.Catalog(data).roots()
+            _memory[path] = (fingerprint, commands)
+            return commands
+    except Exception:
+        # missing, truncated or written by an older version; rebuild below
+        pass
+
+    commands = build(sources)
+    _memory[path] = (fingerprint, commands)
+
+    try:
+        _write(path, fingerprint, commands)
+    except Exception:
+        pass
+
+    return commands
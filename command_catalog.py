@@ -0,0 +1,229 @@
+# python3 command_catalog.py <config.yaml>...
+#
+# compiles configs into a command catalog: the `Command` tree flattened into columns, stored and read back
+# with a single `marshal` load. The catalog is written to the workflow's command cache (`alfred_workflow_cache`
+# must be set), where `command_cache.py` finds it for the same configs, so the first query skips the YAML 👆
+
+import sys
+
+from definitions import CommandType, Command, Modifier, ModifierKey, TextViewAction
+
+# bump this when the layout below changes
+FORMAT_VERSION = 2
+
+# `Command` attributes stored as an index into `strings`, or -1 for None
+STRING_FIELDS = (
+    "title", "action", "secondaryAction", "subtitle", "icon_path", "values_command", "values_icon",
+    "subtitle_command", "quicklookurl", "values_builtin", "subtitle_builtin", "cache",
+)
+
+# `Command` attributes stored as they are
+PLAIN_FIELDS = (
+    "values", "should_use_values_as_inline_commands", "should_use_smart_sort", "should_trim_values",
+    "should_filter_by_subtitle_command", "max_results",
+)
+
+# Layout, one dict dumped with `marshal`:
+#   strings        every distinct string, referenced by index
+#   commands       one column per field, indexed by command; the fields above plus `command_type` (its value),
+#                  `mods_start`/`mods_end` (a range of the modifier columns), `textview` (index into the
+#                  text view columns or -1) and `children_start`/`children_end`
+#   mods           `arg`, `subtitle`, `valid`, `key` columns
+#   textviews      `command`, `mods_start`, `mods_end` columns
+#   roots          `(start, end)` of the top level commands
+# Commands are stored breadth first, so the subcommands of each command are a contiguous range.
+COMMAND_COLUMNS = STRING_FIELDS + PLAIN_FIELDS + (
+    "command_type", "mods_start", "mods_end", "textview", "children_start", "children_end",
+)
+
+
+def compile_commands(commands):
+    """
+    Flattens a command tree into the catalog layout.
+
+    Parameters:
+        commands (List[Command]): the top level commands, as built by `create_commands_from_yaml`.
+
+    Returns:
+        dict: the catalog, ready for `marshal.dump` or `Catalog`.
+    """
+    strings = []
+    string_indexes = {}
+
+    def intern(value):
+        if value is None:
+            return -1
+        index = string_indexes.get(value)
+        if index is None:
+            index = string_indexes[value] = len(strings)
+            strings.append(value)
+        return index
+
+    columns = {name: [] for name in COMMAND_COLUMNS}
+    mods = {name: [] for name in ("arg", "subtitle", "valid", "key")}
+    textviews = {name: [] for name in ("command", "mods_start", "mods_end")}
+    mod_ranges = {}
+
+    def add_mods(mod_list):
+        # a text view without its own mods shares the command's list
+        key = id(mod_list)
+        if key not in mod_ranges:
+            start = len(mods["arg"])
+            for mod in mod_list:
+                mods["arg"].append(intern(mod.arg))
+                mods["subtitle"].append(intern(mod.subtitle))
+                mods["valid"].append(mod.valid)
+                mods["key"].append(intern(mod.key.value if mod.key else None))
+            mod_ranges[key] = (start, len(mods["arg"]))
+        return mod_ranges[key]
+
+    nodes = list(commands)
+    index = 0
+    while index < len(nodes):
+        cmd = nodes[index]
+        index += 1
+
+        for name in STRING_FIELDS:
+            columns[name].append(intern(getattr(cmd, name)))
+        for name in PLAIN_FIELDS:
+            columns[name].append(getattr(cmd, name))
+        columns["command_type"].append(cmd.command_type.value)
+
+        mods_start, mods_end = add_mods(cmd.mods)
+        columns["mods_start"].append(mods_start)
+        columns["mods_end"].append(mods_end)
+
+        textview = cmd.textview_action
+        if textview is None:
+            columns["textview"].append(-1)
+        else:
+            columns["textview"].append(len(textviews["command"]))
+            textviews["command"].append(intern(textview.command))
+            mods_start, mods_end = add_mods(textview.mods)
+            textviews["mods_start"].append(mods_start)
+            textviews["mods_end"].append(mods_end)
+
+        columns["children_start"].append(len(nodes))
+        nodes.extend(cmd.subcommands)
+        columns["children_end"].append(len(nodes))
+
+    return {
+        "version": FORMAT_VERSION,
+        "strings": strings,
+        "commands": columns,
+        "mods": mods,
+        "textviews": textviews,
+        "roots": (0, len(commands)),
+    }
+
+
+class CatalogCommand(Command):
+    """
+    A `Command` read from a catalog; its subcommands are only built when they are first used.
+    """
+    __slots__ = ('_catalog', '_children', '_subcommands')
+
+    @property
+    def subcommands(self):
+        if self._subcommands is None:
+            self._subcommands = self._catalog.commands(*self._children)
+        return self._subcommands
+
+    @subcommands.setter
+    def subcommands(self, value):
+        self._subcommands = value
+
+
+class Catalog:
+    """
+    Builds `Command`s from a compiled catalog on demand; each one is built at most once.
+    """
+
+    def __init__(self, data):
+        self.strings = data["strings"]
+        self.columns = data["commands"]
+        self.mods = data["mods"]
+        self.textviews = data["textviews"]
+        self.root_range = data["roots"]
+        self._commands = {}
+        self._mod_lists = {}
+
+    def string(self, index):
+        return self.strings[index] if index >= 0 else None
+
+    def roots(self):
+        return self.commands(*self.root_range)
+
+    def commands(self, start, end):
+        return [self.command(index) for index in range(start, end)]
+
+    def command(self, index):
+        cmd = self._commands.get(index)
+        if cmd is not None:
+            return cmd
+
+        columns = self.columns
+        cmd = CatalogCommand.__new__(CatalogCommand)
+        for name in STRING_FIELDS:
+            setattr(cmd, name, self.string(columns[name][index]))
+        for name in PLAIN_FIELDS:
+            setattr(cmd, name, columns[name][index])
+        cmd.command_type = CommandType(columns["command_type"][index])
+        cmd.mods = self.mod_list(columns["mods_start"][index], columns["mods_end"][index])
+
+        textview = columns["textview"][index]
+        cmd.textview_action = None
+        if textview >= 0:
+            cmd.textview_action = TextViewAction(
+                command=self.string(self.textviews["command"][textview]),
+                mods=self.mod_list(self.textviews["mods_start"][textview], self.textviews["mods_end"][textview])
+            )
+
+        cmd._catalog = self
+        cmd._children = (columns["children_start"][index], columns["children_end"][index])
+        cmd._subcommands = None
+        self._commands[index] = cmd
+        return cmd
+
+    def mod_list(self, start, end):
+        key = (start, end)
+        mod_list = self._mod_lists.get(key)
+        if mod_list is None:
+            mod_list = self._mod_lists[key] = [
+                Modifier(
+                    arg=self.string(self.mods["arg"][i]),
+                    subtitle=self.string(self.mods["subtitle"][i]),
+                    valid=self.mods["valid"][i],
+                    key=ModifierKey(self.string(self.mods["key"][i])) if self.mods["key"][i] >= 0 else None
+                ) for i in range(start, end)
+            ]
+        return mod_list
+
+
+def compile_configs(configs, folder=None):
+    """
+    Compiles the `configs` files, in order, into the catalog `command_cache.load_commands` reads for them.
+
+    Parameters:
+        configs (List[str]): paths of YAML configs.
+        folder (str): the command cache folder, `command_cache.cache_dir()` by default.
+
+    Returns:
+        tuple: the path of the catalog and the top level commands.
+    """
+    # only needed to compile, not to read a catalog
+    import command_cache
+    from git_filtering_internal import build_commands
+
+    return command_cache.store_commands([('path', config) for config in configs], build_commands, folder)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python3 command_catalog.py <config.yaml>...")
+
+    try:
+        path, commands = compile_configs(sys.argv[1:])
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"{len(commands)} commands -> {path}")
@@ -1,4 +1,19 @@
+import json
 from enum import Enum
+from json.encoder import encode_basestring_ascii
+
+# JSON for values that repeat across items (icons, types, mod keys), see `ResultItem.to_json`
+_json_fragments = {}
+
+def _json(value):
+    # the same output as `json.dumps`, without its overhead for the common case of a string
+    return encode_basestring_ascii(value) if type(value) is str else json.dumps(value)
+
+def _json_fragment(kind, value, build):
+    fragment = _json_fragments.get((kind, value))
+    if fragment is None:
+        fragment = _json_fragments[(kind, value)] = build(value)
+    return fragment
 
 class CommandType(Enum):
     NO_ACTION = 2       # Shows information inline without further action
@@ -41,6 +56,8 @@ class ModifierKey(Enum):
         return self._value_
 
 class Modifier:
+    __slots__ = ('arg', 'subtitle', 'valid', 'key')
+
     def __init__(self, arg, subtitle='', valid=False, key=None):
         self.arg = arg
         self.subtitle = subtitle
@@ -81,6 +98,8 @@ class Modifier:
         ]
 
 class Text:
+    __slots__ = ('copy', 'largetype')
+
     def __init__(self, copy='', largetype=''):
         self.copy = copy
         self.largetype = largetype
@@ -92,7 +111,9 @@ class Text:
         }
 
 class ResultItem:
-    def __init__(self, title, arg, subtitle='', autocomplete=None, location=None, alfred_input=None, valid=False, mods=None, text=None, uid=None, icon_path=None, type=None, quicklookurl=None, should_use_smart_sort=False, textview_action=None):
+    __slots__ = ('uid', 'title', 'arg', 'subtitle', 'autocomplete', 'valid', 'mods', 'text', 'icon_path', 'type', 'quicklookurl', 'should_use_smart_sort', 'textview_action', 'pending_subtitle_command', 'subtitle_cache')
+
+    def __init__(self, title, arg, subtitle='', autocomplete=None, location=None, alfred_input=None, valid=False, mods=None, text=None, uid=None, icon_path=None, type=None, quicklookurl=None, should_use_smart_sort=False, textview_action=None, pending_subtitle_command=None, subtitle_cache=None):
         self.uid = uid if uid else title
         self.title = title
         self.arg = arg
@@ -106,6 +127,46 @@ class ResultItem:
         self.quicklookurl = quicklookurl
         self.should_use_smart_sort = should_use_smart_sort
         self.textview_action = textview_action
+        self.pending_subtitle_command = pending_subtitle_command # zsh command whose output becomes the subtitle, see `resolve_subtitles`
+        self.subtitle_cache = subtitle_cache # the command's `cache:` setting, used when running `pending_subtitle_command`
+
+    def to_json(self):
+        """
+        Returns the same JSON as `json.dumps(self.to_dict())`, written directly, for `ScriptFilterOutput`.
+        """
+        parts = []
+        if self.should_use_smart_sort and self.uid is not None:
+            parts.append(f', "uid": {_json(self.uid)}')
+        for name, value in (("title", self.title), ("arg", self.arg), ("subtitle", self.subtitle)):
+            if value is not None:
+                parts.append(f', "{name}": {_json(value)}')
+        parts.append(f', "autocomplete": {_json(f" {self.autocomplete}")}')
+        parts.append(', "valid": true' if self.valid is True else f', "valid": {_json(self.valid)}')
+        parts.append(_json_fragment("type", self.type if self.type else "default", lambda value: f', "type": {_json(value)}'))
+        if self.quicklookurl is not None:
+            parts.append(f', "quicklookurl": {_json(self.quicklookurl)}')
+
+        if self.mods:
+            mods = []
+            for mod in self.mods:
+                if mod.key is not None:
+                    key = _json_fragment("mod", mod.key.value, _json)
+                    fields = f'"valid": {_json(mod.valid)}, "arg": {_json(mod.arg)}, "subtitle": {_json(mod.subtitle)}'
+                    if self.textview_action:
+                        fields += f', "variables": {{"is_mod": {key}}}'
+                    mods.append(f'{key}: {{{fields}}}')
+            parts.append(f', "mods": {{{", ".join(mods)}}}')
+
+        if self.text:
+            parts.append(f', "text": {json.dumps(self.text.to_dict())}')
+        if self.icon_path:
+            parts.append(_json_fragment("icon", self.icon_path, lambda value: f', "icon": {{"path": {_json(value)}}}'))
+        if self.textview_action:
+            variables = self.textview_action.to_dict()
+            if variables:
+                parts.append(f', "variables": {json.dumps(variables)}')
+
+        return "{" + "".join(parts)[2:] + "}"
 
     def to_dict(self):
         item_dict = {
@@ -151,6 +212,8 @@ class ResultItem:
         # josh was here
 
 class Location:
+    __slots__ = ('title', 'directory', 'actions_path', 'should_show_default_commands')
+
     def __init__(self, title, directory, actions_path=None, should_show_default_commands=True):
         self.title = title
         self.directory = directory
@@ -158,6 +221,8 @@ class Location:
         self.should_show_default_commands = should_show_default_commands
 
 class TextViewAction:
+    __slots__ = ('command', 'mods')
+
     def __init__(self, command=None, mods=None): # TODO: command shouldn't be optional
         self.command = command
         self.mods = mods or []
@@ -189,7 +254,9 @@ class TextViewAction:
         return f"TextViewAction(command={self.command!r}, mods={self.mods!r})"
 
 class Command:
-    def __init__(self, title, action, secondaryAction=None, subtitle=None, command_type=CommandType.SINGLE_ACTION, icon_path=None, mods=None, values=None, values_command=None, subcommands=None, values_icon=None, subtitle_command=None, should_use_values_as_inline_commands=False, quicklookurl=None, should_use_smart_sort=False, should_trim_values=True, textview_action=None):
+    __slots__ = ('title', 'action', 'secondaryAction', 'subtitle', 'command_type', 'icon_path', 'mods', 'values', 'values_command', 'values_icon', 'should_use_values_as_inline_commands', 'subtitle_command', 'subcommands', 'quicklookurl', 'should_use_smart_sort', 'should_trim_values', 'textview_action', 'should_filter_by_subtitle_command', 'values_builtin', 'subtitle_builtin', 'cache', 'max_results')
+
+    def __init__(self, title, action, secondaryAction=None, subtitle=None, command_type=CommandType.SINGLE_ACTION, icon_path=None, mods=None, values=None, values_command=None, subcommands=None, values_icon=None, subtitle_command=None, should_use_values_as_inline_commands=False, quicklookurl=None, should_use_smart_sort=False, should_trim_values=True, textview_action=None, should_filter_by_subtitle_command=False, values_builtin=None, subtitle_builtin=None, cache=None, max_results=None):
         self.title = title
         self.action = action
         self.secondaryAction = secondaryAction
@@ -207,15 +274,52 @@ class Command:
         self.should_use_smart_sort = should_use_smart_sort
         self.should_trim_values = should_trim_values
         self.textview_action = textview_action
+        self.should_filter_by_subtitle_command = should_filter_by_subtitle_command
+        self.values_builtin = values_builtin # replaces `values_command`, see git_builtins.py
+        self.subtitle_builtin = subtitle_builtin # replaces `subtitle_command`
+        self.cache = cache # `refs`, `index`, `background` or `none`, see `cached_command_output`
+        self.max_results = max_results # caps the values listed, see `best_matches`
 
     def __repr__(self):
         return f"{self.title}"
 
+    def has_values(self):
+        return self.values is not None or self.values_command is not None or self.values_builtin is not None
+
     def is_valid(self):
         return self.command_type != CommandType.NO_ACTION
 
 
+class ValueCommand(Command):
+    """
+    One of a command's values, listed as a command of its own (see `create_value_commands`).
+
+    Only what differs from `template` is stored; the other fields are read from the template, so listing
+    thousands of branches or tags doesn't copy the template's fields into each of them.
+    """
+    __slots__ = ('template',)
+
+    def __init__(self, template, title, action, command_type):
+        self.template = template
+        self.title = title
+        self.action = action
+        self.command_type = command_type
+        self.values = None
+        self.values_command = None
+        self.values_builtin = None
+        self.should_use_values_as_inline_commands = False
+        self.quicklookurl = None
+
+    def __getattr__(self, name):
+        # only reached for the fields that weren't set above (or were never assigned on a copy)
+        if name == 'template':
+            raise AttributeError(name)
+        return getattr(self.template, name)
+
+
 class TokenizationResult:
+    __slots__ = ('location', 'commands', 'unfinished_query')
+
     def __init__(self, location=None, commands=None, unfinished_query=None):
         self.location = location
         self.commands = commands if commands is not None else []
@@ -164,20 +164,12 @@ diff_command() {
     fi
 }
 
-# Helper function to get the full diff for a given action and file
-_get_first_file() {
-    local action="$1"  # "stage", "unstage", or "discard"
+# Hunks are read and applied by git_hunks.py, which runs `git diff` once for the header, count and hunk.
+# GIT_PLUS_DIR is the workflow folder: the script filter sets it, Alfred sources this file from there
+GIT_PLUS_DIR="${GIT_PLUS_DIR:-$PWD}"
 
-    if [[ "$action" == "stage" ]]; then
-        diff_command 'modified' | head -n 1
-    elif [[ "$action" == "unstage" ]]; then
-        diff_command 'staged' | head -n 1
-    elif [[ "$action" == "discard" ]]; then
-        diff_command 'modified' | head -n 1
-    else
-        echo "Invalid action. Use 'stage', 'unstage', or 'discard'."
-        return 1
-    fi
+_git_hunks() {
+    python3 "$GIT_PLUS_DIR/git_hunks.py" "$@"
 }
 
 # Helper function to get a nice diff header 
@@ -186,21 +178,7 @@ _get_diff_header() {
     local file="$2"
     local header="$3"
 
-    if [[ -z "$file" ]]; then
-        file=$(_get_first_file "$action")
-    fi
-
-    if [[ -z "$header" ]]; then
-        full_diff=$(_get_full_diff "$action" "$file")
-        header=$(_get_first_hunk "$full_diff" | grep '^@@')
-    fi
-
-    count=$(_get_hunk_count "$action" "$file")
-
-    echo "----------------------------------"
-    echo "file: $file ($count)"
-    echo "hunk: $header"
-    echo "----------------------------------"
+    _git_hunks header "$action" "$file" "$header"
 }
 
 # Helper function to get the number of hunks for the action and or file
@@ -208,63 +186,7 @@ _get_hunk_count() {
     local action="$1"  # "stage", "unstage", or "discard"
     local file="$2"
 
-    if [[ -z "$file" ]]; then
-        file=$(_get_first_file "$action")
-    fi
-
-    full_diff=$(_get_full_diff "$action" "$file")
-    local count=$(echo "$full_diff" | grep -c '^@@')
-
-    if (( count == 1 )); then
-        echo "$count hunk"
-    else
-        echo "$count hunks"
-    fi
-}
-
-# Helper function to get the full diff for a given action and file
-_get_full_diff() {
-    local action="$1"  # "stage", "unstage", or "discard"
-    local file="$2"    # File path
-
-    if [[ -z "$file" ]]; then
-        file=$(_get_first_file "$action") || { echo 'get first file failed'; return 1; }
-    fi
-
-    if [[ "$action" == "stage" ]]; then
-        git diff "$file"
-    elif [[ "$action" == "unstage" ]]; then
-        git diff --cached "$file"
-    elif [[ "$action" == "discard" ]]; then
-        git diff "$file"
-    else
-        echo "Invalid action. Use 'stage', 'unstage', or 'discard'."
-        return 1
-    fi
-}
-
-_get_first_hunk() {
-    local full_diff="$1"
-
-    echo "$full_diff" | awk '
-      /^@@/ {
-          if (found) exit;  # Exit if a second @@ line is found
-          found = 1;        # Mark that the first @@ line is found
-      }
-      found { print }       # Print lines after finding the first @@
-  '
-}
-
-# Helper function to get a hunk
-_get_hunk() {
-    local full_diff="$1"
-    local header="$2"
-
-    echo "$full_diff" | awk -v header="$header" '
-      $0 == header { found = 1 }                  # Start printing when the line matches $header
-      /^@@/ && $0 != header && found { exit }     # Stop printing if another @@ line is found
-      found { print }                             # Print lines after $header is matched
-    '
+    _git_hunks count "$action" "$file"
 }
 
 # Function to view a hunk (excluding @@ lines)
@@ -276,20 +198,7 @@ view_hunk() {
     local file="$2"
     local header="$3"
 
-    local full_diff hunk
-    full_diff=$(_get_full_diff "$action" "$file") || { echo 'full_diff failed'; return 1; }
-
-    if [[ -n "$header" ]]; then
-        hunk=$(_get_hunk "$full_diff" "$header") || { echo 'hunk failed'; return 1; }
-    else
-        hunk=$(_get_first_hunk "$full_diff") || { echo 'hunk failed'; return 1; }
-    fi
-
-    _get_diff_header "$action" "$file" "$header"
-    echo
-
-    # Remove all lines that start with @@
-    echo "$hunk" | sed '/^@@/d'
+    _git_hunks view "$action" "$file" "$header"
 }
 
 
@@ -302,71 +211,33 @@ process_hunk() {
     local file="$2"
     local header="$3"
 
-    # Determine the full diff and file count based on action
-    local full_diff diff_header hunk file_count apply_command
-    if [[ "$action" == "stage" ]]; then
-        file_count=$(diff_command 'modified' | wc -l | xargs)
-        apply_command="git apply --cached"
-    elif [[ "$action" == "unstage" ]]; then
-        file_count=$(diff_command 'staged' | wc -l | xargs)
-        apply_command="git apply --cached --reverse"
-    elif [[ "$action" == "discard" ]]; then
-        file_count=$(diff_command 'modified' | wc -l | xargs)
-        apply_command="git apply --reverse"
-    else
-        echo "Invalid action. Use 'stage', 'unstage', or 'discard'."
-        return 1
-    fi
-
-    full_diff=$(_get_full_diff "$action" "$file") || (echo 'full_diff failed' && return 1)
-    diff_header=$(echo "$full_diff" | head -n 4)
-
-    if [[ -n "$header" ]]; then
-        hunk=$(_get_hunk "$full_diff" "$header") || { echo 'hunk failed'; return 1; }
-    else
-        hunk=$(_get_first_hunk "$full_diff") || { echo 'hunk failed'; return 1; }
-    fi
-
-    # Create a patch file
-    local patch_file="hunk.patch"
-    {
-        echo "$diff_header"
-        echo "$hunk"
-    } > "$patch_file"
-
-    # Apply the patch using the determined command
-    eval "$apply_command \"$patch_file\""
-
-    # Cleanup
-    rm "$patch_file"
-
-    # Count the number of hunks
-    local hunk_count
-    hunk_count=$(echo "$full_diff" | grep -c '^@@')
-
-    # Determine the reload level
-    # viewing a specific file or a header
-    if [[ -n "$header" || -n "$file" ]]; then
-
-      if [[ "$hunk_count" -eq 1 && "$file_count" -eq 1 ]]; then
-          return 3
-      elif [[ "$hunk_count" -eq 1 ]]; then
-          return 2
-      else
-          return 0
-      fi
+    # exits with the reload level, see `reload_level` in git_hunks.py (1 if it failed)
+    _git_hunks apply "$action" "$file" "$header"
+}
 
-    else
+# Function to view all hunks numbered, to pick some for process_hunks
+# ACTION="stage"          # "stage", "unstage" or "discard"
+# FILE="[parent]"         # Optional, File path else lists every file's hunks
+# SELECTION="$tv_input"   # Optional, e.g. "1,3-5", "all" or "/regex/", the selected hunks are marked
+view_hunks() {
+    local action="$1"
+    local file="$2"
+    local selection="$3"
 
-      # viewing all hunks, only go back 2, if no more hunks
-      if [[ "$hunk_count" -eq 1 && "$file_count" -eq 1 ]]; then
-          return 2
-      else
-          return 0
-      fi
+    _git_hunks list "$action" "$file" "$selection"
+}
 
-    fi
+# Function to process the hunks picked from view_hunks at once (one patch, one git apply)
+# ACTION="stage"          # "stage", "unstage" or "discard"
+# FILE="[parent]"         # Optional, File path else picks from every file's hunks
+# SELECTION="$tv_input"   # e.g. "1,3-5", "all" or "/regex/"
+process_hunks() {
+    local action="$1"
+    local file="$2"
+    local selection="$3"
 
+    # exits with the reload level, see `reload_level` in git_hunks.py (1 if it failed)
+    _git_hunks batch "$action" "$file" "$selection"
 }
 
 # Function to process a file (stage or unstage)
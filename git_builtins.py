@@ -0,0 +1,159 @@
+import os
+import subprocess
+
+import git_refs
+import git_index
+import git_hunks
+import git_status
+
+# name -> (function, git command it replaces); see `values_builtin` and `subtitle_builtin` in docs.md
+BUILTINS = {}
+
+
+def builtin(name, fallback):
+    """
+    Registers `function(refs, *args)` as the builtin `name`.
+
+    `fallback` is the git command with the same output, used when the refs can't be read natively. Builtins
+    without one run git themselves and are given None for the refs.
+    """
+    def register(function):
+        BUILTINS[name] = (function, fallback)
+        return function
+    return register
+
+
+@builtin('current_branch', ["git", "branch", "--show-current"])
+def current_branch(refs):
+    branch = refs.current_branch()
+    return [branch] if branch else []
+
+
+@builtin('local_branches', ["git", "branch", "--format=%(if)%(HEAD)%(then)%(else)%(refname:short)%(end)"])
+def local_branches(refs):
+    # all local branches except the current one
+    current = refs.current_branch()
+    return [branch for branch in refs.local_branches() if branch != current]
+
+
+@builtin('remote_branches', ["git", "branch", "-r"])
+def remote_branches(refs):
+    return refs.remote_branches()
+
+
+@builtin('tags', ["git", "tag", "--sort=-refname"])
+def tags(refs):
+    # newest version first for the usual `v1.2.3` names
+    return refs.tags()[::-1]
+
+
+@builtin('head', ["git", "rev-parse", "HEAD"])
+def head(refs):
+    sha = refs.head_sha()
+    return [sha] if sha else []
+
+
+def _count_command(kind, text):
+    # the shell equivalent of a builtin that counts one of git_index's file lists
+    return ["sh", "-c", f'echo "$({" ".join(git_index.GIT_COMMANDS[kind])} | wc -l | xargs) {text}"']
+
+
+@builtin('staged_files', git_index.GIT_COMMANDS['staged'])
+def staged_files(refs):
+    return git_index.for_directory(os.getcwd()).files('staged')
+
+
+@builtin('modified_files', git_index.GIT_COMMANDS['modified'])
+def modified_files(refs):
+    return git_index.for_directory(os.getcwd()).files('modified')
+
+
+@builtin('untracked_files', git_index.GIT_COMMANDS['untracked'])
+def untracked_files(refs):
+    return git_index.for_directory(os.getcwd()).files('untracked')
+
+
+@builtin('staged_count', _count_command('staged', 'file(s)'))
+def staged_count(refs):
+    return [f"{len(staged_files(refs))} file(s)"]
+
+
+@builtin('modified_count', _count_command('modified', 'file(s)'))
+def modified_count(refs):
+    return [f"{len(modified_files(refs))} file(s)"]
+
+
+@builtin('untracked_count', _count_command('untracked', 'file(s)'))
+def untracked_count(refs):
+    return [f"{len(untracked_files(refs))} file(s)"]
+
+
+@builtin('conflicted_files', ["git", "diff", "--name-only", "--diff-filter=U"])
+def conflicted_files(refs):
+    status = git_index.for_directory(os.getcwd())
+    paths = git_status.for_directory(status.worktree).paths('conflicted', os.getcwd())
+    return [git_index.quote_path(path, status.quote_non_ascii()) for path in paths]
+
+
+@builtin('upstream_status', ["sh", "-c", "git status | grep 'branch is' || echo '!! no remote branch linked yet'"])
+def upstream_status(refs):
+    # the first line of `git status` about the upstream, from the query's status snapshot
+    return [git_status.for_directory(os.getcwd()).upstream_status() or '!! no remote branch linked yet']
+
+
+@builtin('status_summary', ["sh", "-c", " ".join([
+    'echo "staged: $(git diff --cached --name-only | wc -l | xargs),',
+    'modified: $(git diff --name-only | wc -l | xargs),',
+    'untracked: $(git ls-files --others --exclude-standard | wc -l | xargs) -- $(git branch --show-current)"',
+])])
+def status_summary(refs):
+    # one index read for the three lists
+    status = git_index.for_directory(os.getcwd())
+    staged, modified, untracked = (len(status.files(kind)) for kind in ('staged', 'modified', 'untracked'))
+    return [f"staged: {staged}, modified: {modified}, untracked: {untracked} -- {refs.current_branch()}"]
+
+
+@builtin('hunk_count', None)
+def hunk_count(refs, action, file):
+    # one `git diff` for the subtitles of every file in the list
+    return [git_hunks.hunk_count(action, file, all_files=True)]
+
+
+@builtin('hunk_headers', None)
+def hunk_headers(refs, action, file):
+    return git_hunks.headers(action, file, all_files=True)
+
+
+def run(invocation):
+    """
+    Runs a builtin in the current directory, e.g. `local_branches`.
+
+    Parameters:
+        invocation (str): the builtin's name, optionally followed by shell-quoted arguments.
+
+    Returns:
+        str: the output lines, formatted like `run_command` in git_filtering_internal.py.
+    """
+    import shlex
+    try:
+        name, *args = shlex.split(invocation)
+    except ValueError:
+        name, args = invocation.strip(), []
+
+    if name not in BUILTINS:
+        return f"Unknown builtin: {name}"
+    function, fallback = BUILTINS[name]
+    if fallback is None:
+        return "\n".join(function(None, *args))
+
+    try:
+        refs = git_refs.for_directory(os.getcwd())
+        if refs is not None:
+            return "\n".join(function(refs, *args))
+    except (git_refs.UnsupportedRepository, OSError):
+        pass
+
+    result = subprocess.run(fallback, capture_output=True, text=True)
+    if result.returncode != 0:
+        return f"Error executing {invocation}: {result.stderr}"
+    return "\n".join(line.strip() for line in result.stdout.splitlines() if line.strip())
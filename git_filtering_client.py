@@ -0,0 +1,175 @@
+# /bin/bash
+# python3 git_filtering_client.py "$1"
+#
+# drop-in replacement for `python3 git_filtering_internal.py "$1"` that forwards the query to a
+# long-lived `git_filtering_server.py` process, starting it on first use 👆
+
+import os
+import sys
+import json
+import stat
+import socket
+import struct
+
+# how long to wait for the server to answer one query before running it ourselves
+REPLY_TIMEOUT = 60
+
+# the server's log starts over once it's this big
+MAX_LOG_SIZE = 1 << 20
+
+
+def workflow_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def is_private(path, is_kind):
+    """
+    Returns whether `path` (not followed if it's a link) is of the kind `is_kind` checks, e.g. `stat.S_ISDIR`,
+    belongs to this user and is out of reach of everyone else.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return is_kind(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def socket_dir():
+    """
+    Returns the folder the server's socket lives in, only accessible to this user, or None if it can't be
+    trusted (e.g. someone else created it first).
+    """
+    folder = os.path.join(os.environ.get('TMPDIR', '/tmp'), f"git-plus-{os.getuid()}")
+    try:
+        os.mkdir(folder, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    return folder if is_private(folder, stat.S_ISDIR) else None
+
+
+def socket_path():
+    """
+    Returns the path of the server's socket, or None if there's nowhere safe for it (queries then run without
+    the server).
+    """
+    # unix socket paths are limited to ~100 characters on macOS, so this can't live in the
+    # (long) Alfred cache folder; the workflow folder is hashed in to keep installs apart
+    import zlib
+    folder = socket_dir()
+    if folder is None:
+        return None
+    tag = zlib.crc32(workflow_dir().encode('utf-8'))
+    return os.path.join(folder, f"{tag:08x}.sock")
+
+
+def log_path():
+    """
+    Returns the file the server writes its errors to, in the workflow cache folder, or None outside of Alfred.
+    """
+    folder = os.getenv('alfred_workflow_cache')
+    if not folder:
+        return None
+    return os.path.join(folder, "server.log")
+
+
+def send_message(sock, payload):
+    sock.sendall(struct.pack('>I', len(payload)) + payload)
+
+
+def recv_message(sock):
+    def recv_exactly(size):
+        chunks = []
+        while size:
+            chunk = sock.recv(min(size, 65536))
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    header = recv_exactly(4)
+    if header is None:
+        return None
+    (size,) = struct.unpack('>I', header)
+    return recv_exactly(size)
+
+
+def start_server():
+    import subprocess
+
+    log = subprocess.DEVNULL
+    path = log_path()
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        mode = 'a' if not os.path.exists(path) or os.path.getsize(path) < MAX_LOG_SIZE else 'w'
+        log = open(path, mode)
+
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.join(workflow_dir(), "git_filtering_server.py")],
+            cwd=os.getcwd(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+            start_new_session=True
+        )
+    finally:
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+
+def query_server():
+    """
+    Sends this process' argv, environment and working directory to the server.
+
+    Returns:
+        str or None: the script filter JSON, or None if the server could not answer.
+    """
+    # the request carries the whole environment and the reply is trusted, so only talk to our own server
+    path = socket_path()
+    if path is None or not is_private(path, stat.S_ISSOCK):
+        return None
+
+    request = json.dumps({
+        "argv": sys.argv,
+        "env": dict(os.environ),
+        "cwd": os.getcwd(),
+    }).encode('utf-8')
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(REPLY_TIMEOUT)
+            sock.connect(path)
+            send_message(sock, request)
+            reply = recv_message(sock)
+    except OSError:
+        return None
+
+    if reply is None:
+        return None
+
+    reply = json.loads(reply)
+    return reply.get('output')
+
+
+def main():
+    output = query_server()
+    if output is not None:
+        sys.stdout.write(output)
+        return
+
+    # no server yet (or it just exited): start one for the next keystroke and answer this one ourselves
+    if socket_path() is not None:
+        try:
+            start_server()
+        except OSError:
+            pass
+
+    import git_filtering_internal
+    git_filtering_internal.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,25 @@
 # how to easily run from alfred 👆
 
 import sys
-import json
 import os
-import copy
-import subprocess
 import re
-import yaml
-import shlex
+import time
+import heapq
+import threading
+
+import command_cache
+import git_hunks
+import git_index
+import git_status
+import git_builtins
+import git_state_cache
+import repo_discovery
+import result_cache
+import yaml_loader
+import zsh_pool
+
+from title_trie import TitleTrie
+from script_filter_output import ScriptFilterOutput
 
 from definitions import (
     CommandType,
@@ -21,6 +33,7 @@ from definitions import (
     Location,
     TextViewAction,
     Command,
+    ValueCommand,
     TokenizationResult
 )
 
@@ -28,29 +41,76 @@ from definitions import (
 checkout_modifiers_list = []
 alfred_input = TokenizationResult()
 functions_path = None
-
-
-def tokenize(query, locations, commands, level=1):
+repo_list_cache = {}
+command_trie_cache = {}
+value_commands_cache = {}
+# outputs of the commands run for this query, see `run_command`
+command_outputs = {}
+command_outputs_lock = threading.Lock()
+command_stats = {"runs": 0, "saved": 0}
+EMPTY_TRIE = TitleTrie()
+needs_rerun = False
+
+# seconds until Alfred reruns the query when results are still being computed in the background
+RERUN_INTERVAL = 0.5
+
+# seconds to wait for `subtitle_command`s before showing a placeholder and rerunning
+DEFAULT_SUBTITLE_TIMEOUT = 1.0
+DEFAULT_SUBTITLE_DEADLINE = 1.5
+SUBTITLE_PLACEHOLDER = "loading…"
+# how long a subtitle finished in the background is shown instead of running the command again
+REFRESHED_SUBTITLE_TTL = 10
+# `cache: background` results younger than this are shown without refreshing them
+BACKGROUND_RESULT_TTL = 5
+
+# the values `cache:` takes, see `cached_command_output` and `run_command`
+CACHE_SETTINGS = git_state_cache.KINDS + ('background', 'none')
+
+# the most values listed for a command, 0 for no limit; commands opt in with `max_results:`, or every
+# command with `input_max_results`
+DEFAULT_MAX_RESULTS = 0
+
+
+def ends_at_word(text, length):
+    return length >= 0 and (length == len(text) or text[length] == ' ')
+
+def match_command(text, command_trie, expand=None, expanded=None):
+    """
+    Returns the command with the longest title that matches the start of `text` (the first one on ties), or None.
+
+    `expand` returns more commands and is only called when no title in `command_trie` matches up to the end of
+    a word; pass the same `expanded` list to reuse its trie for the rest of the query.
+    """
+    length, command = command_trie.match(text)
+    if expand and text and not ends_at_word(text, length):
+        if expanded is None:
+            expanded = []
+        if not expanded:
+            expanded.append(TitleTrie(expand(), base=command_trie))
+        command = expanded[0].longest_prefix(text)
+    return command
+
+def tokenize(query, locations, commands, level=1, expand=None):
+    """
+    Parameters:
+        locations (List[Location] or TitleTrie): build the trie once when tokenizing repeatedly.
+        commands (List[Command] or TitleTrie): the commands that can match at any level.
+        expand (Callable): returns more commands (e.g. generated from values), only called when no title in
+            `commands` matches up to the end of a word.
+    """
     command_objects = []
-    location = None
-    sorted_locations = sorted(locations, key=lambda loc: len(loc.title), reverse=True)
-    sorted_commands = sorted(commands, key=lambda cmd: len(cmd.title), reverse=True)
+    expanded = []
+    location_trie = locations if isinstance(locations, TitleTrie) else TitleTrie(locations)
+    command_trie = commands if isinstance(commands, TitleTrie) else TitleTrie(commands)
 
     query = query.strip()
-    for loc in sorted_locations:
-        if query.startswith(loc.title):
-            location = loc
-            break
+    location = location_trie.longest_prefix(query)
 
     unfinished_query = query
     if location:
         unfinished_query = unfinished_query[len(location.title):].strip()
         for i in range(level):
-            #  finds the first command in sorted_commands whose title matches the start of unfinished_query.
-            #  If a match is found, command is set to that command;
-            #  otherwise, it defaults to None.
-            #  This is done using a generator expression within the next() function, where None acts as the default value if no matches are found.
-            command = next((cmd for cmd in sorted_commands if unfinished_query.startswith(cmd.title)), None)
+            command = match_command(unfinished_query, command_trie, expand, expanded)
             if command:
                 command_objects.append(command)
                 unfinished_query = unfinished_query[len(command.title):].strip()
@@ -63,17 +123,197 @@ def change_directory(location):
     if location:
         os.chdir(location.directory)
 
-def run_command(command):
+def source_paths():
+    return [functions_path] if functions_path else []
+
+def claim_command(command):
+    """
+    Returns `(future, is_first)` for the output of `command` in this query. The first caller has to run it and
+    resolve the future, with `future.set_result` or `release_command`; the others wait for it.
+    """
+    from concurrent.futures import Future
+
+    key = (os.getcwd(), command, tuple(source_paths()), zsh_pool.environment_key())
+    with command_outputs_lock:
+        future = command_outputs.get(key)
+        if future is not None:
+            command_stats["saved"] += 1
+            return future, False
+        future = command_outputs[key] = Future()
+        return future, True
+
+def release_command(command, future, error):
+    # let later callers (e.g. without a timeout) run it again
+    key = (os.getcwd(), command, tuple(source_paths()), zsh_pool.environment_key())
+    with command_outputs_lock:
+        command_outputs.pop(key, None)
+    future.set_exception(error)
+
+def run_command(command, timeout=None, cache=None):
+    """
+    Runs `command` (or reuses its output) and returns its output, or an error message if it failed.
+
+    The same command in the same directory and environment only runs once per query; concurrent callers wait
+    for the first one. Side-effecting commands can opt out with `cache: none`.
+
+    Raises:
+        TimeoutError: the command didn't finish in `timeout` seconds.
+    """
+    if cache == 'none':
+        return execute_command(command, timeout=timeout)
+
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+
+    future, is_first = claim_command(command)
+    if not is_first:
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # not the builtin TimeoutError before python 3.11
+            raise TimeoutError()
+
     try:
+        output = execute_command(command, timeout=timeout, cache=cache)
+    except BaseException as e:
+        release_command(command, future, e)
+        raise
+    future.set_result(output)
+    return output
+
+def run_commands(jobs, timeout=None, deadline=None):
+    """
+    Runs `(command, cache)` jobs like `run_command`, but the ones that have to run are sent to zsh in batches
+    (see `zsh_pool.run_batch`) rather than one round trip each.
+
+    Parameters:
+        timeout (float): seconds each command may take once the previous one in its batch finished.
+        deadline (float): `time.monotonic()` by which all of them must be done.
+
+    Returns:
+        List[str or None]: the output of each job, or None if it didn't finish in time.
+    """
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+
+    outputs = [None] * len(jobs)
+    waiting = []
+    to_run = []
+
+    for i, (command, cache) in enumerate(jobs):
+        future = None
+        if cache != 'none':
+            future, is_first = claim_command(command)
+            if not is_first:
+                waiting.append((i, future))
+                continue
+
+        output, stored_as = cached_command_output(command, cache)
+        if output is None:
+            to_run.append((i, future, stored_as))
+            continue
+        outputs[i] = output
+        if future:
+            future.set_result(output)
 
-        if functions_path:
-            command = f"source '{functions_path}';\n{command}"
+    try:
+        command_stats["runs"] += len(to_run)
+        results = zsh_pool.run_batch([jobs[i][0] for i, _, _ in to_run], source_paths=source_paths(), timeout=timeout, deadline=deadline)
+    except BaseException as e:
+        for i, future, _ in to_run:
+            if future:
+                release_command(jobs[i][0], future, e)
+        raise
+
+    for (i, future, stored_as), result in zip(to_run, results):
+        command, cache = jobs[i]
+        if result is None:
+            if future:
+                release_command(command, future, TimeoutError())
+            continue
+        outputs[i] = command_output(command, cache, result, stored_as)
+        if future:
+            future.set_result(outputs[i])
+
+    for i, future in waiting:
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        try:
+            outputs[i] = future.result(timeout=remaining)
+        except (FutureTimeoutError, TimeoutError):
+            pass
+
+    return outputs
+
+def execute_command(command, timeout=None, cache=None):
+    output, stored_as = cached_command_output(command, cache)
+    if output is not None:
+        return output
+
+    # runs in a warm zsh that has already sourced `functions_path`, see zsh_pool.py
+    command_stats["runs"] += 1
+    result = zsh_pool.run(command, source_paths=source_paths(), timeout=timeout)
+    return command_output(command, cache, result, stored_as)
+
+def cached_command_output(command, cache):
+    """
+    Returns `(output, stored_as)`: the output of `command` if it doesn't have to run, and where `command_output`
+    should store it otherwise.
+
+    `cache` is the command's `cache:` setting: `refs`/`index` reuse the output until the repo changes (see
+    git_state_cache.py), `background` returns the last output right away and refreshes it in the background when
+    it's older than `BACKGROUND_RESULT_TTL`; Alfred reruns the query to show the refreshed output.
+    """
+    global needs_rerun
+
+    if cache == 'background':
+        key = result_cache.key_for(command, source_paths())
+        landed = result_cache.load(key)
+        if landed is None:
+            # only the very first run happens in the foreground
+            return None, key
+
+        output, age = landed
+        if age >= BACKGROUND_RESULT_TTL and not result_cache.is_refreshing(key):
+            result_cache.refresh_in_background(key, command, source_paths())
+        if result_cache.is_refreshing(key):
+            needs_rerun = True
+        return output.strip(), None
+
+    if cache:
+        return git_state_cache.load(os.getcwd(), cache, command)
+
+    return None, None
+
+def command_output(command, cache, result, stored_as):
+    """
+    Returns the output of the finished `result` of `command` (or an error message), storing it as `cached_command_output` asked.
+    """
+    if result.returncode != 0:
+        return f"Error executing {command}: {result.stderr}"
+
+    if cache == 'background':
+        result_cache.store(stored_as, result.stdout)
+    elif stored_as:
+        git_state_cache.store(os.getcwd(), cache, command, result.stdout.strip(), stored_as)
+    return result.stdout.strip()
+
+def dynamic_subtitle_command(command, param=None):
+    """
+    Returns the zsh command whose output is the subtitle of `command`, or None if its subtitle is static.
+    """
+    if command.subtitle_builtin:
+        # read in-process, so it's as cheap as a static subtitle
+        return None
 
-        result = subprocess.run(["zsh", "-c", command], capture_output=True, text=True, check=True)
-        # result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        return f"Error executing {command}: {e.stderr}"
+    if command.command_type == CommandType.NO_ACTION:
+        return process_action(action=command.action, param=param, title=command.title)
+
+    if command.subtitle_command:
+        # print(f"😎😎😎----------------------------------------------------------------------------")
+        # print(f"😎😎😎{command}")
+        # print(f"😎😎😎----------------------------------------------------------------------------")
+
+        return process_action(action=command.subtitle_command, param=param, title=command.title)
+
+    return None
 
 def subtitle_for_command(command, param=None):
     def process_action_text(value, is_preview=False):
@@ -85,19 +325,9 @@ def subtitle_for_command(command, param=None):
             return f"{prefix} `{lines[0]} ..."
         return f"{prefix} `{stripped_action}`"
 
-    if command.command_type == CommandType.NO_ACTION:
-        action = process_action(action=command.action, param=param, title=command.title)
-        return run_command(action)
+    if command.subtitle_builtin:
+        return git_builtins.run(process_action(action=command.subtitle_builtin, param=param, title=command.title))
 
-    if command.subtitle_command:
-        # print(f"😎😎😎----------------------------------------------------------------------------")
-        # print(f"😎😎😎{command}")
-        # print(f"😎😎😎----------------------------------------------------------------------------")
-
-        action = process_action(action=command.subtitle_command, param=param, title=command.title)
-        action = run_command(action)
-        return action
-    
     if command.subtitle:
         return command.subtitle.strip()
     
@@ -125,6 +355,85 @@ def subtitle_for_command(command, param=None):
         
     return ''
 
+def subtitle_timeouts():
+    """
+    Returns `(per item, overall)` seconds to wait for subtitle commands, or None to wait for all of them.
+
+    Subtitles that miss the deadline are finished in the background and picked up by an Alfred rerun,
+    which needs somewhere to store them; outside of Alfred every subtitle is waited for.
+    """
+    if not result_cache.cache_dir():
+        return None
+    try:
+        per_item = float(os.getenv('input_subtitle_timeout', DEFAULT_SUBTITLE_TIMEOUT))
+        overall = float(os.getenv('input_subtitle_deadline', DEFAULT_SUBTITLE_DEADLINE))
+    except ValueError:
+        per_item, overall = DEFAULT_SUBTITLE_TIMEOUT, DEFAULT_SUBTITLE_DEADLINE
+    return per_item, overall
+
+def resolve_subtitles(result_items):
+    """
+    Runs the pending subtitle commands of `result_items` in batches and fills in their subtitles.
+
+    Returns:
+        bool: True if some subtitles are still being computed in the background and a rerun will show them.
+    """
+    jobs = [item for item in result_items if item.pending_subtitle_command is not None]
+    if not jobs:
+        return False
+
+    per_item, deadline = None, None
+    timeouts = subtitle_timeouts()
+    if timeouts:
+        per_item, overall = timeouts
+        deadline = time.monotonic() + overall
+
+    outputs = [None] * len(jobs)
+    to_run = []
+
+    for i, item in enumerate(jobs):
+        command = item.pending_subtitle_command
+        if not command.strip():
+            outputs[i] = ''
+            continue
+
+        # a refresh from a previous run that missed the deadline
+        key = result_cache.key_for(command, source_paths())
+        landed = result_cache.load(key)
+        if landed and landed[1] < REFRESHED_SUBTITLE_TTL:
+            outputs[i] = landed[0].strip()
+        elif not result_cache.is_refreshing(key):
+            to_run.append(i)
+
+    results = run_commands([(jobs[i].pending_subtitle_command, jobs[i].subtitle_cache) for i in to_run], timeout=per_item, deadline=deadline)
+    for i, output in zip(to_run, results):
+        outputs[i] = output
+
+    def finish_late(item):
+        command = item.pending_subtitle_command
+        key = result_cache.key_for(command, source_paths())
+        landed = result_cache.load(key)
+        item.subtitle = landed[0].strip() if landed else SUBTITLE_PLACEHOLDER
+
+        if not result_cache.is_refreshing(key):
+            result_cache.refresh_in_background(key, command, source_paths())
+
+    is_incomplete = False
+
+    for item, output in zip(jobs, outputs):
+        if output is None:
+            finish_late(item)
+            is_incomplete = True
+        else:
+            item.subtitle = output
+        item.pending_subtitle_command = None
+
+    if is_incomplete:
+        global needs_rerun
+        needs_rerun = True
+
+    return is_incomplete
+
 
 def create_result_item_for_location(loc):
     return ResultItem(
@@ -157,6 +466,7 @@ def zsh_escape(param):
     # return param
 
     # ChatGPT says this handles all the cases above plus more
+    import shlex
     return shlex.quote(param) if param else param
 
 def process_action(action, param, title, secondaryAction=None):
@@ -202,7 +512,8 @@ def construct_full_command(action, location):
 def create_result_item_common(title, cmd, location, param=None):
     action = process_action(action=cmd.action, param=param, title=title, secondaryAction=cmd.secondaryAction)
     full_command = construct_full_command(action, location)
-    subtitle = subtitle_for_command(cmd, param)
+    pending_subtitle_command = dynamic_subtitle_command(cmd, param)
+    subtitle = '' if pending_subtitle_command is not None else subtitle_for_command(cmd, param)
     modifier_list = create_modifier_list(cmd, location, param)
 
     switcher = {
@@ -218,6 +529,7 @@ def create_result_item_common(title, cmd, location, param=None):
     tv_action = None
     if cmd.textview_action:
         # create a deep copy of cmd.textview_action to avoid altering the original object data structure.
+        import copy
         tv_action = copy.deepcopy(cmd.textview_action)
 
         if tv_action.command:
@@ -248,7 +560,9 @@ def create_result_item_common(title, cmd, location, param=None):
         icon_path=cmd.icon_path,
         quicklookurl=cmd.quicklookurl.replace("[title]", title.strip()) if cmd.quicklookurl else None,
         should_use_smart_sort=cmd.should_use_smart_sort,
-        textview_action=tv_action
+        textview_action=tv_action,
+        pending_subtitle_command=pending_subtitle_command,
+        subtitle_cache=cmd.cache
     )
 
 def create_result_item_for_command(cmd, location):
@@ -259,34 +573,141 @@ def create_result_item_for_command_with_selection(cmd, location, param):
     result_item = create_result_item_common(param, cmd, location, param)
     return result_item
 
+def selection_title(cmd, param):
+    """
+    Returns the title `create_result_item_for_command_with_selection` gives `param`, without creating the item.
+    """
+    param = param.strip()
+    valid = bool(param) and not cmd.subcommands
+    return f"{param}{'...' if not valid else ''}"
+
+def selection_subtitle(cmd, param):
+    return subtitle_for_command(cmd, param.strip())
+
 def create_result_item_for_command_with_param(cmd, location, param):
     return create_result_item_common(cmd.title, cmd, location, param)
 
 def create_result_items_for_command_with_subcommands(cmd, location):
-    result_items = []
+    commands = []
 
     for subcommand in cmd.subcommands:
 
         additional_commands = create_inline_commands(subcommand)
 
         if additional_commands:
-            for cmd in additional_commands:
-                result_item = create_result_item_common(cmd.title, cmd, location)
-                result_items.append(result_item)
+            commands.extend(additional_commands)
         else:
-            result_item = create_result_item_common(subcommand.title, subcommand, location)
-            result_items.append(result_item)
+            commands.append(subcommand)
+
+    return create_matching_result_items(commands, location)
+
+def matches_query(*texts):
+    query = alfred_input.unfinished_query.lower()
+    return any(query in text.lower() for text in texts)
+
+def match_score(query, title, subtitle):
+    """
+    Returns how well the lowercased `query` matches, higher is better, or None if it doesn't (like `matches_query`).
+
+    A title that starts with the query scores highest, then one with a word that does, then one that contains it,
+    then a match in the subtitle only.
+
+    Parameters:
+        subtitle (Callable): returns the subtitle, only called when the title doesn't match.
+    """
+    title = title.lower()
+    index = title.find(query)
+    if index == 0:
+        return 3
+    if index > 0:
+        return 2 if not title[index - 1].isalnum() else 1
+    if query in subtitle().lower():
+        return 0
+    return None
+
+def max_results(cmd=None):
+    """
+    Returns the most values to list for `cmd` (its `max_results:`, or `input_max_results`), or None for no limit.
+    """
+    limit = cmd.max_results if cmd is not None else None
+    if limit is None:
+        try:
+            limit = int(os.getenv('input_max_results', DEFAULT_MAX_RESULTS))
+        except ValueError:
+            limit = DEFAULT_MAX_RESULTS
+    return limit if limit > 0 else None
+
+def best_matches(candidates, title, subtitle, limit):
+    """
+    Returns the candidates that match the unfinished query, keeping the `limit` best ones, in their original order.
+
+    Only `limit` candidates are held at a time, so result items only need to be created for the ones that are listed.
+
+    Parameters:
+        title (Callable): returns the title a candidate is matched on.
+        subtitle (Callable): returns its subtitle, only called when the title doesn't match.
+        limit (int): None keeps every match.
+    """
+    query = alfred_input.unfinished_query.lower()
+    if not query:
+        # everything matches equally, the first ones win
+        return list(candidates)[:limit]
+
+    heap = []
+    for index, candidate in enumerate(candidates):
+        score = match_score(query, title(candidate), lambda: subtitle(candidate))
+        if score is None:
+            continue
+        # on equal scores, the earlier candidate wins
+        entry = (score, -index, candidate)
+        if limit is None or len(heap) < limit:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    return [candidate for _, _, candidate in sorted(heap, key=lambda entry: -entry[1])]
+
+def create_matching_result_items(commands, location):
+    """
+    Creates result items for the commands that match the unfinished query, with their subtitles resolved.
+
+    Commands are matched on their title and static subtitle before anything is run, so subtitle commands
+    only run for the matches (at most `input_max_results` of them when it's set, see `best_matches`). Commands with
+    `should_filter_by_subtitle_command` also match on the output of their subtitle command, which therefore
+    always runs.
+    """
+    def static_subtitle(entry):
+        cmd = entry[1]
+        return '' if dynamic_subtitle_command(cmd) is not None else subtitle_for_command(cmd)
+
+    matches = best_matches(enumerate(commands), lambda entry: entry[1].title, static_subtitle, max_results())
+    candidates = [(index, cmd, False) for index, cmd in matches]
+
+    for index, cmd in enumerate(commands):
+        if cmd.should_filter_by_subtitle_command and dynamic_subtitle_command(cmd) is not None and not matches_query(cmd.title):
+            # can only be matched once its subtitle has run
+            candidates.append((index, cmd, True))
+    candidates.sort(key=lambda candidate: candidate[0])
+
+    results = [(create_result_item_for_command(cmd=cmd, location=location), needs_match) for _, cmd, needs_match in candidates]
+    resolve_subtitles([item for item, _ in results])
+
+    return [item for item, needs_match in results if not needs_match or matches_query(item.title, item.subtitle)]
+
+def values_for_command(cmd):
+    if cmd.values_builtin:
+        action = process_action(action=cmd.values_builtin, param=None, title=cmd.title)
+        return git_builtins.run(action).splitlines()
+
+    if cmd.values_command:
+        action = process_action(action=cmd.values_command, param=None, title=cmd.title)
+        return run_command(action, cache=cmd.cache).splitlines()
 
-    return result_items
+    return cmd.values or []
 
 def create_value_commands(cmd):
     commands = []
-    items = []
-    if cmd.values_command:
-        action = process_action(action=cmd.values_command, param=None, title=cmd.title)
-        items = run_command(action).splitlines()
-    elif cmd.values:
-        items = cmd.values
+    items = values_for_command(cmd)
 
     for item in items:
         action = cmd.action
@@ -298,31 +719,34 @@ def create_value_commands(cmd):
         if cmd.textview_action:
             command_type = CommandType.SINGLE_ACTION
 
-        commands.append(Command(
+        # everything else is read from `cmd`, see `ValueCommand`
+        commands.append(ValueCommand(
+            template=cmd,
             title=f"{item.strip() if cmd.should_trim_values else item}",
             action=action,
-            secondaryAction=cmd.secondaryAction,
-            subtitle=cmd.subtitle,
-            command_type=command_type,
-            icon_path=cmd.icon_path,
-            mods=cmd.mods,
-            values=None,
-            values_command=None,
-            values_icon=cmd.values_icon,
-            subtitle_command=cmd.subtitle_command, # TODO: UPDATE - need this in some cases like current branch None, # cmd.subtitle_command, # TODO: is this always the case? We don't want this to run for all result items - it can be very slow
-            subcommands=cmd.subcommands,
-            should_use_values_as_inline_commands=False,
-            should_use_smart_sort=cmd.should_use_smart_sort,
-            should_trim_values = cmd.should_trim_values,
-            textview_action=cmd.textview_action
+            command_type=command_type
         ))
     return commands
 
+def memoized_value_commands(cmd):
+    # values are listed at most once per query, however many times the tree is walked
+    cached = value_commands_cache.get(id(cmd))
+    if cached is None or cached[0] is not cmd:
+        cached = (cmd, create_value_commands(cmd))
+        value_commands_cache[id(cmd)] = cached
+    return cached[1]
+
 def create_inline_commands(cmd):
     if cmd.should_use_values_as_inline_commands:
-        return create_value_commands(cmd)
+        return memoized_value_commands(cmd)
     return []
 
+def load_repo_list(yaml_string):
+    # the server answers many queries with the same repo list, only parse it once
+    if yaml_string not in repo_list_cache:
+        repo_list_cache[yaml_string] = yaml_loader.safe_load(yaml_string)
+    return repo_list_cache[yaml_string]
+
 def generate_locations_from_yaml(yaml_string):
     def location_entry_processor(entry, existing_locations):
         def process_path(path):
@@ -339,42 +763,39 @@ def generate_locations_from_yaml(yaml_string):
         should_show_default_commands = entry.get('show_default_commands', True)
 
         if entry.get('is_root', False):
-            # Iterate through subfolders to find git repositories for root entries
-            for subfolder_name in os.listdir(path):
+            # Add the git repositories in the root's subfolders, see repo_discovery.py
+            for subfolder_name in repo_discovery.find_repositories(path):
                 subfolder_path = os.path.join(path, subfolder_name)
-                # Check if the subfolder contains a .git directory
-                if os.path.isdir(subfolder_path) and os.path.isdir(os.path.join(subfolder_path, '.git')):
-                    # Avoid appending duplicates, check if directory is already listed
-                    if not any(loc.directory == subfolder_path for loc in existing_locations):
-                        adjusted_title = subfolder_name.replace(' ', '.').replace('-', '.')
-                        existing_locations.append(Location(
-                            title=adjusted_title,
-                            directory=subfolder_path,
-                            actions_path=actions_path,
-                            should_show_default_commands=should_show_default_commands
-                        ))
+                # Avoid appending duplicates, check if directory is already listed
+                if subfolder_path not in existing_locations:
+                    adjusted_title = subfolder_name.replace(' ', '.').replace('-', '.')
+                    existing_locations[subfolder_path] = Location(
+                        title=adjusted_title,
+                        directory=subfolder_path,
+                        actions_path=actions_path,
+                        should_show_default_commands=should_show_default_commands
+                    )
         else:
             # For non-root, remove any existing entry with the same directory
             title = entry['title']
-            existing_locations = [loc for loc in existing_locations if loc.directory != path]
+            existing_locations.pop(path, None)
             # Append the new/updated entry to the list
-            existing_locations.append(Location(
+            existing_locations[path] = Location(
                 title=title,
                 directory=path,
                 actions_path=actions_path,
                 should_show_default_commands=should_show_default_commands
-            ))
-
-        return existing_locations
+            )
 
     try:
-        yaml_data = yaml.safe_load(yaml_string)
-        locations = []
+        yaml_data = load_repo_list(yaml_string)
+        # keyed by directory, in the order they are listed
+        locations = {}
         for entry in yaml_data:
-            # Process each YAML entry, updating the locations list
-            locations = location_entry_processor(entry, locations)
-        return locations
-    except yaml.YAMLError as e:
+            # Process each YAML entry, updating the locations
+            location_entry_processor(entry, locations)
+        return list(locations.values())
+    except yaml_loader.YAMLError as e:
         return []
     except Exception as e:
         return []
@@ -388,9 +809,9 @@ def create_modifiers_from_string(modifier_string):
             raise ValueError("Mod key is missing or invalid")
 
     try:
-        yaml_data = yaml.safe_load(modifier_string)
+        yaml_data = yaml_loader.safe_load(modifier_string)
         return [modifier_entry_processor(entry) for entry in yaml_data]
-    except yaml.YAMLError as e:
+    except yaml_loader.YAMLError as e:
         # print(f"YAML error: {e}")
         return []
     except Exception as e:
@@ -406,16 +827,26 @@ def create_commands_from_yaml(yaml_data):
         mods = Modifier.from_dict_list(entry.get('mods', []))
         values = entry.get('values', None)
         values_command = entry.get('values_command', None)
+        values_builtin = entry.get('values_builtin', None)
         action = entry.get('command', '')
         subcommands = process_subcommands(entry.get('subcommands', []))
         values_icon = entry.get('values_icon', None)
         subtitle = entry.get('subtitle', None)
         subtitle_command = entry.get('subtitle_command', None)
+        subtitle_builtin = entry.get('subtitle_builtin', None)
+        cache = entry.get('cache', None)
+        if cache is not None and cache not in CACHE_SETTINGS:
+            raise ValueError(f"cache must be one of {', '.join(CACHE_SETTINGS)}, not {cache!r}")
+        max_results = entry.get('max_results', None)
+        # `bool` is an `int`, but `max_results: yes` is a mistake
+        if max_results is not None and (type(max_results) is not int or max_results < 0):
+            raise ValueError(f"max_results must be a non-negative integer, not {max_results!r}")
         should_use_values_as_inline_commands = entry.get('should_use_values_as_inline_commands', False)
         icon = entry.get('icon', None)
         quicklookurl = entry.get('quicklookurl', None)
         should_use_smart_sort = entry.get('should_use_smart_sort', False)
         should_trim_values = entry.get('should_trim_values', True)
+        should_filter_by_subtitle_command = entry.get('should_filter_by_subtitle_command', False)
         # Parse textview_action as a TextViewAction instance
         textview_action_data = entry.get('textview_action', None)
         textview_action = TextViewAction.from_dict(textview_action_data) if textview_action_data else None
@@ -425,7 +856,7 @@ def create_commands_from_yaml(yaml_data):
         # if subtitle_command:
         #     command_type = CommandType.NO_ACTION
         # el
-        if values or values_command:
+        if values or values_command or values_builtin:
             command_type = CommandType.NEEDS_SELECTION
 
             # only use the list if they will go to another level
@@ -471,7 +902,12 @@ def create_commands_from_yaml(yaml_data):
             quicklookurl=quicklookurl,
             should_use_smart_sort=should_use_smart_sort,
             should_trim_values=should_trim_values,
-            textview_action=textview_action  # Now a TextViewAction instance or None
+            textview_action=textview_action,  # Now a TextViewAction instance or None
+            should_filter_by_subtitle_command=should_filter_by_subtitle_command,
+            values_builtin=values_builtin,
+            subtitle_builtin=subtitle_builtin,
+            cache=cache,
+            max_results=max_results
         )
 
     return [command_entry_processor(entry) for entry in yaml_data]
@@ -479,12 +915,12 @@ def create_commands_from_yaml(yaml_data):
 def create_commands_from_config(config_path):
     try:
         with open(config_path, 'r') as file:
-            yaml_data = yaml.safe_load(file)
+            yaml_data = yaml_loader.safe_load(file)
         return create_commands_from_yaml(yaml_data)
     except FileNotFoundError as e:
         # print(f"File not found: {e}")
         pass
-    except yaml.YAMLError as e:
+    except yaml_loader.YAMLError as e:
         # print(f"YAML error: {e}")
         pass
     except Exception as e:
@@ -495,47 +931,106 @@ def create_commands_from_config(config_path):
 
 def create_commands_from_string(yaml_string):
     try:
-        yaml_data = yaml.safe_load(yaml_string)
+        yaml_data = yaml_loader.safe_load(yaml_string)
         return create_commands_from_yaml(yaml_data)
-    except yaml.YAMLError as e:
+    except yaml_loader.YAMLError as e:
         # print(f"YAML error: {e}")
         return []
     except Exception as e:
         # print(f"An error occurred: {e}")
         return []
 
+def build_commands(sources):
+    commands = []
+    for kind, value in sources:
+        if kind == 'path':
+            commands.extend(create_commands_from_config(value))
+        else:
+            commands.extend(create_commands_from_string(value))
+    return commands
+
+def create_commands_from_sources(sources):
+    return command_cache.load_commands(sources, build_commands)
+
+def trie_for_loaded_commands(commands):
+    # loaded commands are shared with later queries and never mutated, so their trie is reused too
+    cached = command_trie_cache.get(id(commands))
+    if cached is None or cached[0] is not commands:
+        command_trie_cache.clear()
+        cached = (commands, TitleTrie(commands))
+        command_trie_cache[id(commands)] = cached
+    return cached[1]
+
+def child_level(subcommands):
+    """
+    Returns the trie of `subcommands` and the ones whose values are inline commands.
+
+    Value commands share their template's `subcommands` list, so this is cached per list (with the loaded tree).
+    """
+    cached = command_trie_cache.get(id(subcommands))
+    if cached is None or cached[0] is not subcommands:
+        generators = [subcmd for subcmd in subcommands if subcmd.should_use_values_as_inline_commands]
+        cached = (subcommands, (TitleTrie(subcommands), generators))
+        command_trie_cache[id(subcommands)] = cached
+    return cached[1]
+
 def add_modifiers(modifier_string, target_list):
     modifiers = create_modifiers_from_string(modifier_string)
     target_list.extend(modifiers)
 
-def process_commands_recursively(query_input, locations, commands, level=1):
+def next_level(cmd):
+    """
+    Returns `(command trie, generators)` to match the level below `cmd`, or None if nothing can be selected below it.
+    """
+    if cmd.subcommands and cmd.should_use_values_as_inline_commands == False and not cmd.has_values():
+        return child_level(cmd.subcommands)
+
+    if cmd.subcommands and (cmd.values or cmd.values_command or cmd.values_builtin):
+        # one of the values, which then lead to the subcommands
+        return EMPTY_TRIE, [cmd]
+
+    return None
+
+def resolve_commands(query_input, locations, commands, generators=()):
+    """
+    Walks the query once, matching each level only against the children of the command matched before it.
+
+    Parameters:
+        locations (TitleTrie): all locations.
+        commands (TitleTrie): the top level commands.
+        generators (List[Command]): commands whose values are commands at the top level; values are only listed
+            when the titles at that level can't match the query.
+
+    Returns:
+        TokenizationResult: the location, the matched commands and the rest of the query (also set as `alfred_input`).
+    """
     global alfred_input
-    # print(f"😎😎😎----------------------------------------------------------------------------")
-    # print(f"😎😎😎{commands}")
-    # print(f"😎😎😎before {alfred_input}")
 
-    num_cmds_before = len(alfred_input.commands)
-    alfred_input = tokenize(query_input, locations, commands, level=level)
-    num_cmds = len(alfred_input.commands)
+    query = query_input.strip()
+    location = locations.longest_prefix(query)
+    alfred_input = TokenizationResult(location, [], unfinished_query=query)
+    if not location:
+        return alfred_input
+
+    alfred_input.unfinished_query = query[len(location.title):].strip()
+    level = (commands, generators)
 
-#     print(f"😎😎😎")
-#     print(f"😎😎😎after {alfred_input}")
-#     print(f"😎😎😎----------------------------------------------------------------------------")
+    while level is not None:
+        command_trie, level_generators = level
 
-    if num_cmds > num_cmds_before:
-        new_commands = list(alfred_input.commands)
-        main_command = alfred_input.commands[num_cmds-1]
+        # `alfred_input` already ends with the parent, which values commands can reference as `[parent]`
+        def expand():
+            return [value_cmd for generator in level_generators for value_cmd in memoized_value_commands(generator)]
 
-        if main_command.subcommands and main_command.should_use_values_as_inline_commands == False and main_command.values is None and main_command.values_command is None:
+        command = match_command(alfred_input.unfinished_query, command_trie, expand)
+        if not command:
+            break
 
-            for subcmd in main_command.subcommands:
-                new_commands.extend(create_inline_commands(subcmd))
-                new_commands.append(subcmd)
-            process_commands_recursively(query_input=query_input, locations=locations, commands=new_commands, level=level+1)
+        alfred_input.commands.append(command)
+        alfred_input.unfinished_query = alfred_input.unfinished_query[len(command.title):].strip()
+        level = next_level(command)
 
-        elif main_command.subcommands and (main_command.values or main_command.values_command):
-            new_commands.extend(create_value_commands(main_command))
-            process_commands_recursively(query_input=query_input, locations=locations, commands=new_commands, level=level+1)
+    return alfred_input
 
 
 def main():
@@ -553,6 +1048,7 @@ def main():
     # add_modifiers(input_checkout_command_modifiers, checkout_modifiers_list)
 
     locations = generate_locations_from_yaml(input_repo_list_yaml)
+    location_trie = TitleTrie(locations)
 
 
 
@@ -560,13 +1056,24 @@ def main():
     query_input = sys.argv[1] if len(sys.argv) > 1 else ""
     ends_with_space = query_input.endswith(" ")
 
-    global alfred_input, functions_path
+    global alfred_input, functions_path, needs_rerun
+    needs_rerun = False
+    value_commands_cache.clear()
+    command_outputs.clear()
+    command_stats.update(runs=0, saved=0)
+    git_state_cache.reset_stats()
+    git_status.reset()
+    git_index.reset()
+    git_hunks.reset()
+
+    # where functions.sh finds git_hunks.py; the zsh workers inherit it
+    os.environ.setdefault('GIT_PLUS_DIR', os.path.dirname(os.path.abspath(__file__)))
 
     functions_path = os.getenv('input_var_functions_path')
     if functions_path and os.path.sep not in functions_path:
         functions_path = os.path.join(os.getcwd(), functions_path)
 
-    alfred_input = tokenize(query_input, locations, [])
+    alfred_input = tokenize(query_input, location_trie, [])
 
     commands = [
         # Command("push", input_push_command, secondaryAction="git branch --show-current", command_type=CommandType.SINGLE_ACTION, icon_path='up.big.png'),
@@ -576,120 +1083,143 @@ def main():
         # Command("status", input_status_command, command_type=CommandType.NO_ACTION),
     ]
 
-    output = {"items": []}
-
-    # TODO: this doesn't work anymore
-    if len(locations) < 1:
-        yaml_text = """
+    # items are written as soon as they are ready, see script_filter_output.py
+    output = ScriptFilterOutput(sys.stdout)
+    try:
+        # TODO: this doesn't work anymore
+        if len(locations) < 1:
+            yaml_text = """
 - title: Repo 1
   path: \\$env_var
   
 - title: Repo 2
   path: /path/to/repo
 """
-        output['items'] += [ResultItem(f"Invalid repo yaml", arg=f"cd ~; pbcopy <<EOF{yaml_text}", subtitle=f"Press enter to copy a template", valid=True).to_dict()]
+            output.add(ResultItem(f"Invalid repo yaml", arg=f"cd ~; pbcopy <<EOF{yaml_text}", subtitle=f"Press enter to copy a template", valid=True))
 
-    elif not alfred_input.location:
-        filtered_locations = [loc for loc in locations if alfred_input.unfinished_query in loc.title.lower()]
-        output['items'] += [create_result_item_for_location(loc).to_dict() for loc in filtered_locations]
+        elif not alfred_input.location:
+            filtered_locations = [loc for loc in locations if alfred_input.unfinished_query in loc.title.lower()]
+            output.extend(create_result_item_for_location(loc) for loc in filtered_locations)
 
-        # output['items'] += [
-        #     ResultItem(f"> debug info", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}",
-        #                autocomplete=' ').to_dict()]
+            # output['items'] += [
+            #     ResultItem(f"> debug info", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}",
+            #                autocomplete=' ').to_dict()]
     
-    else:
+        else:
 
-        if alfred_input.location.should_show_default_commands:
-            commands.extend(create_commands_from_config(input_actions_path))
+            sources = []
+            if alfred_input.location.should_show_default_commands:
+                sources.append(('path', input_actions_path))
 
-            if input_additional_actions_path:
-                commands.extend(create_commands_from_config(input_additional_actions_path))
+                if input_additional_actions_path:
+                    sources.append(('path', input_additional_actions_path))
 
-            if input_additional_actions:
-                commands.extend(create_commands_from_string(input_additional_actions))
+                if input_additional_actions:
+                    sources.append(('string', input_additional_actions))
 
-        # load location actions before changing directories
-        if alfred_input.location.actions_path:
-            commands.extend(create_commands_from_config(alfred_input.location.actions_path))
+            if alfred_input.location.actions_path:
+                sources.append(('path', alfred_input.location.actions_path))
 
-        change_directory(alfred_input.location)
+            # load location actions before changing directories
+            loaded_commands = create_commands_from_sources(sources)
+            commands.extend(loaded_commands)
 
-        # initial row of inline values
-        for cmd in commands:
-            commands.extend(create_inline_commands(cmd))
+            change_directory(alfred_input.location)
 
-        process_commands_recursively(query_input=query_input, locations=locations, commands=commands)
-        num_cmds = len(alfred_input.commands)
+            # the initial row of inline values is only listed when the query needs it
+            generators = [cmd for cmd in commands if cmd.should_use_values_as_inline_commands]
 
-        if num_cmds == 0:
-            results = [create_result_item_for_command(cmd=cmd, location=alfred_input.location) for cmd in commands]
-            filtered_results = [r.to_dict() for r in results if alfred_input.unfinished_query.lower() in r.subtitle.lower() or alfred_input.unfinished_query.lower() in r.title.lower()]
-            output['items'].extend(filtered_results)
+            # the trie of the loaded commands is cached across queries
+            command_trie = trie_for_loaded_commands(loaded_commands) if len(commands) == len(loaded_commands) else TitleTrie(commands)
+            resolve_commands(query_input=query_input, locations=location_trie, commands=command_trie, generators=generators)
+            num_cmds = len(alfred_input.commands)
 
-            # output['items'] += [ResultItem(f"> debug info", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}", autocomplete=' ').to_dict()]
+            def resolved(results):
+                resolve_subtitles(results)
+                return results
 
-        elif num_cmds > 0:
+            if num_cmds == 0:
+                for cmd in generators:
+                    commands.extend(create_inline_commands(cmd))
+                results = create_matching_result_items(commands, alfred_input.location)
+                output.extend(results)
 
-            main_command = alfred_input.commands[num_cmds-1]
+                # output['items'] += [ResultItem(f"> debug info", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}", autocomplete=' ').to_dict()]
 
-#             output['items'] += [ResultItem(f"> debug info {main_command.command_type}", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}", autocomplete=' ').to_dict()]
+            elif num_cmds > 0:
 
+                main_command = alfred_input.commands[num_cmds-1]
 
-            if main_command.subcommands and main_command.values is None and main_command.values_command is None:
+    #             output['items'] += [ResultItem(f"> debug info {main_command.command_type}", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}", autocomplete=' ').to_dict()]
 
-                results = [item for item in create_result_items_for_command_with_subcommands(main_command, alfred_input.location)]
 
-#                 output['items'] += [ResultItem(f"> debug info SUBCOMMANDS", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}", autocomplete=' ').to_dict()]
+                if main_command.subcommands and not main_command.has_values():
 
-                output['items'].extend(
-                    result.to_dict()
-                    for result in results
-                    if alfred_input.unfinished_query.lower() in result.subtitle.lower() or alfred_input.unfinished_query.lower() in result.title.lower()
-                )
+                    results = create_result_items_for_command_with_subcommands(main_command, alfred_input.location)
 
-            elif main_command.command_type == CommandType.INLINE:
-                items = main_command.action(alfred_input.location)
-                filtered_items = [item for item in items if alfred_input.unfinished_query in item.title.lower()]
-                output['items'] += [item.to_dict() for item in filtered_items]
+    #                 output['items'] += [ResultItem(f"> debug info SUBCOMMANDS", arg=' ', subtitle=f"{alfred_input}; ends in space: {ends_with_space}", autocomplete=' ').to_dict()]
+
+                    output.extend(results)
+
+                elif main_command.command_type == CommandType.INLINE:
+                    items = main_command.action(alfred_input.location)
+                    filtered_items = [item for item in items if alfred_input.unfinished_query in item.title.lower()]
+                    output.extend(filtered_items)
             
-            elif main_command.command_type == CommandType.NO_ACTION:
-                output['items'] += [create_result_item_for_command(cmd=main_command, location=alfred_input.location).to_dict()]
+                elif main_command.command_type == CommandType.NO_ACTION:
+                    output.extend(resolved([create_result_item_for_command(cmd=main_command, location=alfred_input.location)]))
             
-            elif main_command.command_type == CommandType.SINGLE_ACTION:
-                output['items'] += [create_result_item_for_command(cmd=main_command, location=alfred_input.location).to_dict()]
+                elif main_command.command_type == CommandType.SINGLE_ACTION:
+                    output.extend(resolved([create_result_item_for_command(cmd=main_command, location=alfred_input.location)]))
 
-            elif main_command.command_type == CommandType.NEEDS_PARAM:
-                output['items'] += [create_result_item_for_command_with_param(cmd=main_command, location=alfred_input.location, param=alfred_input.unfinished_query).to_dict()]
+                elif main_command.command_type == CommandType.NEEDS_PARAM:
+                    output.extend(resolved([create_result_item_for_command_with_param(cmd=main_command, location=alfred_input.location, param=alfred_input.unfinished_query)]))
             
-            elif main_command.command_type == CommandType.NEEDS_SELECTION:
-                if main_command.values:
-                    main_command.subtitle_command = None # TODO: is this always the case? We don't want this to run for all result items - it can be very slow
-                    # filtered_items = [item for item in main_command.values if
-                    #                   alfred_input.unfinished_query.lower() in item.lower()]
-                    for item in main_command.values:
-                        result_item = create_result_item_for_command_with_selection(
-                            cmd=main_command,
-                            location=alfred_input.location,
-                            param=item
-                        )
-                        if alfred_input.unfinished_query.lower() in result_item.title.lower() or alfred_input.unfinished_query.lower() in result_item.subtitle.lower():
-                            output['items'].append(result_item.to_dict())
-
-                elif main_command.values_command:
-                    main_command.subtitle_command = None # TODO: is this always the case? We don't want this to run for all result items - it can be very slow
-                    action = process_action(action=main_command.values_command, param=None, title=main_command.title)
-                    items = run_command(action).splitlines()
-                    # filtered_items = [item for item in items if alfred_input.unfinished_query.lower() in item.lower()]
-                    for item in items:
-                        result_item = create_result_item_for_command_with_selection(
-                            cmd=main_command,
-                            location=alfred_input.location,
-                            param=item
-                        )
-                        if alfred_input.unfinished_query.lower() in result_item.title.lower() or alfred_input.unfinished_query.lower() in result_item.subtitle.lower():
-                            output['items'].append(result_item.to_dict())
-
-    sys.stdout.write(json.dumps(output))
+                elif main_command.command_type == CommandType.NEEDS_SELECTION:
+                    # copy before clearing the subtitle, the loaded commands are shared with later queries
+                    import copy
+                    main_command = copy.copy(main_command)
+
+                    if main_command.values:
+                        main_command.subtitle_command = None # TODO: is this always the case? We don't want this to run for all result items - it can be very slow
+                        main_command.subtitle_builtin = None
+                        # only the values that are listed become result items
+                        for item in best_matches(main_command.values, lambda item: selection_title(main_command, item), lambda item: selection_subtitle(main_command, item), max_results(main_command)):
+                            output.add(create_result_item_for_command_with_selection(
+                                cmd=main_command,
+                                location=alfred_input.location,
+                                param=item
+                            ))
+
+                    elif main_command.values_command or main_command.values_builtin:
+                        main_command.subtitle_command = None # TODO: is this always the case? We don't want this to run for all result items - it can be very slow
+                        main_command.subtitle_builtin = None
+                        items = values_for_command(main_command)
+                        for item in best_matches(items, lambda item: selection_title(main_command, item), lambda item: selection_subtitle(main_command, item), max_results(main_command)):
+                            output.add(create_result_item_for_command_with_selection(
+                                cmd=main_command,
+                                location=alfred_input.location,
+                                param=item
+                            ))
+
+    except Exception as e:
+        # the items written so far are kept and the JSON stays valid; the traceback goes to the debugger
+        import traceback
+        traceback.print_exc()
+        output.add(ResultItem("Something went wrong", arg='', subtitle=f"{type(e).__name__}: {e}", autocomplete=query_input or ' ', valid=False))
+
+    finally:
+        fields = {}
+        # some subtitles or lists are still running in the background, see `resolve_subtitles` and `cached_command_output`
+        if needs_rerun:
+            fields['rerun'] = RERUN_INTERVAL
+
+        if os.getenv('alfred_debug') == '1':
+            # shown in the workflow's debugger
+            print(f"git state cache: {git_state_cache.stats['hits']} hits, {git_state_cache.stats['misses']} misses", file=sys.stderr)
+            print(f"commands: {command_stats['runs']} run, {command_stats['saved']} reused from earlier in this query", file=sys.stderr)
+
+        output.close(**fields)
 
 if __name__ == "__main__":
     main()
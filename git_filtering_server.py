@@ -0,0 +1,131 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import traceback
+import contextlib
+
+from git_filtering_client import socket_path, send_message, recv_message, workflow_dir
+
+# seconds without a query before the server exits; override with `input_daemon_idle_timeout`
+DEFAULT_IDLE_TIMEOUT = 600
+
+
+def idle_timeout():
+    try:
+        return float(os.getenv('input_daemon_idle_timeout', DEFAULT_IDLE_TIMEOUT))
+    except ValueError:
+        return DEFAULT_IDLE_TIMEOUT
+
+
+def sources_fingerprint():
+    # the server keeps running old code after the workflow is updated (e.g. `sync.sh`), so it
+    # watches its own python files and exits when they change
+    folder = workflow_dir()
+    fingerprint = {}
+    for name in os.listdir(folder):
+        if name.endswith('.py'):
+            try:
+                fingerprint[name] = os.stat(os.path.join(folder, name)).st_mtime_ns
+            except OSError:
+                pass
+    return fingerprint
+
+
+def bind_socket(path):
+    """
+    Binds the server socket, or returns None if another server is already listening on it.
+    """
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(path)
+            return None
+        except OSError:
+            # left behind by a server that didn't shut down cleanly
+            os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # created owner-only, so there's no moment when other users can connect
+    umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    except OSError:
+        server.close()
+        return None
+    finally:
+        os.umask(umask)
+    server.listen(8)
+    return server
+
+
+def handle_request(request):
+    import git_filtering_internal
+
+    cwd = os.getcwd()
+    os.environ.clear()
+    os.environ.update(request['env'])
+    sys.argv = request['argv']
+
+    output = io.StringIO()
+    try:
+        os.chdir(request['cwd'])
+        with contextlib.redirect_stdout(output):
+            git_filtering_internal.main()
+    finally:
+        os.chdir(cwd)
+
+    return output.getvalue()
+
+
+def serve():
+    # taken first, so sources changed while the server starts up count as changed
+    fingerprint = sources_fingerprint()
+
+    path = socket_path()
+    server = bind_socket(path) if path else None
+    if server is None:
+        return
+    try:
+        while True:
+            server.settimeout(idle_timeout())
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+
+            with conn:
+                conn.settimeout(None)
+                message = recv_message(conn)
+                if message is None:
+                    continue
+
+                if sources_fingerprint() != fingerprint:
+                    # closing without a reply makes the client answer in-process and start a fresh server
+                    break
+
+                try:
+                    reply = {"output": handle_request(json.loads(message))}
+                except Exception as e:
+                    # the client falls back to running the query itself; stderr is the log, see `start_server`
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} query failed:", file=sys.stderr)
+                    traceback.print_exc()
+                    sys.stderr.flush()
+                    reply = {"error": repr(e)}
+
+                try:
+                    send_message(conn, json.dumps(reply).encode('utf-8'))
+                except OSError:
+                    pass
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,455 @@
+# python3 git_hunks.py <view|count|header|apply> <stage|unstage|discard> [file] [hunk header]
+# python3 git_hunks.py <list|batch> <stage|unstage|discard> [file] [selection]
+#
+# how functions.sh reads and applies hunks (`view_hunk`, `process_hunk`, `view_hunks`, `process_hunks`...) 👆
+# the script filter and tv_script.py use the module directly
+
+import os
+import re
+import sys
+import threading
+import subprocess
+
+# files are given as paths, not pathspecs; the prefixes are fixed whatever the config so patches apply with -p1
+DIFF_COMMAND = [
+    "git", "--literal-pathspecs", "diff", "--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/",
+]
+
+# the diff each action takes hunks from
+ACTIONS = {
+    'stage': DIFF_COMMAND,
+    'unstage': DIFF_COMMAND + ["--cached"],
+    'discard': DIFF_COMMAND,
+}
+INVALID_ACTION = "Invalid action. Use 'stage', 'unstage', or 'discard'."
+
+# what applies an action's hunks, the patch is given on stdin
+APPLY_COMMANDS = {
+    'stage': ["git", "apply", "--cached"],
+    'unstage': ["git", "apply", "--cached", "--reverse"],
+    'discard': ["git", "apply", "--reverse"],
+}
+
+# the lines that start a file in `git diff`, combined diffs are for conflicts
+FILE_STARTS = (b'diff --git ', b'diff --cc ', b'diff --combined ')
+HUNK_HEADER = re.compile(rb'@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+RULE = "----------------------------------"
+
+# the parsed diffs of this query by (folder, action, file), see `reset`
+_diffs = {}
+_lock = threading.Lock()
+
+
+class ApplyFailed(Exception):
+    """There's no such hunk, or `git apply` rejected it (e.g. the file changed since it was listed)."""
+
+
+def _start(from_start, from_count, offset, to_count):
+    # a side without lines starts at the line before the hunk
+    return from_start + (from_count == 0) + offset - (to_count == 0)
+
+
+class Hunk:
+    """
+    One `@@ -old_start,old_count +new_start,new_count @@` section of a file's diff.
+
+    `lines` are the lines after the header, as bytes without newlines. The ranges are None for the
+    `@@@ ... @@@` hunks of conflicted files.
+    """
+    __slots__ = ('header', 'lines', 'old_start', 'old_count', 'new_start', 'new_count')
+
+    def __init__(self, header):
+        self.header = header
+        self.lines = []
+        match = HUNK_HEADER.match(header)
+        if match:
+            old_start, old_count, new_start, new_count = match.groups()
+            self.old_start, self.new_start = int(old_start), int(new_start)
+            # a count is left out when it's 1
+            self.old_count = 1 if old_count is None else int(old_count)
+            self.new_count = 1 if new_count is None else int(new_count)
+        else:
+            self.old_start = self.old_count = self.new_start = self.new_count = None
+
+    @property
+    def title(self):
+        """The header as the `list hunks` values show it."""
+        return self.header.decode('utf-8', 'replace')
+
+    def text(self):
+        """The header and lines, as `select` searches them."""
+        return "\n".join(line.decode('utf-8', 'replace') for line in [self.header] + self.lines)
+
+    def patch_header(self, offset, reverse=False):
+        """
+        Returns the header with the start of the side the patch writes moved to `offset` lines from the side it's
+        applied to, since the hunks before it that aren't in the patch don't move the lines.
+        """
+        if self.old_start is None:
+            raise ApplyFailed("hunks of conflicted files can't be applied")
+        old_start, new_start = self.old_start, self.new_start
+        if reverse:
+            old_start = _start(new_start, self.new_count, offset, self.old_count)
+        else:
+            new_start = _start(old_start, self.old_count, offset, self.new_count)
+        context = self.header[self.header.index(b'@@', 2) + 2:]
+        return b'@@ -%d,%d +%d,%d @@' % (old_start, self.old_count, new_start, self.new_count) + context
+
+
+class FileDiff:
+    """
+    The diff of one file: its header (`diff --git ...` up to the first hunk, as bytes lines) and its hunks.
+
+    `name` is the path the way git prints it, like `git diff --name-only` (quoted when `core.quotePath` says so).
+    """
+    __slots__ = ('header', 'hunks', 'name')
+
+    def __init__(self, header_line):
+        self.header = [header_line]
+        self.hunks = []
+        self.name = None
+
+    def hunk(self, title=None):
+        """Returns the first hunk, or the one whose header is `title`, or None."""
+        if not title:
+            return self.hunks[0] if self.hunks else None
+        title = title.strip()
+        return next((hunk for hunk in self.hunks if hunk.title.strip() == title), None)
+
+    def patch(self, hunks, reverse=False):
+        """
+        Returns a patch (bytes) of only these hunks, for `git apply` (with `--reverse` when `reverse`).
+        """
+        lines = list(self.header)
+        offset = 0
+        for hunk in hunks:
+            lines.append(hunk.patch_header(offset, reverse))
+            lines.extend(hunk.lines)
+            offset += hunk.old_count - hunk.new_count if reverse else hunk.new_count - hunk.old_count
+        return b'\n'.join(lines) + b'\n'
+
+
+def _strip_prefix(name, prefix):
+    # `a/name`, or `"a/name"` when git quoted it
+    name = name.rstrip(b'\t')
+    if name.startswith(b'"'):
+        return b'"' + name[1 + len(prefix):]
+    return name[len(prefix):]
+
+
+def _file_name(header):
+    for line in header:
+        if line.startswith(b'+++ ') and line != b'+++ /dev/null':
+            return _strip_prefix(line[4:], b'b/')
+    for line in header:
+        if line.startswith(b'--- ') and line != b'--- /dev/null':
+            return _strip_prefix(line[4:], b'a/')
+    for line in header:
+        if line.startswith((b'rename to ', b'copy to ')):
+            return line.split(b' ', 2)[2]
+
+    # no content changes (modes, binary files): `diff --git a/name b/name`
+    first = header[0]
+    if not first.startswith(FILE_STARTS[0]):
+        return first.split(b' ', 2)[2]
+    names = first[len(FILE_STARTS[0]):]
+    if names.startswith(b'"'):
+        end = 1
+        while names[end:end + 1] not in (b'"', b''):
+            end += 2 if names[end:end + 1] == b'\\' else 1
+        return _strip_prefix(names[:end + 1], b'a/')
+    return names[2:2 + (len(names) - 5) // 2]
+
+
+def parse(output):
+    """
+    Parses the output of `git diff`.
+
+    Returns:
+        List[FileDiff]: in the order git printed them.
+    """
+    files = []
+    file = hunk = None
+    lines = output.split(b'\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    for line in lines:
+        if line.startswith(FILE_STARTS):
+            file = FileDiff(line)
+            files.append(file)
+            hunk = None
+        elif file is None:
+            # e.g. `* Unmerged path ...` from `git diff --cached`
+            continue
+        elif line.startswith(b'@@'):
+            hunk = Hunk(line)
+            file.hunks.append(hunk)
+        elif hunk is not None:
+            hunk.lines.append(line)
+        else:
+            file.header.append(line)
+
+    for file in files:
+        file.name = _file_name(file.header).decode('utf-8', 'replace')
+    return files
+
+
+def reset():
+    """Forgets the diffs; called at the start of each query, since files change between them."""
+    with _lock:
+        _diffs.clear()
+
+
+def diff(action, name=None):
+    """
+    Returns the parsed `git diff` of `action` in the current folder, of every file or only `name`, running git
+    once per query for each.
+    """
+    import git_index
+    key = (os.getcwd(), action, name)
+    with _lock:
+        files = _diffs.get(key)
+        if files is None:
+            command = ACTIONS[action] + (["--", os.fsdecode(git_index.unquote_path(name))] if name else [])
+            result = subprocess.run(command, capture_output=True)
+            files = _diffs[key] = parse(result.stdout if result.returncode == 0 else b'')
+    return files
+
+
+def file_diff(action, name=None, all_files=False):
+    """
+    Returns the FileDiff of `name` (as git prints it), or of the first changed file without one; None when the
+    file has no changes.
+
+    Parameters:
+        all_files (bool): diff every file at once, for callers that look at many of them in one query.
+    """
+    if name and not all_files and (os.getcwd(), action, None) not in _diffs:
+        files = diff(action, name)
+    else:
+        files = diff(action)
+    if not name:
+        return files[0] if files else None
+    return next((file for file in files if file.name == name), None)
+
+
+def hunks(count):
+    return f"{count} hunk" if count == 1 else f"{count} hunks"
+
+
+def hunk_count(action, name=None, all_files=False):
+    """Returns e.g. `3 hunks` for the file's diff."""
+    file = file_diff(action, name, all_files)
+    return hunks(len(file.hunks) if file else 0)
+
+
+def headers(action, name=None, all_files=False):
+    """Returns the titles of the file's hunks."""
+    file = file_diff(action, name, all_files)
+    return [hunk.title for hunk in file.hunks] if file else []
+
+
+def diff_header(action, name=None, title=None):
+    """
+    Returns the box above a hunk in `view`: the file with its number of hunks, and the hunk's header.
+    """
+    file = file_diff(action, name)
+    if not name:
+        name = file.name if file else ''
+    if not title:
+        hunk = file.hunk() if file else None
+        title = hunk.title if hunk else ''
+    count = hunks(len(file.hunks) if file else 0)
+    return "\n".join([RULE, f"file: {name} ({count})", f"hunk: {title}", RULE])
+
+
+def view(action, name=None, title=None):
+    """
+    Returns the text view of a hunk: `diff_header`, then the hunk's lines without its header.
+
+    Parameters:
+        name (str): the file as git prints it; the first changed file when empty.
+        title (str): the hunk's header; the file's first hunk when empty.
+    """
+    file = file_diff(action, name)
+    hunk = file.hunk(title) if file else None
+    lines = [diff_header(action, name, title), ""]
+    if hunk:
+        lines.extend(line.decode('utf-8', 'replace') for line in hunk.lines)
+    return "\n".join(lines)
+
+
+def apply(action, name=None, title=None):
+    """
+    Stages, unstages or discards a hunk by piping its patch to `git apply`, without writing it to a file.
+
+    Parameters:
+        name (str): the file as git prints it; the first changed file when empty.
+        title (str): the hunk's header; the file's first hunk when empty.
+
+    Returns:
+        tuple: `(hunks, files)` left in the file and in `action`'s diff, worked out from the diff the hunk came
+            from rather than by diffing again.
+
+    Raises:
+        ApplyFailed: there's no such hunk or git couldn't apply it; the message says why.
+    """
+    files = diff(action)
+    file = file_diff(action, name, all_files=True)
+    hunk = file.hunk(title) if file else None
+    if hunk is None:
+        raise ApplyFailed(f"no hunk {title or ''} in {name or 'the diff'}")
+
+    _apply(action, file.patch([hunk], reverse=action != 'stage'))
+    hunks_left = len(file.hunks) - 1
+    return hunks_left, len(files) - (not hunks_left)
+
+
+def _apply(action, patch):
+    result = subprocess.run(APPLY_COMMANDS[action], input=patch, capture_output=True)
+    # the diffs are out of date either way
+    reset()
+    if result.returncode != 0:
+        raise ApplyFailed(result.stderr.decode('utf-8', 'replace').strip())
+
+
+def select(hunks, selection):
+    """
+    Returns the indices of the hunks `selection` picks: `all`, numbers and ranges counted from 1 (`1,3-5 8`), or
+    `/regex/` searched in each hunk's `text` (so `/^\\+.*TODO/` picks the hunks adding a TODO).
+
+    Raises:
+        ValueError: the selection can't be read, or it has a number without a hunk.
+    """
+    selection = selection.strip()
+    if selection == 'all':
+        return list(range(len(hunks)))
+    if len(selection) > 1 and selection.startswith('/') and selection.endswith('/'):
+        try:
+            pattern = re.compile(selection[1:-1], re.MULTILINE)
+        except re.error as error:
+            raise ValueError(f"invalid regex: {error}")
+        return [i for i, hunk in enumerate(hunks) if pattern.search(hunk.text())]
+
+    picked = set()
+    for part in re.split(r'[\s,]+', selection):
+        if not part:
+            continue
+        first, dash, last = part.partition('-')
+        if not first.isdigit() or (dash and not last.isdigit()):
+            raise ValueError(f"not a number or a range: {part}")
+        first, last = int(first), int(last if dash else first)
+        if not 1 <= first <= last <= len(hunks):
+            raise ValueError(f"no hunk {part}")
+        picked.update(range(first - 1, last))
+    return sorted(picked)
+
+
+def _listed(action, name, all_files=False):
+    # the files `listing` and `apply_selected` number the hunks of
+    if name:
+        file = file_diff(action, name, all_files)
+        return [file] if file else []
+    return diff(action)
+
+
+def listing(action, name=None, selection=None):
+    """
+    Returns the text view of every hunk of a file (of every file without one), numbered for `selection`, with
+    the hunks it picks marked.
+    """
+    files = _listed(action, name)
+    hunks_listed = [hunk for file in files for hunk in file.hunks]
+    try:
+        picked = set(select(hunks_listed, selection)) if selection else set()
+        summary = f"selected: {', '.join(str(i + 1) for i in sorted(picked)) or 'none'} of {hunks(len(hunks_listed))}"
+    except ValueError as error:
+        picked = set()
+        summary = f"selected: none ({error})"
+
+    lines = [RULE, summary, "type hunk numbers (1,3-5), all or /regex/ and ↩ to select", RULE]
+    number = 0
+    for file in files:
+        lines += ["", f"file: {file.name} ({hunks(len(file.hunks))})"]
+        for hunk in file.hunks:
+            lines += ["", f"{'✓' if number in picked else ' '} [{number + 1}] {hunk.title}"]
+            lines.extend(line.decode('utf-8', 'replace') for line in hunk.lines)
+            number += 1
+    return "\n".join(lines)
+
+
+def apply_selected(action, name=None, selection=None):
+    """
+    Stages, unstages or discards the hunks `selection` picks from `listing` with one combined patch and a single
+    `git apply`.
+
+    Returns:
+        tuple: `(hunks, files)` left in the listing and in `action`'s diff, like `apply`.
+
+    Raises:
+        ApplyFailed: nothing is selected, the selection can't be read or git couldn't apply the patch.
+    """
+    files = diff(action)
+    listed = _listed(action, name, all_files=True)
+    numbered = [(file, hunk) for file in listed for hunk in file.hunks]
+    try:
+        picked = select([hunk for _, hunk in numbered], selection or '')
+    except ValueError as error:
+        raise ApplyFailed(str(error))
+    if not picked:
+        raise ApplyFailed("no hunks selected")
+
+    # each file's header once, with its hunks in order
+    by_file = {}
+    for i in picked:
+        file, hunk = numbered[i]
+        by_file.setdefault(file, []).append(hunk)
+    reverse = action != 'stage'
+    _apply(action, b''.join(file.patch(file_hunks, reverse) for file, file_hunks in by_file.items()))
+
+    emptied = sum(len(file_hunks) == len(file.hunks) for file, file_hunks in by_file.items())
+    return len(numbered) - len(picked), len(files) - emptied
+
+
+def reload_level(hunks_left, files_left, one_file):
+    """
+    Returns how many levels the menu goes back after `apply` (`[reload~N]`), as functions.sh's `process_hunk`
+    returns it: 3 (to `status`) once nothing is left, 2 (to the file list) once the file has no hunks left and 0
+    (the same list) otherwise. Going through every file's hunks (`one_file` False) is one level shallower.
+    """
+    if hunks_left:
+        return 0
+    if one_file:
+        return 2 if files_left else 3
+    return 0 if files_left else 2
+
+
+COMMANDS = {
+    'view': view, 'count': hunk_count, 'header': diff_header, 'apply': apply,
+    'list': listing, 'batch': apply_selected,
+}
+
+
+def main(argv):
+    if len(argv) < 3 or argv[1] not in COMMANDS:
+        sys.exit(f"usage: python3 git_hunks.py <{'|'.join(COMMANDS)}> <action> [file] [hunk header or selection]")
+    command, action, *args = argv[1:]
+    if action not in ACTIONS:
+        sys.exit(INVALID_ACTION)
+    # functions.sh passes empty strings for the arguments it wasn't given
+    args = [arg or None for arg in args[:2]]
+
+    if command in ('apply', 'batch'):
+        # the exit status is the reload level
+        try:
+            hunks_left, files_left = COMMANDS[command](action, *args)
+        except ApplyFailed as error:
+            sys.exit(str(error))
+        # a batch is of one file's hunks when it's given one, a single hunk also when it's given its header
+        sys.exit(reload_level(hunks_left, files_left, one_file=any(args[:1] if command == 'batch' else args)))
+    print(COMMANDS[command](action, *args))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,675 @@
+import os
+import re
+import stat
+import zlib
+import struct
+import hashlib
+import subprocess
+
+import git_refs
+import git_status
+import git_objects
+
+# the git commands whose output each file list matches
+GIT_COMMANDS = {
+    'staged': ["git", "diff", "--cached", "--name-only"],
+    'modified': ["git", "diff", "--name-only"],
+    'untracked': ["git", "ls-files", "--others", "--exclude-standard"],
+}
+
+# everything that can go wrong reading the repository's files ourselves; git is asked instead
+ERRORS = (git_refs.UnsupportedRepository, OSError, ValueError, IndexError, struct.error, zlib.error)
+
+# index entry: ctime, ctime ns, mtime, mtime ns, dev, ino, mode, uid, gid, size, sha, flags
+ENTRY = struct.Struct('>10I20sH')
+# untracked cache stat data: the same without mode, sha and flags
+STAT_DATA = struct.Struct('>9I')
+
+# entry flags
+ASSUME_VALID = 0x8000
+EXTENDED = 0x4000
+STAGE_MASK = 0x3000
+# extended entry flags (index v3 and later)
+SKIP_WORKTREE = 0x4000
+INTENT_TO_ADD = 0x2000
+
+TREE_MODE = 0o040000
+SYMLINK_MODE = 0o120000
+GITLINK_MODE = 0o160000
+
+NULL_SHA = b'\0' * 20
+
+# attributes that make git convert files between the worktree and the index (line endings, filters)
+CONVERSION_ATTRIBUTES = re.compile(rb'\b(text|eol|crlf|filter|ident|working-tree-encoding)\b')
+
+# how many config files deep `include.path` is followed, as git does
+MAX_INCLUDE_DEPTH = 10
+
+# characters git escapes in paths, see `quote_path`
+C_ESCAPES = {7: 'a', 8: 'b', 9: 't', 10: 'n', 11: 'v', 12: 'f', 13: 'r', 0x22: '"', 0x5c: '\\'}
+MUST_QUOTE = re.compile(rb'[\x00-\x1f"\\\x7f]')
+MUST_QUOTE_NON_ASCII = re.compile(rb'[\x00-\x1f"\\\x7f-\xff]')
+# and the escapes `unquote_path` reads back
+UNESCAPES = {ord(letter): byte for byte, letter in C_ESCAPES.items()}
+QUOTED_ESCAPE = re.compile(rb'\\([0-7]{3}|[abtnvfr"\\])')
+
+
+class NeedsGit(git_refs.UnsupportedRepository):
+    """The worktree can't be compared without git, e.g. it has conflicts or files converted by attributes."""
+
+
+def quote_path(path, quote_non_ascii=True):
+    """
+    Formats a path (bytes) the way git prints it: quoted with C escapes when it has control characters, quotes,
+    backslashes or, unless `core.quotePath` is off, non-ASCII bytes.
+    """
+    pattern = MUST_QUOTE_NON_ASCII if quote_non_ascii else MUST_QUOTE
+    if not pattern.search(path):
+        return path.decode('utf-8', 'replace')
+
+    def escape(match):
+        byte = match.group()[0]
+        return ('\\' + C_ESCAPES[byte] if byte in C_ESCAPES else '\\%03o' % byte).encode('ascii')
+
+    return '"' + pattern.sub(escape, path).decode('utf-8', 'replace') + '"'
+
+
+def unquote_path(name):
+    """
+    Returns the path (bytes) of a name git printed, e.g. one of `files`; the reverse of `quote_path`.
+    """
+    if len(name) < 2 or not name.startswith('"') or not name.endswith('"'):
+        return os.fsencode(name)
+
+    def unescape(match):
+        escape = match.group(1)
+        return bytes([int(escape, 8) if len(escape) == 3 else UNESCAPES[escape[0]]])
+
+    return QUOTED_ESCAPE.sub(unescape, name[1:-1].encode('utf-8', 'surrogateescape'))
+
+
+def is_true(value):
+    return value is not None and value.lower() in ('true', 'yes', 'on', '1')
+
+
+def config_paths(common_dir):
+    """Returns the config files git reads in the repository, in order of precedence (lowest first)."""
+    home = os.path.expanduser('~')
+    xdg = os.getenv('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+    return ['/etc/gitconfig', os.path.join(xdg, 'git', 'config'), os.path.join(home, '.gitconfig'),
+            os.path.join(common_dir, 'config')]
+
+
+def read_config(paths):
+    """
+    Reads git config files, later files overriding earlier ones. `include.path` files are read where they're
+    included, like git does.
+
+    Returns:
+        dict: `section.key` or `section.subsection.key` (section and key lowercased) to the last value set;
+            keys without `=` are `true`.
+
+    Raises:
+        NeedsGit: a file has conditional includes (`includeIf`), which aren't evaluated.
+    """
+    config = {}
+    for path in paths:
+        _read_config_file(path, config, 0)
+    return config
+
+
+def _read_config_file(path, config, depth):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return
+
+    section = ''
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            header, _, line = line[1:].partition(']')
+            name, _, subsection = header.strip().partition(' ')
+            section = name.lower()
+            if subsection:
+                section += '.' + subsection.strip().strip('"')
+            if section.startswith('includeif.'):
+                raise NeedsGit("conditional config includes")
+            line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+
+        key, equals, value = line.partition('=')
+        value = value.strip() if equals else 'true'
+        if '"' in value:
+            value = value.strip('"')
+        else:
+            value = re.split('[#;]', value)[0].strip()
+        key = f"{section}.{key.strip().lower()}"
+        if key == 'include.path':
+            if depth >= MAX_INCLUDE_DEPTH:
+                raise NeedsGit("config includes nested too deeply")
+            # relative to the including file
+            _read_config_file(os.path.join(os.path.dirname(path), os.path.expanduser(value)), config, depth + 1)
+        else:
+            config[key] = value
+
+
+def blob_sha(path):
+    """
+    Returns the id git would give the content of `path` as a blob (the link's target for symlinks), or
+    `NULL_SHA` if there's no such file.
+    """
+    try:
+        if os.path.islink(path):
+            content = os.fsencode(os.readlink(path))
+        else:
+            with open(path, 'rb') as file:
+                content = file.read()
+    except (FileNotFoundError, NotADirectoryError):
+        return NULL_SHA
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).digest()
+
+
+def ignore_file_shas(path):
+    """
+    Returns the ids the untracked cache may have stored for an ignore file: git hashes the content with a
+    newline added (an empty file is the empty blob), except for a tracked, unchanged `.gitignore`, where it takes
+    the id from the index (the plain content's). A missing file is `NULL_SHA`.
+    """
+    try:
+        with open(path, 'rb') as file:
+            content = file.read()
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        return {NULL_SHA}
+    plain = hashlib.sha1(b'blob %d\0' % len(content) + content).digest()
+    if not content:
+        return {plain}
+    return {plain, hashlib.sha1(b'blob %d\0' % (len(content) + 1) + content + b'\n').digest()}
+
+
+def stat_matches(st, ctime, ctime_ns, mtime, mtime_ns, ino, uid, gid, size):
+    """
+    Compares `os.lstat` output with the stat data git stored (truncated to 32 bits), the way git does with
+    `core.checkStat` at its default. Nanoseconds only count when git stored them.
+    """
+    st_mtime, st_mtime_ns = divmod(st.st_mtime_ns, 1000000000)
+    st_ctime, st_ctime_ns = divmod(st.st_ctime_ns, 1000000000)
+    return (
+        st_mtime & 0xffffffff == mtime and (not mtime_ns or st_mtime_ns == mtime_ns)
+        and st_ctime & 0xffffffff == ctime and (not ctime_ns or st_ctime_ns == ctime_ns)
+        and st.st_ino & 0xffffffff == ino and st.st_uid == uid and st.st_gid == gid
+        and st.st_size & 0xffffffff == size
+    )
+
+
+class IndexEntry:
+    __slots__ = ('path', 'ctime', 'ctime_ns', 'mtime', 'mtime_ns', 'ino', 'mode', 'uid', 'gid', 'size', 'sha',
+                 'flags', 'extended_flags')
+
+    def __init__(self, path, fields, extended_flags):
+        self.path = path
+        (self.ctime, self.ctime_ns, self.mtime, self.mtime_ns, _, self.ino, self.mode, self.uid, self.gid,
+         self.size, self.sha, self.flags) = fields
+        self.extended_flags = extended_flags
+
+    def stat_matches(self, st):
+        return stat_matches(st, self.ctime, self.ctime_ns, self.mtime, self.mtime_ns, self.ino, self.uid,
+                            self.gid, self.size)
+
+
+def read_ewah(data, pos):
+    """
+    Reads an EWAH compressed bitmap, as used by the untracked cache.
+
+    Returns:
+        tuple: `(set of the positions of the bits that are set, position after the bitmap)`.
+    """
+    bit_count, word_count = struct.unpack_from('>II', data, pos)
+    words = struct.unpack_from(f'>{word_count}Q', data, pos + 8)
+    pos += 8 + 8 * word_count + 4
+
+    bits = set()
+    bit = i = 0
+    while i < word_count:
+        # a marker word: a run of `running_length` words of `running_bit`, then `literal_words` plain words
+        marker = words[i]
+        i += 1
+        running_length = (marker >> 1) & 0xffffffff
+        literal_words = marker >> 33
+        if marker & 1:
+            bits.update(range(bit, bit + 64 * running_length))
+        bit += 64 * running_length
+        for word in words[i:i + literal_words]:
+            bits.update(bit + offset for offset in range(64) if word >> offset & 1)
+            bit += 64
+        i += literal_words
+    return {bit for bit in bits if bit < bit_count}, pos
+
+
+class UntrackedDirectory:
+    __slots__ = ('path', 'untracked', 'valid', 'check_only', 'stat_data', 'exclude_sha')
+
+    def __init__(self, path, untracked):
+        self.path = path
+        self.untracked = untracked
+        self.valid = False
+        self.check_only = False
+        self.stat_data = None
+        self.exclude_sha = NULL_SHA
+
+
+class UntrackedCache:
+    """
+    The `UNTR` index extension: the untracked files `git status` found in each folder, with what it depends on.
+    """
+
+    def __init__(self, data):
+        ident_length, pos = git_objects.read_varint(data, 0)
+        # older versions stored several NUL separated idents, only the first one is used
+        self.ident = data[pos:pos + ident_length].split(b'\0')[0]
+        pos += ident_length + 2 * STAT_DATA.size
+        self.dir_flags, = struct.unpack_from('>I', data, pos)
+        pos += 4
+        self.info_exclude_sha = data[pos:pos + 20]
+        self.excludes_file_sha = data[pos + 20:pos + 40]
+        pos += 40
+        nul = data.index(b'\0', pos)
+        self.exclude_per_dir = data[pos:nul]
+
+        self.directories = []
+        count, pos = git_objects.read_varint(data, nul + 1)
+        if not count:
+            return
+        pos = self._read_directory(data, pos, b'')
+        if len(self.directories) != count:
+            raise ValueError("untracked cache has the wrong number of folders")
+
+        valid, pos = read_ewah(data, pos)
+        check_only, pos = read_ewah(data, pos)
+        has_sha, pos = read_ewah(data, pos)
+        for i in sorted(valid):
+            self.directories[i].valid = True
+            self.directories[i].stat_data = STAT_DATA.unpack_from(data, pos)
+            pos += STAT_DATA.size
+        for i in check_only:
+            self.directories[i].check_only = True
+        for i in sorted(has_sha):
+            self.directories[i].exclude_sha = data[pos:pos + 20]
+            pos += 20
+
+    def _read_directory(self, data, pos, parent):
+        # folders are stored depth first: counts, name, untracked names, then the subfolders
+        untracked_count, pos = git_objects.read_varint(data, pos)
+        subfolder_count, pos = git_objects.read_varint(data, pos)
+        nul = data.index(b'\0', pos)
+        path = parent + data[pos:nul] + b'/' if parent or nul > pos else b''
+        pos = nul + 1
+
+        untracked = []
+        for _ in range(untracked_count):
+            nul = data.index(b'\0', pos)
+            untracked.append(data[pos:nul])
+            pos = nul + 1
+        self.directories.append(UntrackedDirectory(path, untracked))
+
+        for _ in range(subfolder_count):
+            pos = self._read_directory(data, pos, path)
+        return pos
+
+
+class Index:
+    """
+    A parsed `.git/index` (versions 2 to 4): its entries, sorted by path, and the `TREE` and `UNTR` extensions.
+
+    Raises:
+        NeedsGit: the index uses something that isn't read here, e.g. a split or sparse index.
+    """
+
+    def __init__(self, data, mtime):
+        if data[:4] != b'DIRC':
+            raise NeedsGit("not an index file")
+        version, count = struct.unpack_from('>II', data, 4)
+        if version not in (2, 3, 4):
+            raise NeedsGit(f"index version {version}")
+
+        # entries changed in the same second the index was written may not show up in their stat data
+        self.mtime = mtime
+        self.entries = []
+        # folder (`b''` for the top, `b'dir/'` otherwise) to the tree its entries make, when the index knows it
+        self.cache_tree = {}
+        self._untracked_data = None
+        self._untracked_cache = None
+
+        pos = 12
+        path = b''
+        for _ in range(count):
+            start = pos
+            fields = ENTRY.unpack_from(data, pos)
+            pos += ENTRY.size
+            extended_flags = 0
+            if fields[-1] & EXTENDED:
+                extended_flags, = struct.unpack_from('>H', data, pos)
+                pos += 2
+
+            if version == 4:
+                # paths are stored as how much to drop from the end of the previous one, plus a suffix
+                strip, pos = git_objects.read_varint(data, pos)
+                nul = data.index(b'\0', pos)
+                path = path[:len(path) - strip] + data[pos:nul]
+                pos = nul + 1
+            else:
+                nul = data.index(b'\0', pos)
+                path = data[pos:nul]
+                # padded with 1 to 8 NULs to a multiple of 8 bytes
+                pos = start + ((nul - start) // 8 + 1) * 8
+            self.entries.append(IndexEntry(path, fields, extended_flags))
+
+        # extensions up to the trailing checksum
+        while pos < len(data) - 20:
+            signature = data[pos:pos + 4]
+            size, = struct.unpack_from('>I', data, pos + 4)
+            body = data[pos + 8:pos + 8 + size]
+            pos += 8 + size
+            if signature == b'TREE':
+                self._read_cache_tree(body, 0, b'')
+            elif signature == b'UNTR':
+                self._untracked_data = body
+            elif not b'A' <= signature[:1] <= b'Z':
+                # lowercase extensions change how the entries are read (`link`: split index, `sdir`: sparse)
+                raise NeedsGit(f"index extension {signature.decode('ascii', 'replace')}")
+
+    def _read_cache_tree(self, data, pos, parent):
+        nul = data.index(b'\0', pos)
+        path = parent + data[pos:nul] + b'/' if parent or nul > pos else b''
+        newline = data.index(b'\n', nul)
+        entry_count, subtree_count = data[nul + 1:newline].split(b' ')
+        pos = newline + 1
+        # invalidated folders have an entry count of -1 and no tree
+        if int(entry_count) >= 0:
+            self.cache_tree[path] = data[pos:pos + 20]
+            pos += 20
+        for _ in range(int(subtree_count)):
+            pos = self._read_cache_tree(data, pos, path)
+        return pos
+
+    def untracked_cache(self):
+        """Returns the parsed `UNTR` extension, or None if `core.untrackedCache` didn't write one."""
+        if self._untracked_cache is None and self._untracked_data is not None:
+            self._untracked_cache = UntrackedCache(self._untracked_data)
+        return self._untracked_cache
+
+
+class WorktreeStatus:
+    """
+    Lists staged, modified and untracked files from the index and the worktree's stat data, the way
+    `GIT_COMMANDS` would, reading HEAD's trees only where the index's cache tree doesn't already match them.
+    """
+
+    def __init__(self, worktree, refs):
+        self.worktree = worktree
+        self.refs = refs
+        self.objects = git_objects.for_repository(refs.common_dir)
+        self._index = None
+        self._index_key = None
+        self._staged = None
+        # `core.quotePath`, for this query; see `reset`
+        self._quote_non_ascii = None
+
+    def index(self):
+        """Returns the parsed index, read again only when the file changed."""
+        path = os.path.join(self.refs.git_dir, 'index')
+        key = git_refs.stat_key(path)
+        if self._index is None or key != self._index_key:
+            if key is None:
+                # a new repository has no index until something is added
+                self._index = Index(b'DIRC' + struct.pack('>II', 2, 0) + NULL_SHA, 0)
+            else:
+                with open(path, 'rb') as file:
+                    self._index = Index(file.read(), os.fstat(file.fileno()).st_mtime_ns // 1000000000)
+            self._index_key = key
+            self._staged = None
+        return self._index
+
+    def config(self):
+        config = read_config(config_paths(self.refs.common_dir))
+        if config.get('extensions.objectformat', 'sha1').lower() != 'sha1':
+            raise NeedsGit("only sha1 repositories are read")
+        if is_true(config.get('core.bare')) or 'core.worktree' in config:
+            raise NeedsGit("the worktree isn't next to the repository")
+        return config
+
+    def _entries(self):
+        entries = self.index().entries
+        for entry in entries:
+            if entry.flags & STAGE_MASK:
+                raise NeedsGit("unmerged entries")
+            if entry.extended_flags & INTENT_TO_ADD:
+                raise NeedsGit("intent to add entries")
+        return entries
+
+    def staged(self):
+        """Returns the paths that differ between HEAD and the index (`git diff --cached --name-only`)."""
+        entries = self._entries()
+        index = self.index()
+        head = self.refs.head_sha()
+        if self._staged is not None and self._staged[0] == head:
+            return self._staged[1]
+
+        # HEAD's files, except in folders whose tree the index says it already has
+        head_files = {}
+        same_folders = set()
+
+        def add_tree(sha, folder):
+            if index.cache_tree.get(folder) == sha:
+                same_folders.add(folder)
+                return
+            for mode, name, entry_sha in self.objects.tree(sha):
+                if mode == TREE_MODE:
+                    add_tree(entry_sha, folder + name + b'/')
+                else:
+                    head_files[folder + name] = (mode, entry_sha)
+
+        if head:
+            add_tree(self.objects.commit_tree(bytes.fromhex(head)), b'')
+
+        staged = []
+        for entry in entries:
+            if same_folders and self._in_folders(entry.path, same_folders):
+                continue
+            head_file = head_files.pop(entry.path, None)
+            if head_file is None or head_file[1] != entry.sha or normalized_mode(head_file[0]) != entry.mode:
+                staged.append(entry.path)
+        # what's left was deleted from the index
+        staged.extend(head_files)
+        staged.sort()
+
+        self._staged = (head, staged)
+        return staged
+
+    @staticmethod
+    def _in_folders(path, folders):
+        slash = path.find(b'/')
+        while slash >= 0:
+            if path[:slash + 1] in folders:
+                return True
+            slash = path.find(b'/', slash + 1)
+        return b'' in folders
+
+    def modified(self):
+        """Returns the paths whose worktree files differ from the index (`git diff --name-only`)."""
+        entries = self._entries()
+        config = self.config()
+        racy_after = self.index().mtime
+        check_executable = config.get('core.filemode') is None or is_true(config.get('core.filemode'))
+        if config.get('core.symlinks') is not None and not is_true(config.get('core.symlinks')):
+            raise NeedsGit("core.symlinks is off")
+        may_convert = None
+
+        modified = []
+        for entry in entries:
+            if entry.flags & ASSUME_VALID or entry.extended_flags & SKIP_WORKTREE:
+                continue
+            if entry.mode == GITLINK_MODE:
+                raise NeedsGit("submodules")
+
+            full_path = os.path.join(self.worktree, os.fsdecode(entry.path))
+            try:
+                st = os.lstat(full_path)
+            except (FileNotFoundError, NotADirectoryError):
+                modified.append(entry.path)
+                continue
+
+            is_symlink = entry.mode == SYMLINK_MODE
+            if stat.S_ISLNK(st.st_mode) != is_symlink or not (is_symlink or stat.S_ISREG(st.st_mode)):
+                modified.append(entry.path)
+                continue
+            if check_executable and not is_symlink and (st.st_mode ^ entry.mode) & 0o100:
+                modified.append(entry.path)
+                continue
+            if entry.stat_matches(st) and entry.mtime < racy_after:
+                continue
+
+            # the stat data changed (or can't be trusted), so it's down to the content
+            if not is_symlink:
+                if may_convert is None:
+                    may_convert = self._may_convert(config)
+                if may_convert:
+                    raise NeedsGit("files may be converted by attributes or core.autocrlf")
+                # the index stores the size of the file it hashed; 0 is also used for entries to check again
+                if entry.size and st.st_size & 0xffffffff != entry.size:
+                    modified.append(entry.path)
+                    continue
+            if blob_sha(full_path) != entry.sha:
+                modified.append(entry.path)
+        return modified
+
+    def _may_convert(self, config):
+        """Returns whether git might convert worktree files before comparing them (so hashing them isn't enough)."""
+        if config.get('core.autocrlf', 'false').lower() not in ('false', 'no', 'off', '0'):
+            return True
+
+        home = os.path.expanduser('~')
+        xdg = os.getenv('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+        attributes = [os.path.join(self.refs.common_dir, 'info', 'attributes'),
+                      os.path.expanduser(config.get('core.attributesfile', os.path.join(xdg, 'git', 'attributes')))]
+        attributes.extend(os.path.join(self.worktree, os.fsdecode(entry.path)) for entry in self.index().entries
+                          if entry.path == b'.gitattributes' or entry.path.endswith(b'/.gitattributes'))
+        for path in attributes:
+            try:
+                with open(path, 'rb') as file:
+                    if CONVERSION_ATTRIBUTES.search(file.read()):
+                        return True
+            except OSError:
+                pass
+        return False
+
+    def untracked(self, directory=None):
+        """
+        Returns the untracked, not ignored files under `directory` (the current one by default), relative to it
+        (`git ls-files --others --exclude-standard`), from the untracked cache `git status` keeps in the index.
+
+        Raises:
+            NeedsGit: there's no untracked cache or something it depends on changed since it was written.
+        """
+        prefix = os.path.relpath(directory or os.getcwd(), self.worktree)
+        cache = self.index().untracked_cache()
+        if cache is None:
+            raise NeedsGit("no untracked cache")
+        config = self.config()
+
+        ident = f"Location {os.path.realpath(self.worktree)}, system {os.uname().sysname}"
+        if cache.ident != os.fsencode(ident) or cache.exclude_per_dir != b'.gitignore':
+            raise NeedsGit("untracked cache written for another worktree")
+
+        home = os.path.expanduser('~')
+        xdg = os.getenv('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+        excludes_file = os.path.expanduser(config.get('core.excludesfile', os.path.join(xdg, 'git', 'ignore')))
+        if (cache.info_exclude_sha not in ignore_file_shas(os.path.join(self.refs.common_dir, 'info', 'exclude'))
+                or cache.excludes_file_sha not in ignore_file_shas(excludes_file)):
+            raise NeedsGit("ignore rules changed")
+
+        racy_after = self.index().mtime
+        files = []
+        for directory in cache.directories:
+            if not directory.valid or directory.check_only:
+                raise NeedsGit("untracked cache is out of date")
+            folder = os.path.join(self.worktree, os.fsdecode(directory.path))
+            ctime, ctime_ns, mtime, mtime_ns, _, ino, uid, gid, size = directory.stat_data
+            # adding or removing a file changes its folder's stat data
+            if not stat_matches(os.lstat(folder), ctime, ctime_ns, mtime, mtime_ns, ino, uid, gid, size) \
+                    or mtime >= racy_after:
+                raise NeedsGit("untracked cache is out of date")
+            if directory.exclude_sha not in ignore_file_shas(os.path.join(folder, '.gitignore')):
+                raise NeedsGit("ignore rules changed")
+
+            for name in directory.untracked:
+                if name.endswith(b'/'):
+                    # `git status` lists untracked folders as a whole, ls-files lists the files in them
+                    raise NeedsGit("untracked folders")
+                files.append(directory.path + name)
+
+        if prefix != '.':
+            prefix = os.fsencode(prefix) + b'/'
+            files = [path[len(prefix):] for path in files if path.startswith(prefix)]
+        files.sort()
+        return files
+
+    def files(self, kind):
+        """
+        Returns one of the `GIT_COMMANDS` lists (e.g. `staged`) formatted like git's output. Lists that can't be
+        worked out from the repository's files come from the query's `git status` snapshot instead.
+        """
+        try:
+            paths = getattr(self, kind)()
+        except ERRORS:
+            paths = git_status.for_directory(self.worktree).paths(kind, os.getcwd())
+        quote_non_ascii = self.quote_non_ascii()
+        return [quote_path(path, quote_non_ascii) for path in paths]
+
+    def quote_non_ascii(self):
+        """Returns whether `core.quotePath` is on, asking git (once per query) when the config can't be read."""
+        if self._quote_non_ascii is None:
+            try:
+                value = self.config().get('core.quotepath')
+            except ERRORS:
+                value = subprocess.run(
+                    ["git", "config", "core.quotepath"], cwd=self.worktree, capture_output=True, text=True
+                ).stdout.strip()
+            self._quote_non_ascii = not value or is_true(value)
+        return self._quote_non_ascii
+
+
+def normalized_mode(mode):
+    # trees written by old versions of git can have modes like 100664
+    if stat.S_ISREG(mode):
+        return 0o100755 if mode & 0o100 else 0o100644
+    return mode
+
+
+_statuses = {}
+
+
+def reset():
+    """Forgets what's only read once per query (the config); called at the start of each query."""
+    for status in _statuses.values():
+        status._quote_non_ascii = None
+
+
+def for_directory(path):
+    """
+    Returns the (cached) WorktreeStatus of the worktree containing `path`, or None if it isn't in one.
+
+    Raises:
+        UnsupportedRepository: the refs can't be read without git.
+    """
+    worktree = git_refs.find_worktree(path)
+    if worktree is None:
+        return None
+    refs = git_refs.for_directory(worktree)
+    if refs is None:
+        return None
+    if worktree not in _statuses:
+        _statuses[worktree] = WorktreeStatus(worktree, refs)
+    return _statuses[worktree]
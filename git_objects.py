@@ -0,0 +1,268 @@
+import os
+import mmap
+import zlib
+import struct
+
+import git_refs
+
+# pack entry types; 6 and 7 are deltas against another object
+PACK_TYPES = {1: b'commit', 2: b'tree', 3: b'blob', 4: b'tag'}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+# how much compressed data to read at a time when the compressed size isn't known
+CHUNK_SIZE = 64 * 1024
+
+
+class ObjectNotFound(git_refs.UnsupportedRepository):
+    """The object isn't in any loose file or pack we can read, e.g. it's only in a promisor remote."""
+
+
+def read_varint(data, pos):
+    """
+    Reads git's offset encoding (index v4 path prefixes, untracked cache, `OFS_DELTA` offsets).
+
+    Returns:
+        tuple: `(value, position after it)`.
+    """
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, pos
+
+
+def _delta_size(delta, pos):
+    size = shift = 0
+    while True:
+        byte = delta[pos]
+        pos += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return size, pos
+
+
+def apply_delta(base, delta):
+    """
+    Rebuilds an object from its delta against `base`.
+    """
+    source_size, pos = _delta_size(delta, 0)
+    target_size, pos = _delta_size(delta, pos)
+    if source_size != len(base):
+        raise ValueError("delta doesn't match its base")
+
+    result = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            # copy `size` bytes at `offset` of the base, both little endian with only the flagged bytes stored
+            offset = size = 0
+            for bit in range(4):
+                if op & (1 << bit):
+                    offset |= delta[pos] << (8 * bit)
+                    pos += 1
+            for bit in range(3):
+                if op & (0x10 << bit):
+                    size |= delta[pos] << (8 * bit)
+                    pos += 1
+            result += base[offset:offset + (size or 0x10000)]
+        elif op:
+            result += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError("invalid delta opcode")
+
+    if len(result) != target_size:
+        raise ValueError("delta produced the wrong size")
+    return bytes(result)
+
+
+class Pack:
+    """
+    One `objects/pack/pack-*.pack` with its version 2 `.idx`, both memory mapped.
+    """
+
+    def __init__(self, idx_path):
+        with open(idx_path, 'rb') as file:
+            self.idx = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(idx_path[:-len('.idx')] + '.pack', 'rb') as file:
+            self.pack = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.idx[:8] != b'\377tOc\0\0\0\2':
+            raise git_refs.UnsupportedRepository("pack index version")
+        self.fanout = struct.unpack_from('>256I', self.idx, 8)
+        self.count = self.fanout[255]
+        self.shas_at = 8 + 256 * 4
+        self.offsets_at = self.shas_at + self.count * (20 + 4)
+        self.large_offsets_at = self.offsets_at + self.count * 4
+
+    def offset(self, sha):
+        """Returns where `sha` (20 raw bytes) starts in the pack, or None."""
+        low = self.fanout[sha[0] - 1] if sha[0] else 0
+        high = self.fanout[sha[0]]
+        while low < high:
+            middle = (low + high) // 2
+            at = self.shas_at + middle * 20
+            current = self.idx[at:at + 20]
+            if current < sha:
+                low = middle + 1
+            elif current > sha:
+                high = middle
+            else:
+                offset, = struct.unpack_from('>I', self.idx, self.offsets_at + middle * 4)
+                if offset & 0x80000000:
+                    offset, = struct.unpack_from('>Q', self.idx, self.large_offsets_at + (offset & 0x7fffffff) * 8)
+                return offset
+        return None
+
+    def _inflate(self, pos, size):
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(self.pack[pos:pos + size + 64])
+        pos += size + 64
+        while not decompressor.eof:
+            if pos >= len(self.pack):
+                raise ValueError("truncated pack")
+            data += decompressor.decompress(self.pack[pos:pos + CHUNK_SIZE])
+            pos += CHUNK_SIZE
+        if len(data) != size:
+            raise ValueError("pack entry has the wrong size")
+        return data
+
+    def read(self, offset, store):
+        """
+        Returns:
+            tuple: `(type, content)` of the object at `offset`; `REF_DELTA` bases are looked up in `store`.
+        """
+        deltas = []
+        while True:
+            pack = self.pack
+            byte = pack[offset]
+            pos = offset + 1
+            kind = (byte >> 4) & 7
+            size = byte & 0x0f
+            shift = 4
+            while byte & 0x80:
+                byte = pack[pos]
+                pos += 1
+                size |= (byte & 0x7f) << shift
+                shift += 7
+
+            if kind == OFS_DELTA:
+                distance, pos = read_varint(pack, pos)
+                deltas.append(self._inflate(pos, size))
+                offset -= distance
+            elif kind == REF_DELTA:
+                base_sha = pack[pos:pos + 20]
+                deltas.append(self._inflate(pos + 20, size))
+                kind, content = store.read(base_sha)
+                break
+            elif kind in PACK_TYPES:
+                kind, content = PACK_TYPES[kind], self._inflate(pos, size)
+                break
+            else:
+                raise ValueError(f"unknown pack entry type {kind}")
+
+        for delta in reversed(deltas):
+            content = apply_delta(content, delta)
+        return kind, content
+
+
+class ObjectStore:
+    """
+    Reads objects from the loose files and packs of a repository (and its alternates), without git.
+    """
+
+    def __init__(self, objects_dir):
+        self.objects_dirs = [objects_dir]
+        try:
+            with open(os.path.join(objects_dir, 'info', 'alternates'), 'r') as file:
+                for line in file:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        self.objects_dirs.append(os.path.normpath(os.path.join(objects_dir, line)))
+        except OSError:
+            pass
+        self._packs = {}
+
+    def packs(self):
+        # packs are added and removed by gc/fetch, so the list is re-read whenever a pack folder changes
+        packs = []
+        for objects_dir in self.objects_dirs:
+            folder = os.path.join(objects_dir, 'pack')
+            key = git_refs.stat_key(folder)
+            cached = self._packs.get(folder)
+            if cached is None or cached[0] != key:
+                try:
+                    names = sorted(name for name in os.listdir(folder) if name.endswith('.idx'))
+                except OSError:
+                    names = []
+                cached = self._packs[folder] = (key, [Pack(os.path.join(folder, name)) for name in names])
+            packs.extend(cached[1])
+        return packs
+
+    def read(self, sha):
+        """
+        Parameters:
+            sha (bytes): the object's 20 byte id.
+
+        Returns:
+            tuple: `(type, content)`, e.g. `(b'tree', ...)`.
+
+        Raises:
+            ObjectNotFound: there's no such object in the repository's files.
+        """
+        name = sha.hex()
+        for objects_dir in self.objects_dirs:
+            try:
+                with open(os.path.join(objects_dir, name[:2], name[2:]), 'rb') as file:
+                    data = zlib.decompress(file.read())
+            except FileNotFoundError:
+                continue
+            header, _, content = data.partition(b'\0')
+            kind, _, _ = header.partition(b' ')
+            return kind, content
+
+        for pack in self.packs():
+            offset = pack.offset(sha)
+            if offset is not None:
+                return pack.read(offset, self)
+        raise ObjectNotFound(name)
+
+    def commit_tree(self, sha):
+        """Returns the id of the tree a commit points to."""
+        kind, content = self.read(sha)
+        if kind != b'commit' or not content.startswith(b'tree '):
+            raise ValueError(f"{sha.hex()} isn't a commit")
+        return bytes.fromhex(content[5:content.index(b'\n')].decode('ascii'))
+
+    def tree(self, sha):
+        """
+        Returns:
+            List[tuple]: `(mode, name, sha)` for each entry of a tree, with `mode` as an int (e.g. `0o100644`).
+        """
+        kind, content = self.read(sha)
+        if kind != b'tree':
+            raise ValueError(f"{sha.hex()} isn't a tree")
+        entries = []
+        pos = 0
+        while pos < len(content):
+            space = content.index(b' ', pos)
+            nul = content.index(b'\0', space)
+            entries.append((int(content[pos:space], 8), content[space + 1:nul], content[nul + 1:nul + 21]))
+            pos = nul + 21
+        return entries
+
+
+_stores = {}
+
+
+def for_repository(common_dir):
+    """Returns the (cached) ObjectStore of the repository whose common git dir is `common_dir`."""
+    if common_dir not in _stores:
+        _stores[common_dir] = ObjectStore(os.path.join(common_dir, 'objects'))
+    return _stores[common_dir]
@@ -0,0 +1,203 @@
+import os
+
+# how many `ref: ...` hops to follow before giving up (git uses 5 as well)
+MAX_SYMREF_DEPTH = 5
+
+
+class UnsupportedRepository(Exception):
+    """The repository can't be read without git, e.g. it uses the reftable ref storage."""
+
+
+def find_worktree(path):
+    """
+    Returns the top level folder of the worktree that contains `path` (the one with the `.git` entry), or None.
+    """
+    path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return path
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def find_git_dirs(path):
+    """
+    Finds the repository that contains `path`, following `.git` files (worktrees, submodules).
+
+    Returns:
+        tuple or None: `(git_dir, common_dir)`; they only differ for linked worktrees.
+    """
+    worktree = find_worktree(path)
+    if worktree is None:
+        return None
+
+    git_dir = os.path.join(worktree, '.git')
+    if os.path.isfile(git_dir):
+        with open(git_dir, 'r') as file:
+            content = file.read().strip()
+        if not content.startswith('gitdir:'):
+            return None
+        git_dir = os.path.normpath(os.path.join(worktree, content[len('gitdir:'):].strip()))
+
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r') as file:
+            common_dir = os.path.normpath(os.path.join(git_dir, file.read().strip()))
+    except OSError:
+        pass
+
+    return git_dir, common_dir
+
+
+def stat_key(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+        return None
+
+
+class RefStore:
+    """
+    Reads HEAD, loose refs and packed-refs straight from the repository's files.
+
+    Refs are re-read only when `packed-refs` or one of the directories under `refs/` changes; git
+    updates a loose ref by renaming a lock file over it, which always touches its directory.
+    """
+
+    def __init__(self, git_dir, common_dir):
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self._refs = None
+        self._fingerprint = None
+        self._ref_dirs = []
+
+        if os.path.isdir(os.path.join(common_dir, 'reftable')):
+            raise UnsupportedRepository("reftable")
+
+    def _current_fingerprint(self):
+        packed = stat_key(os.path.join(self.common_dir, 'packed-refs'))
+        return (packed, tuple(stat_key(path) for path in self._ref_dirs))
+
+    def _load_refs(self):
+        refs = {}
+
+        try:
+            with open(os.path.join(self.common_dir, 'packed-refs'), 'r') as file:
+                for line in file:
+                    # `#` is the header and `^` is the peeled commit of the tag above it
+                    if line.startswith(('#', '^')):
+                        continue
+                    sha, _, name = line.rstrip('\n').partition(' ')
+                    if name:
+                        refs[name] = sha
+        except OSError:
+            pass
+
+        # loose refs override packed ones
+        ref_dirs = []
+        root = os.path.join(self.common_dir, 'refs')
+        for dirpath, dirnames, filenames in os.walk(root):
+            ref_dirs.append(dirpath)
+            for filename in filenames:
+                if filename.endswith('.lock'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    with open(path, 'r') as file:
+                        value = file.read().strip()
+                except (OSError, UnicodeDecodeError):
+                    continue
+                name = os.path.relpath(path, self.common_dir).replace(os.sep, '/')
+                refs[name] = value
+
+        self._ref_dirs = ref_dirs
+        return refs
+
+    def refs(self):
+        """
+        Returns:
+            dict: ref name (e.g. `refs/heads/main`) to a sha, or to `ref: <name>` for symbolic refs.
+        """
+        if self._refs is None or self._current_fingerprint() != self._fingerprint:
+            self._refs = self._load_refs()
+            self._fingerprint = self._current_fingerprint()
+        return self._refs
+
+    def fingerprint(self):
+        """
+        Returns a value that changes whenever HEAD or any ref changes.
+        """
+        self.refs()
+        return (stat_key(os.path.join(self.git_dir, 'HEAD')), self._fingerprint)
+
+    def head(self):
+        """
+        Returns:
+            str: the content of HEAD, `ref: refs/heads/<branch>` or a sha when detached.
+        """
+        try:
+            with open(os.path.join(self.git_dir, 'HEAD'), 'r') as file:
+                return file.read().strip()
+        except OSError:
+            return ''
+
+    def current_branch(self):
+        """Returns the checked out branch, or '' when HEAD is detached (like `git branch --show-current`)."""
+        head = self.head()
+        if head.startswith('ref: refs/heads/'):
+            return head[len('ref: refs/heads/'):]
+        return ''
+
+    def resolve(self, value):
+        """Follows symbolic refs in `value` (a ref's content) until it reaches a sha."""
+        refs = self.refs()
+        for _ in range(MAX_SYMREF_DEPTH):
+            if not value.startswith('ref: '):
+                return value
+            value = refs.get(value[len('ref: '):], '')
+        return ''
+
+    def head_sha(self):
+        return self.resolve(self.head())
+
+    def _names(self, prefix):
+        return sorted(name[len(prefix):] for name in self.refs() if name.startswith(prefix))
+
+    def local_branches(self):
+        return self._names('refs/heads/')
+
+    def remote_branches(self):
+        """Remote branches formatted like `git branch -r`, e.g. `origin/HEAD -> origin/main`."""
+        refs = self.refs()
+        branches = []
+        for name in self._names('refs/remotes/'):
+            value = refs[f'refs/remotes/{name}']
+            if value.startswith('ref: refs/remotes/'):
+                name = f"{name} -> {value[len('ref: refs/remotes/'):]}"
+            branches.append(name)
+        return branches
+
+    def tags(self):
+        return self._names('refs/tags/')
+
+
+_stores = {}
+
+
+def for_directory(path):
+    """
+    Returns the (cached) RefStore of the repository containing `path`, or None if it isn't in one.
+
+    Raises:
+        UnsupportedRepository: the refs can't be read without git.
+    """
+    dirs = find_git_dirs(path)
+    if dirs is None:
+        return None
+    if dirs not in _stores:
+        _stores[dirs] = RefStore(*dirs)
+    return _stores[dirs]
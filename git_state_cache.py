@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import threading
+
+import git_refs
+
+# what each `cache:` value in the YAML is invalidated by
+KINDS = ("refs", "index")
+
+# outputs kept per repo; the oldest are dropped first
+MAX_ENTRIES = 500
+
+# lookups since the last `reset_stats()`, shown in Alfred's debugger when `alfred_debug` is set
+stats = {"hits": 0, "misses": 0}
+
+_lock = threading.Lock()
+_files = {}
+
+
+def cache_dir():
+    base = os.getenv('alfred_workflow_cache')
+    if not base:
+        return None
+    return os.path.join(base, "git_state")
+
+
+def reset_stats():
+    stats["hits"] = 0
+    stats["misses"] = 0
+
+
+def fingerprint(directory, kind):
+    """
+    Returns a fingerprint of the repository at `directory`, or None if it can't be cached.
+
+    Parameters:
+        kind (str): `refs` covers HEAD, loose refs and packed-refs; `index` adds `.git/index` and the
+            mtime of the worktree's top level folder. Neither notices edits inside tracked files, so
+            only commands that read refs/the index (e.g. `git log`, staged changes) should opt in.
+    """
+    if kind not in KINDS:
+        return None
+    try:
+        refs = git_refs.for_directory(directory)
+        if refs is None:
+            return None
+        parts = [refs.fingerprint()]
+    except (git_refs.UnsupportedRepository, OSError):
+        return None
+
+    if kind == "index":
+        parts.append(git_refs.stat_key(os.path.join(refs.git_dir, 'index')))
+        parts.append(git_refs.stat_key(directory))
+
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _path(directory):
+    name = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir(), f"{name}.json")
+
+
+def _read(path):
+    # call with `_lock` held
+    current = git_refs.stat_key(path)
+    cached = _files.get(path)
+    if cached and cached[0] == current:
+        return cached[1]
+
+    try:
+        with open(path, 'r') as file:
+            entries = json.load(file)
+    except (OSError, ValueError):
+        entries = {}
+    _files[path] = (current, entries)
+    return entries
+
+
+def load(directory, kind, command):
+    """
+    Returns:
+        tuple: `(output, fingerprint)`; output is None when the repo changed since `command` was stored.
+            Pass the fingerprint on to `store` after running the command.
+    """
+    if not cache_dir():
+        return None, None
+    current = fingerprint(directory, kind)
+    if not current:
+        return None, None
+
+    with _lock:
+        entry = _read(_path(directory)).get(f"{kind}\0{command}")
+        if entry and entry[0] == current:
+            stats["hits"] += 1
+            return entry[1], current
+        stats["misses"] += 1
+        return None, current
+
+
+def store(directory, kind, command, output, expected_fingerprint):
+    """
+    Stores `output` of `command`, as long as the repository still matches `expected_fingerprint`
+    (taken before the command ran).
+    """
+    if not cache_dir() or not expected_fingerprint:
+        return
+    if fingerprint(directory, kind) != expected_fingerprint:
+        return
+
+    path = _path(directory)
+    with _lock:
+        entries = dict(_read(path))
+        key = f"{kind}\0{command}"
+        entries.pop(key, None)
+        entries[key] = [expected_fingerprint, output]
+        while len(entries) > MAX_ENTRIES:
+            del entries[next(iter(entries))]
+
+        try:
+            os.makedirs(cache_dir(), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(entries, file)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        _files[path] = (git_refs.stat_key(path), entries)
@@ -0,0 +1,134 @@
+import os
+import threading
+import subprocess
+
+import git_refs
+
+# one status for every list under `status`: staged, modified, untracked and conflicted files plus the upstream
+COMMAND = ["git", "status", "--porcelain=v2", "--branch", "-z", "--untracked-files=all"]
+
+# the snapshot of each worktree taken in this query, see `reset`
+_snapshots = {}
+_lock = threading.Lock()
+
+
+class StatusSnapshot:
+    """
+    The parsed output of `COMMAND`.
+
+    Paths are bytes relative to the top of `worktree`, as git stores them (not quoted).
+    """
+
+    def __init__(self, output, worktree=None):
+        self.worktree = worktree
+        self.branch = None      # None when HEAD is detached
+        self.oid = None         # None before the first commit
+        self.upstream = None    # e.g. `origin/main`
+        self.ahead = None       # None without an upstream, or when it's gone
+        self.behind = None
+        self.staged = []
+        self.modified = []
+        self.untracked = []
+        self.conflicted = []
+
+        records = output.split(b'\0')
+        i = 0
+        while i < len(records):
+            record = records[i]
+            i += 1
+            if record.startswith(b'# '):
+                self._read_header(record[2:].decode('utf-8', 'replace'))
+            elif record.startswith(b'1 '):
+                # 1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <path>
+                fields = record.split(b' ', 8)
+                self._add_change(fields[1], fields[8])
+            elif record.startswith(b'2 '):
+                # 2 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <score> <path>, then the original path as its own record
+                fields = record.split(b' ', 9)
+                self._add_change(fields[1], fields[9])
+                i += 1
+            elif record.startswith(b'u '):
+                # u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <path>
+                self.conflicted.append(record.split(b' ', 10)[10])
+            elif record.startswith(b'? '):
+                self.untracked.append(record[2:])
+
+    def _read_header(self, header):
+        name, _, value = header.partition(' ')
+        if name == 'branch.oid':
+            self.oid = None if value == '(initial)' else value
+        elif name == 'branch.head':
+            self.branch = None if value == '(detached)' else value
+        elif name == 'branch.upstream':
+            self.upstream = value
+        elif name == 'branch.ab':
+            ahead, behind = value.split(' ')
+            self.ahead, self.behind = int(ahead), -int(behind)
+
+    def _add_change(self, xy, path):
+        # X is the index compared with HEAD, Y the worktree compared with the index; `.` is unchanged
+        if xy[:1] != b'.':
+            self.staged.append(path)
+        if xy[1:2] != b'.':
+            self.modified.append(path)
+
+    def paths(self, kind, directory):
+        """
+        Returns one of the lists `git_index.GIT_COMMANDS` names (`staged`, `modified` or `untracked`), plus
+        `conflicted`. Conflicted files are also staged and modified, like `git diff` shows them.
+
+        Parameters:
+            directory (str): untracked files are the ones under this folder, relative to it, like ls-files.
+        """
+        if kind == 'untracked':
+            prefix = os.path.relpath(directory, self.worktree) if self.worktree else '.'
+            if prefix == '.':
+                return sorted(self.untracked)
+            prefix = os.fsencode(prefix) + b'/'
+            return sorted(path[len(prefix):] for path in self.untracked if path.startswith(prefix))
+        if kind == 'conflicted':
+            return sorted(self.conflicted)
+        return sorted(set(getattr(self, kind)) | set(self.conflicted))
+
+    def upstream_status(self):
+        """
+        Returns how the branch compares with its upstream in `git status`'s words, or None without an upstream.
+        """
+        upstream = self.upstream
+        if upstream is None:
+            return None
+        if self.ahead is None:
+            return f"Your branch is based on '{upstream}', but the upstream is gone."
+        if not self.ahead and not self.behind:
+            return f"Your branch is up to date with '{upstream}'."
+        if not self.behind:
+            return f"Your branch is ahead of '{upstream}' by {commits(self.ahead)}."
+        if not self.ahead:
+            return f"Your branch is behind '{upstream}' by {commits(self.behind)}, and can be fast-forwarded."
+        return (f"Your branch and '{upstream}' have diverged, "
+                f"and have {self.ahead} and {self.behind} different commits each, respectively.")
+
+
+def commits(count):
+    return f"{count} commit" if count == 1 else f"{count} commits"
+
+
+def reset():
+    """Forgets the snapshots; called at the start of each query, since files change between them."""
+    with _lock:
+        _snapshots.clear()
+
+
+def for_directory(path):
+    """
+    Returns the worktree's status for this query, running `COMMAND` the first time it's asked for.
+    Outside a repository, or if git fails, the lists are empty.
+    """
+    worktree = git_refs.find_worktree(path)
+    with _lock:
+        snapshot = _snapshots.get(worktree)
+        if snapshot is None:
+            result = subprocess.run(COMMAND, cwd=worktree or path, capture_output=True)
+            snapshot = StatusSnapshot(result.stdout if result.returncode == 0 else b'', worktree)
+            _snapshots[worktree] = snapshot
+    return snapshot
@@ -1,7 +1,8 @@
 import os
-import yaml
 import sys
 
+import yaml_loader
+
 class Location:
     def __init__(self, title, directory, actions_path=None):
         self.title = title
@@ -29,7 +30,7 @@ def generate_locations_from_yaml(yaml_string):
 
         return Location(title=title, directory=path, actions_path=actions_path)
 
-    yaml_data = yaml.safe_load(yaml_string)
+    yaml_data = yaml_loader.safe_load(yaml_string)
     return [location_entry_processor(entry) for entry in yaml_data]
 
 
@@ -0,0 +1,67 @@
+import os
+import json
+
+# root folder -> (mtime, repo folder names), for the queries answered by this process
+_memory = {}
+
+
+def cache_path():
+    base = os.getenv('alfred_workflow_cache')
+    if not base:
+        return None
+    return os.path.join(base, "repos.json")
+
+
+def _load_cache():
+    path = cache_path()
+    if not path:
+        return {}
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_cache(entries):
+    path = cache_path()
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(entries, file)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def find_repositories(root):
+    """
+    Returns the names of the subfolders of `root` that contain a `.git` folder, in listing order.
+
+    The list is rescanned only when the mtime of `root` changes (a checkout was added, removed or
+    renamed), so a warm query only needs one `stat`. A folder that becomes a repo in place isn't
+    noticed until then.
+    """
+    mtime = os.stat(root).st_mtime_ns
+
+    cached = _memory.get(root)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    entries = _load_cache()
+    entry = entries.get(root)
+    if entry and entry[0] == mtime:
+        _memory[root] = (mtime, entry[1])
+        return entry[1]
+
+    names = [
+        name for name in os.listdir(root)
+        if os.path.isdir(os.path.join(root, name, '.git'))
+    ]
+    _memory[root] = (mtime, names)
+    entries[root] = [mtime, names]
+    _store_cache(entries)
+    return names
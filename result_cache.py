@@ -0,0 +1,113 @@
+import os
+import time
+import hashlib
+import subprocess
+
+from zsh_pool import shell_quote
+
+# a background refresh that hasn't landed after this long is assumed to have died
+REFRESH_TIMEOUT = 60
+
+
+def cache_dir():
+    base = os.getenv('alfred_workflow_cache')
+    if not base:
+        return None
+    return os.path.join(base, "results")
+
+
+def key_for(command, source_paths=()):
+    """
+    Returns the cache key of `command` when run in the current directory after sourcing `source_paths`.
+    """
+    identity = "\0".join([os.getcwd(), command, *source_paths])
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def _path(key, suffix):
+    return os.path.join(cache_dir(), f"{key}.{suffix}")
+
+
+def load(key):
+    """
+    Returns:
+        tuple or None: `(output, age in seconds)` of the last stored result for `key`.
+    """
+    if not cache_dir():
+        return None
+    try:
+        path = _path(key, "out")
+        with open(path, 'r') as file:
+            output = file.read()
+        return output, time.time() - os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def store(key, output):
+    if not cache_dir():
+        return
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        path = _path(key, "out")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            file.write(output)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def is_refreshing(key):
+    if not cache_dir():
+        return False
+    try:
+        return time.time() - os.stat(_path(key, "pending")).st_mtime < REFRESH_TIMEOUT
+    except OSError:
+        return False
+
+
+def refresh_in_background(key, command, source_paths=()):
+    """
+    Runs `command` in a detached zsh that outlives this process and stores its output under `key`. Output of a
+    command that fails is dropped, keeping what was stored before.
+
+    Returns:
+        bool: False if there is nowhere to store the result.
+    """
+    if not cache_dir():
+        return False
+
+    out_path = _path(key, "out")
+    pending_path = _path(key, "pending")
+    tmp_path = f"{out_path}.refresh.tmp"
+
+    sources = "".join(f"source {shell_quote(path)};\n" for path in source_paths)
+    script = (
+        f"{sources}"
+        f"if ( eval {shell_quote(command)} ) > {shell_quote(tmp_path)} 2>/dev/null </dev/null; then\n"
+        f"  mv -f {shell_quote(tmp_path)} {shell_quote(out_path)}\n"
+        f"else\n"
+        f"  rm -f {shell_quote(tmp_path)}\n"
+        f"fi\n"
+        f"rm -f {shell_quote(pending_path)}\n"
+    )
+
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        with open(pending_path, 'w'):
+            pass
+        subprocess.Popen(
+            ["zsh", "-c", script],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+    except OSError:
+        try:
+            os.unlink(pending_path)
+        except OSError:
+            pass
+        return False
+    return True
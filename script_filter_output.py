@@ -0,0 +1,30 @@
+import json
+
+
+class ScriptFilterOutput:
+    """
+    Writes Alfred's script filter JSON to `stream` while the items are being produced, instead of collecting
+    them into one response first. Items are written with `ResultItem.to_json`.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+        stream.write('{"items": [')
+
+    def add(self, item):
+        self.stream.write(f", {item.to_json()}" if self.count else item.to_json())
+        self.count += 1
+
+    def extend(self, items):
+        for item in items:
+            self.add(item)
+
+    def close(self, **fields):
+        """
+        Ends the item list, followed by `fields` (e.g. `rerun`), which are only known once every item is written.
+        """
+        self.stream.write("]")
+        for name, value in fields.items():
+            self.stream.write(f", {json.dumps(name)}: {json.dumps(value)}")
+        self.stream.write("}")
@@ -2,7 +2,7 @@
 
 WORKFLOW_FOLDER="$gitplus_path"
 
-FILES_TO_PUSH=("git_filtering_internal.py" "actions.yaml" "location_arg_parser.py" "functions.sh" "tv_script.sh" "tv_script.py" "definitions.py")
+FILES_TO_PUSH=("git_filtering_internal.py" "actions.yaml" "location_arg_parser.py" "functions.sh" "tv_script.sh" "tv_script.py" "definitions.py" "command_cache.py" "git_filtering_client.py" "git_filtering_server.py" "zsh_pool.py" "result_cache.py" "git_refs.py" "git_objects.py" "git_index.py" "git_status.py" "git_hunks.py" "git_builtins.py" "git_state_cache.py" "title_trie.py" "repo_discovery.py" "yaml_loader.py" "command_catalog.py" "script_filter_output.py")
 
 # copy these files to the WORKFLOW_FOLDER
 for FILE in "${FILES_TO_PUSH[@]}"; do
@@ -0,0 +1,96 @@
+import os
+import sys
+import marshal
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+import command_cache
+import command_catalog
+from title_trie import TitleTrie
+from git_filtering_internal import create_commands_from_config, resolve_commands, Location
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONFIGS = ("actions.yaml", "experimental_actions.yaml")
+
+
+def describe(cmd):
+    """
+    Returns everything a command is built from, with its subcommands, as plain data to compare.
+    """
+    def mods(mod_list):
+        return [(mod.arg, mod.subtitle, mod.valid, mod.key) for mod in mod_list]
+
+    fields = command_catalog.STRING_FIELDS + command_catalog.PLAIN_FIELDS + ("command_type",)
+    textview = cmd.textview_action
+    return (
+        [getattr(cmd, name) for name in fields],
+        mods(cmd.mods),
+        (textview.command, mods(textview.mods)) if textview else None,
+        [describe(subcmd) for subcmd in cmd.subcommands],
+    )
+
+
+class TestCommandCatalog(unittest.TestCase):
+    def setUp(self):
+        self.commands = []
+        for name in CONFIGS:
+            self.commands.extend(create_commands_from_config(os.path.join(HERE, name)))
+        data = marshal.loads(marshal.dumps(command_catalog.compile_commands(self.commands)))
+        self.catalog = command_catalog.Catalog(data)
+
+    def test_round_trip(self):
+        self.assertEqual([describe(cmd) for cmd in self.catalog.roots()], [describe(cmd) for cmd in self.commands])
+
+    def test_subcommands_are_built_on_first_use(self):
+        roots = self.catalog.roots()
+        self.assertEqual(len(self.catalog._commands), len(roots))
+
+        parent = next(cmd for cmd in roots if cmd.subcommands)
+        self.assertEqual(len(self.catalog._commands), len(roots) + len(parent.subcommands))
+        self.assertIs(parent.subcommands, parent.subcommands)
+
+    def test_resolves_like_the_built_tree(self):
+        locations = TitleTrie([Location(title="demo", directory=".")])
+        for query in ("demo status ", "demo checkout local branches ", "demo stash "):
+            expected = resolve_commands(query, locations, TitleTrie(self.commands))
+            result = resolve_commands(query, locations, TitleTrie(self.catalog.roots()))
+            self.assertEqual([cmd.title for cmd in result.commands], [cmd.title for cmd in expected.commands])
+            self.assertEqual(result.unfinished_query, expected.unfinished_query)
+
+
+class TestCompileConfigs(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        patcher = mock.patch.dict(os.environ, {"alfred_workflow_cache": self.folder.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        command_cache._memory.clear()
+        self.addCleanup(command_cache._memory.clear)
+        self.configs = [os.path.join(HERE, name) for name in CONFIGS]
+
+    def load(self):
+        def build(sources):
+            self.fail("the compiled catalog wasn't used")
+
+        return command_cache.load_commands([('path', config) for config in self.configs], build)
+
+    def test_load_commands_reads_the_compiled_catalog(self):
+        path, commands = command_catalog.compile_configs(self.configs)
+        self.assertEqual(os.path.dirname(path), command_cache.cache_dir())
+        self.assertEqual([describe(cmd) for cmd in self.load()], [describe(cmd) for cmd in commands])
+
+    def test_command_line(self):
+        result = subprocess.run([sys.executable, "command_catalog.py", *self.configs], cwd=HERE, capture_output=True, text=True, check=True)
+        self.assertIn(command_cache.cache_dir(), result.stdout)
+
+        expected = []
+        for config in self.configs:
+            expected.extend(create_commands_from_config(config))
+        self.assertEqual([describe(cmd) for cmd in self.load()], [describe(cmd) for cmd in expected])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import stat
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+import subprocess
+
+import git_filtering_client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+REPO_LIST = "- {title: alpha, path: /tmp/alpha}\n- {title: beta, path: /tmp/beta}"
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        # a copy of the workflow, so its sources can change without touching the real one
+        self.tmp = tempfile.mkdtemp()
+        self.workflow = os.path.join(self.tmp, "workflow")
+        shutil.copytree(HERE, self.workflow, ignore=shutil.ignore_patterns(".git", "__pycache__", "test_*", "images", "icons"))
+        self.cache = os.path.join(self.tmp, "cache")
+        self.env = dict(
+            os.environ, TMPDIR=self.tmp, alfred_workflow_cache=self.cache, input_repo_list=REPO_LIST,
+            input_daemon_idle_timeout="30",
+        )
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.kill()
+            self.server.wait()
+        shutil.rmtree(self.tmp)
+
+    def socket_path(self):
+        script = "import git_filtering_client; print(git_filtering_client.socket_path())"
+        return self.run_python("-c", script).strip()
+
+    def run_python(self, *args):
+        result = subprocess.run([sys.executable, *args], cwd=self.workflow, env=self.env, capture_output=True, text=True, check=True)
+        return result.stdout
+
+    def wait_until(self, predicate, message):
+        for _ in range(100):
+            if predicate():
+                return
+            time.sleep(0.05)
+        self.fail(message)
+
+    def is_listening(self, path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+    def start_server(self):
+        self.server = subprocess.Popen([sys.executable, "git_filtering_server.py"], cwd=self.workflow, env=self.env)
+        path = self.socket_path()
+        self.wait_until(lambda: self.is_listening(path), "the server didn't start")
+        return path
+
+    def request(self, path, cwd=None):
+        message = json.dumps({"argv": ["git_filtering_internal.py", "al"], "env": self.env, "cwd": cwd or self.workflow})
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(10)
+            sock.connect(path)
+            git_filtering_client.send_message(sock, message.encode('utf-8'))
+            reply = git_filtering_client.recv_message(sock)
+        return None if reply is None else json.loads(reply)
+
+    def test_round_trip(self):
+        path = self.start_server()
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode) & 0o077, 0)
+
+        expected = self.run_python("git_filtering_internal.py", "al")
+        self.assertIn('"alpha"', expected)
+        self.assertEqual(self.request(path), {"output": expected})
+        self.assertEqual(self.run_python("git_filtering_client.py", "al"), expected)
+
+        # a failed query is answered with an error and logged
+        reply = self.request(path, cwd=os.path.join(self.tmp, "missing"))
+        self.assertIn("FileNotFoundError", reply["error"])
+        self.assertEqual(self.request(path), {"output": expected})
+
+    def test_errors_are_logged(self):
+        # started by the client, which answers the first query itself
+        expected = self.run_python("git_filtering_internal.py", "al")
+        self.assertEqual(self.run_python("git_filtering_client.py", "al"), expected)
+        path = self.socket_path()
+        self.wait_until(lambda: self.is_listening(path), "the client didn't start a server")
+        try:
+            self.request(path, cwd=os.path.join(self.tmp, "missing"))
+            with open(os.path.join(self.cache, "server.log")) as log:
+                self.assertIn("Traceback", log.read())
+        finally:
+            # the client's server isn't ours to kill; have it exit on its own
+            os.utime(os.path.join(self.workflow, "git_filtering_server.py"), ns=(0, 0))
+            self.request(path)
+            self.wait_until(lambda: not os.path.exists(path), "the client's server didn't exit")
+
+    def test_socket_is_private(self):
+        path = self.start_server()
+        self.assertEqual(os.path.dirname(path), os.path.join(self.tmp, f"git-plus-{os.getuid()}"))
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+
+        # a socket others could have put there isn't talked to
+        os.environ["TMPDIR"] = self.tmp
+        workflow_dir = git_filtering_client.workflow_dir
+        git_filtering_client.workflow_dir = lambda: self.workflow
+        try:
+            self.assertIsNotNone(git_filtering_client.query_server())
+            os.chmod(path, 0o777)
+            self.assertIsNone(git_filtering_client.query_server())
+
+            # nor a folder others can write to; queries run without a server
+            os.chmod(os.path.dirname(path), 0o777)
+            self.assertIsNone(git_filtering_client.socket_path())
+        finally:
+            git_filtering_client.workflow_dir = workflow_dir
+            os.environ.pop("TMPDIR")
+            os.chmod(os.path.dirname(path), 0o700)
+        self.assertEqual(self.run_python("git_filtering_client.py", "al"), self.run_python("git_filtering_internal.py", "al"))
+
+    def test_exits_when_idle_or_sources_change(self):
+        self.env["input_daemon_idle_timeout"] = "0.2"
+        path = self.start_server()
+        self.assertEqual(self.server.wait(timeout=10), 0)
+        self.assertFalse(os.path.exists(path))
+
+        self.env["input_daemon_idle_timeout"] = "30"
+        path = self.start_server()
+        os.utime(os.path.join(self.workflow, "git_filtering_server.py"), ns=(0, 0))
+        # no reply: the client answers in-process and starts a fresh server
+        self.assertIsNone(self.request(path))
+        self.assertEqual(self.server.wait(timeout=10), 0)
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
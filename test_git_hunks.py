@@ -0,0 +1,236 @@
+import os
+import subprocess
+import unittest
+
+import git_hunks
+import tv_script
+from test_git_refs import GIT, git, RepoTestCase
+
+SAMPLE = b"\n".join([
+    b"diff --git a/sp ace.txt b/sp ace.txt",
+    b"index 7898192..422c2b7 100644",
+    b"--- a/sp ace.txt\t",
+    b"+++ b/sp ace.txt\t",
+    b"@@ -1 +1,2 @@",
+    b" a",
+    b"+b",
+    b"@@ -10,3 +11,0 @@ def f(x):",
+    b"-c",
+    b"-d\r",
+    b"-e",
+    b"\\ No newline at end of file",
+    b'diff --git "a/caf\\303\\251.txt" "b/caf\\303\\251.txt"',
+    b"old mode 100644",
+    b"new mode 100755",
+    b"diff --git a/image.png b/image.png",
+    b"index 1234567..89abcde 100644",
+    b"Binary files a/image.png and b/image.png differ",
+    b"diff --git a/old.txt b/new.txt",
+    b"similarity index 100%",
+    b"rename from old.txt",
+    b"rename to new.txt",
+    b"diff --cc conflict.txt",
+    b"index 1234567,89abcde..0000000",
+    b"--- a/conflict.txt",
+    b"+++ b/conflict.txt",
+    b"@@@ -1,1 -1,1 +1,5 @@@",
+    b"++<<<<<<< HEAD",
+    b"",
+])
+
+
+class TestParse(unittest.TestCase):
+    def test_parse(self):
+        files = git_hunks.parse(SAMPLE)
+        self.assertEqual(
+            [file.name for file in files],
+            ["sp ace.txt", '"caf\\303\\251.txt"', "image.png", "new.txt", "conflict.txt"]
+        )
+
+        first = files[0]
+        self.assertEqual(len(first.header), 4)
+        self.assertEqual([hunk.title for hunk in first.hunks], ["@@ -1 +1,2 @@", "@@ -10,3 +11,0 @@ def f(x):"])
+        hunk = first.hunk("@@ -10,3 +11,0 @@ def f(x):")
+        self.assertEqual((hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count), (10, 3, 11, 0))
+        self.assertEqual(hunk.lines, [b"-c", b"-d\r", b"-e", b"\\ No newline at end of file"])
+        self.assertIs(first.hunk(), first.hunks[0])
+        self.assertEqual(first.hunks[0].old_count, 1)
+        self.assertIsNone(first.hunk("@@ -2 +2 @@"))
+
+        self.assertEqual(files[1].hunks, [])
+        self.assertIsNone(files[4].hunks[0].old_start)
+
+
+@unittest.skipIf(GIT is None, "needs git")
+class TestGitHunks(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        git_hunks.reset()
+        self.write("long.txt", "".join(f"{i}\n" for i in range(1, 41)))
+        self.write("café.txt", "a\n")
+        git(self.repo, "add", "-A")
+        git(self.repo, "commit", "-q", "-m", "files")
+        self.write("long.txt", "".join(f"{i}\n" for i in range(1, 41)).replace("\n5\n", "\nfive\n").replace("30\n", "thirty\n"))
+        self.write("café.txt", "a\nb\n")
+        git(self.repo, "add", "café.txt")
+
+    def write(self, path, content):
+        with open(os.path.join(self.repo, path), "w") as file:
+            file.write(content)
+
+    def in_repo(self, function, *args):
+        cwd_before = os.getcwd()
+        os.chdir(self.repo)
+        try:
+            return function(*args)
+        finally:
+            os.chdir(cwd_before)
+
+    def test_view(self):
+        self.assertEqual(self.in_repo(git_hunks.view, "stage", "long.txt", "@@ -27,7 +27,7 @@"), "\n".join([
+            git_hunks.RULE,
+            "file: long.txt (2 hunks)",
+            "hunk: @@ -27,7 +27,7 @@",
+            git_hunks.RULE,
+            "",
+            " 27", " 28", " 29", "-30", "+thirty", " 31", " 32", " 33",
+        ]))
+
+        # the first hunk of the first file, with the file as `git diff --name-only` prints it
+        view = self.in_repo(git_hunks.view, "unstage").splitlines()
+        self.assertEqual(view[1:3], ['file: "caf\\303\\251.txt" (1 hunk)', "hunk: @@ -1 +1,2 @@"])
+        self.assertEqual(view[5:], [" a", "+b"])
+
+    def test_builtins(self):
+        self.assertEqual(self.builtin("hunk_count stage long.txt"), "2 hunks")
+        self.assertEqual(self.builtin("hunk_count stage café.txt"), "0 hunks")
+        self.assertEqual(self.builtin("hunk_headers stage long.txt"), "@@ -2,7 +2,7 @@\n@@ -27,7 +27,7 @@")
+        self.assertEqual(self.builtin("hunk_count unstage '\"caf\\303\\251.txt\"'"), "1 hunk")
+
+    def test_one_diff_per_query(self):
+        runs = []
+        original = subprocess.run
+
+        def counting_run(command, *args, **kwargs):
+            runs.append(command)
+            return original(command, *args, **kwargs)
+
+        git_hunks.subprocess.run = counting_run
+        try:
+            self.builtin("hunk_count stage long.txt")
+            self.builtin("hunk_count stage other.txt")
+            self.builtin("hunk_headers stage long.txt")
+            self.in_repo(git_hunks.view, "stage", "long.txt")
+            self.assertEqual(runs, [git_hunks.ACTIONS["stage"]])
+
+            # a text view of the first file's first hunk, in its own process
+            git_hunks.reset()
+            runs.clear()
+            self.in_repo(git_hunks.view, "stage")
+            self.assertEqual(runs, [git_hunks.ACTIONS["stage"]])
+        finally:
+            git_hunks.subprocess.run = original
+
+    def test_apply(self):
+        original = "".join(f"{i}\n" for i in range(1, 41))
+        self.write("long.txt", original.replace("\n5\n", "\nfive\nfive2\n").replace("30\n", "thirty\n"))
+        self.assertEqual(self.builtin("hunk_headers stage long.txt"), "@@ -2,7 +2,8 @@\n@@ -27,7 +28,7 @@")
+
+        # the second hunk alone, with the line the first one would have added left out of its header
+        file = self.in_repo(git_hunks.file_diff, "stage", "long.txt")
+        self.assertTrue(file.patch(file.hunks[1:]).endswith(b"@@ -27,7 +27,7 @@\n 27\n 28\n 29\n-30\n+thirty\n 31\n 32\n 33\n"))
+        self.assertEqual(self.in_repo(git_hunks.apply, "stage", "long.txt", "@@ -27,7 +28,7 @@"), (1, 1))
+        self.assertEqual(git(self.repo, "show", ":long.txt"), original.replace("30\n", "thirty\n"))
+
+        # back out of the index: no staged hunks left in it, café.txt is still staged
+        self.assertEqual(self.in_repo(git_hunks.apply, "unstage", "long.txt"), (0, 1))
+        self.assertEqual(git(self.repo, "show", ":long.txt"), original)
+
+        self.assertEqual(self.in_repo(git_hunks.apply, "discard", "long.txt"), (1, 1))
+        with open(os.path.join(self.repo, "long.txt")) as file:
+            self.assertEqual(file.read(), original.replace("30\n", "thirty\n"))
+        # the patches went through stdin
+        self.assertEqual(sorted(os.listdir(self.repo)), [".git", "café.txt", "long.txt"])
+
+        with self.assertRaises(git_hunks.ApplyFailed):
+            self.in_repo(git_hunks.apply, "stage", "long.txt", "@@ -2,7 +2,8 @@")
+
+    def test_apply_selected(self):
+        original = "".join(f"{i}\n" for i in range(1, 41))
+        self.write("long.txt", original.replace("\n5\n", "\nfive\nfive2\n").replace("30\n", "thirty TODO\n"))
+        self.write("other.txt", "new\n")
+        git(self.repo, "add", "-N", "other.txt")
+
+        listing = self.in_repo(git_hunks.listing, "stage", None, "/TODO/").splitlines()
+        self.assertEqual(listing[1], "selected: 2 of 3 hunks")
+        self.assertIn("✓ [2] @@ -27,7 +28,7 @@", listing)
+        self.assertIn("  [3] @@ -0,0 +1 @@", listing)
+        self.assertEqual(self.in_repo(git_hunks.listing, "stage", None, "4").splitlines()[1], "selected: none (no hunk 4)")
+
+        # the mod runs in a process of its own
+        git_hunks.reset()
+        runs = []
+        original_run = subprocess.run
+
+        def counting_run(command, *args, **kwargs):
+            runs.append(command)
+            return original_run(command, *args, **kwargs)
+
+        git_hunks.subprocess.run = counting_run
+        try:
+            # the second hunk of long.txt and other.txt in one patch
+            self.assertEqual(self.in_repo(git_hunks.apply_selected, "stage", None, "2-3"), (1, 1))
+        finally:
+            git_hunks.subprocess.run = original_run
+        self.assertEqual(runs, [git_hunks.ACTIONS["stage"], git_hunks.APPLY_COMMANDS["stage"]])
+        self.assertEqual(git(self.repo, "show", ":long.txt"), original.replace("30\n", "thirty TODO\n"))
+        self.assertEqual(git(self.repo, "show", ":other.txt"), "new\n")
+
+        self.assertEqual(self.in_repo(git_hunks.apply_selected, "unstage", "long.txt", "all"), (0, 2))
+        self.assertEqual(git(self.repo, "show", ":long.txt"), original)
+        with self.assertRaises(git_hunks.ApplyFailed):
+            self.in_repo(git_hunks.apply_selected, "stage", None, "")
+
+    def test_select(self):
+        hunks = git_hunks.parse(SAMPLE)[0].hunks
+        self.assertEqual(git_hunks.select(hunks, "all"), [0, 1])
+        self.assertEqual(git_hunks.select(hunks, "2, 1-2"), [0, 1])
+        self.assertEqual(git_hunks.select(hunks, r"/^\+b/"), [0])
+        self.assertEqual(git_hunks.select(hunks, "/def f/"), [1])
+        for selection in ("3", "0", "1-x", "/(/"):
+            with self.assertRaises(ValueError):
+                git_hunks.select(hunks, selection)
+
+    def test_reload_level(self):
+        # hunks left, files left, one file
+        self.assertEqual(git_hunks.reload_level(2, 1, True), 0)
+        self.assertEqual(git_hunks.reload_level(0, 1, True), 2)
+        self.assertEqual(git_hunks.reload_level(0, 0, True), 3)
+        self.assertEqual(git_hunks.reload_level(0, 1, False), 0)
+        self.assertEqual(git_hunks.reload_level(0, 0, False), 2)
+
+    def test_text_view_in_process(self):
+        command = f"cd {self.repo!r};\nview_hunk \"stage\" 'long.txt' ''"
+        cwd_before = os.getcwd()
+        try:
+            self.assertEqual(tv_script.run_in_process(command), self.in_repo(git_hunks.view, "stage", "long.txt"))
+        finally:
+            os.chdir(cwd_before)
+
+        # the text typed in the text view
+        os.environ["tv_input"] = "all"
+        try:
+            output = tv_script.run_in_process(f"cd {self.repo!r};\nview_hunks \"stage\" '' \"$tv_input\"")
+        finally:
+            del os.environ["tv_input"]
+            os.chdir(cwd_before)
+        self.assertEqual(output.splitlines()[1], "selected: 1, 2 of 2 hunks")
+
+        # anything else goes through zsh
+        self.assertIsNone(tv_script.run_in_process(f"cd {self.repo!r};\nview_hunk stage $(ls)"))
+        self.assertIsNone(tv_script.run_in_process(f"cd {self.repo!r};\nview_hunk stage; echo"))
+        self.assertIsNone(tv_script.run_in_process(f"cd {self.repo!r};\ngit diff"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import time
+import subprocess
+import unittest
+
+import git_index
+import git_status
+from test_git_refs import GIT, git, RepoTestCase
+
+
+@unittest.skipIf(GIT is None, "needs git")
+class TestGitIndex(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        for path in ("top.txt", "a/one.txt", "a/b/two.txt", "c/three.txt", "sp ace.txt", "café.txt"):
+            self.write(path, path + "\n")
+        os.symlink("top.txt", os.path.join(self.repo, "link"))
+        git(self.repo, "add", "-A")
+        git(self.repo, "commit", "-q", "-m", "files")
+        # read HEAD's trees from a pack
+        git(self.repo, "gc", "-q")
+
+    def write(self, path, content):
+        path = os.path.join(self.repo, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+
+    def backdate(self):
+        # keeps stat data from being "racy" (changed in the second the index was written)
+        past = time.time() - 60
+        for folder, _, names in os.walk(self.repo):
+            if "/.git" in folder + "/":
+                continue
+            for name in names + [""]:
+                os.utime(os.path.join(folder, name), (past, past), follow_symlinks=False)
+
+    def status(self):
+        return git_index.for_directory(self.repo)
+
+    def assert_matches_git(self):
+        # as a new query would
+        git_status.reset()
+        git_index.reset()
+        for kind, command in git_index.GIT_COMMANDS.items():
+            expected = git(self.repo, *command[1:]).splitlines()
+            self.assertEqual(self.builtin(f"{kind}_files").splitlines(), expected, kind)
+            self.assertEqual(self.builtin(f"{kind}_count"), f"{len(expected)} file(s)")
+
+    def test_lists_match_git(self):
+        self.write("a/one.txt", "changed\n")
+        self.write("a/b/new.txt", "new\n")
+        self.write("café.txt", "changed\n")
+        self.write("untracked.txt", "\n")
+        os.chmod(os.path.join(self.repo, "top.txt"), 0o755)
+        os.remove(os.path.join(self.repo, "c/three.txt"))
+        git(self.repo, "add", "a/b/new.txt", "café.txt")
+        git(self.repo, "rm", "-q", "--cached", "sp ace.txt")
+        # stat data changes, content doesn't
+        os.utime(os.path.join(self.repo, "a/b/two.txt"), (0, 0))
+
+        self.assert_matches_git()
+        self.assertEqual(self.status().staged(), [b"a/b/new.txt", b"caf\xc3\xa9.txt", b"sp ace.txt"])
+        self.assertEqual(self.status().modified(), [b"a/one.txt", b"c/three.txt", b"top.txt"])
+        self.assertEqual(
+            self.builtin("status_summary"),
+            git(self.repo, "branch", "--show-current").strip().join(["staged: 3, modified: 3, untracked: 2 -- ", ""])
+        )
+
+    def test_index_version_4(self):
+        git(self.repo, "update-index", "--index-version", "4")
+        self.write("a/b/two.txt", "changed\n")
+        git(self.repo, "add", "a/b/two.txt")
+        self.write("a/one.txt", "changed\n")
+
+        self.assertEqual(self.status().staged(), [b"a/b/two.txt"])
+        self.assertEqual(self.status().modified(), [b"a/one.txt"])
+        self.assert_matches_git()
+
+    def test_unborn_branch(self):
+        git(self.repo, "checkout", "-q", "--orphan", "empty")
+        self.assertEqual(len(self.status().staged()), 7)
+        self.assert_matches_git()
+
+    def test_untracked_cache(self):
+        git(self.repo, "config", "core.untrackedCache", "true")
+        git(self.repo, "config", "status.showUntrackedFiles", "all")
+        self.write("a/untracked.txt", "\n")
+        self.write("new/folder/file.txt", "\n")
+        self.write(".gitignore", "*.log\n")
+        self.write("a/ignored.log", "\n")
+        self.backdate()
+        git(self.repo, "status")
+
+        self.assertEqual(
+            self.status().untracked(self.repo), [b".gitignore", b"a/untracked.txt", b"new/folder/file.txt"]
+        )
+        self.assert_matches_git()
+
+        # relative to the current folder, like ls-files
+        self.assertEqual(self.builtin("untracked_files", cwd=os.path.join(self.repo, "a")), "untracked.txt")
+
+        # a new file makes the cache out of date until git status runs again
+        self.write("a/another.txt", "\n")
+        with self.assertRaises(git_index.NeedsGit):
+            self.status().untracked(self.repo)
+        self.assert_matches_git()
+
+    def test_falls_back_to_git(self):
+        # intent to add entries and attributes that convert files aren't compared natively
+        self.write("added.txt", "\n")
+        git(self.repo, "add", "-N", "added.txt")
+        with self.assertRaises(git_index.NeedsGit):
+            self.status().modified()
+        self.assert_matches_git()
+
+        git(self.repo, "reset", "-q")
+        self.write(".git/info/attributes", "*.txt text eol=crlf\n")
+        os.utime(os.path.join(self.repo, "top.txt"), (0, 0))
+        with self.assertRaises(git_index.NeedsGit):
+            self.status().modified()
+        self.assert_matches_git()
+
+    def test_config_includes(self):
+        self.write("café.txt", "changed\n")
+        git(self.repo, "add", "café.txt")
+        self.write(".git/extra/config", "[core]\n\tquotePath = false\n")
+        git(self.repo, "config", "include.path", "extra/config")
+        self.assertEqual(self.status().config()["core.quotepath"], "false")
+        self.assertEqual(self.builtin("staged_files"), "café.txt")
+        self.assert_matches_git()
+
+        # conditional includes are left to git, asked once per query however many files are listed
+        git(self.repo, "config", "includeIf.gitdir:/nowhere/.path", "other")
+        for path in ("top.txt", "a/one.txt", "c/three.txt"):
+            self.write(path, "changed\n")
+        git_index.reset()
+        runs = []
+        original = subprocess.run
+
+        def counting_run(command, *args, **kwargs):
+            runs.append(command)
+            return original(command, *args, **kwargs)
+
+        git_index.subprocess.run = counting_run
+        try:
+            self.builtin("modified_files")
+            self.builtin("staged_files")
+            self.builtin("status_summary")
+        finally:
+            git_index.subprocess.run = original
+        self.assertEqual([run for run in runs if run[:2] == ["git", "config"]], [["git", "config", "core.quotepath"]])
+
+    def test_quote_path(self):
+        self.assertEqual(git_index.quote_path(b"plain/path.txt"), "plain/path.txt")
+        self.assertEqual(git_index.quote_path(b'a "b"\tc\\d'), '"a \\"b\\"\\tc\\\\d"')
+        self.assertEqual(git_index.quote_path("café".encode()), '"caf\\303\\251"')
+        self.assertEqual(git_index.quote_path("café".encode(), quote_non_ascii=False), "café")
+
+
+if __name__ == "__main__":
+    unittest.main()
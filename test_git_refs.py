@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import git_refs
+import git_builtins
+import git_state_cache
+
+GIT = shutil.which("git")
+
+
+def git(cwd, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME="t", GIT_AUTHOR_EMAIL="t@t", GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@t")
+    result = subprocess.run(["git", *args], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+class RepoTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repo = os.path.join(self.tmp, "repo")
+        git(self.tmp, "init", "-q", "-b", "main", "repo")
+        git(self.repo, "commit", "-q", "--allow-empty", "-m", "first")
+        git(self.repo, "branch", "feature/a")
+        git(self.repo, "branch", "old")
+        git(self.repo, "tag", "v1.0")
+        git(self.repo, "tag", "-a", "v1.1", "-m", "annotated")
+        git(self.repo, "update-ref", "refs/remotes/origin/main", "HEAD")
+        git(self.repo, "symbolic-ref", "refs/remotes/origin/HEAD", "refs/remotes/origin/main")
+
+        # mix packed and loose refs
+        git(self.repo, "pack-refs", "--all")
+        git(self.repo, "commit", "-q", "--allow-empty", "-m", "second")
+        git(self.repo, "branch", "loose")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def builtin(self, name, cwd=None):
+        cwd_before = os.getcwd()
+        os.chdir(cwd or self.repo)
+        try:
+            return git_builtins.run(name)
+        finally:
+            os.chdir(cwd_before)
+
+
+@unittest.skipIf(GIT is None, "needs git")
+class TestGitRefs(RepoTestCase):
+    def test_matches_git(self):
+        self.assertEqual(self.builtin("current_branch"), git(self.repo, "branch", "--show-current").strip())
+        self.assertEqual(self.builtin("head"), git(self.repo, "rev-parse", "HEAD").strip())
+        self.assertEqual(self.builtin("local_branches").splitlines(), ["feature/a", "loose", "old"])
+        self.assertEqual(self.builtin("remote_branches").splitlines(), [line.strip() for line in git(self.repo, "branch", "-r").splitlines()])
+        self.assertEqual(self.builtin("tags").splitlines(), ["v1.1", "v1.0"])
+
+    def test_sees_updates(self):
+        self.assertNotIn("new", self.builtin("local_branches").splitlines())
+        git(self.repo, "branch", "new")
+        git(self.repo, "branch", "-D", "old")
+        self.assertEqual(self.builtin("local_branches").splitlines(), ["feature/a", "loose", "new"])
+
+        git(self.repo, "checkout", "-q", "--detach")
+        self.assertEqual(self.builtin("current_branch"), "")
+        self.assertEqual(self.builtin("head"), git(self.repo, "rev-parse", "HEAD").strip())
+
+    def test_worktree(self):
+        worktree = os.path.join(self.tmp, "worktree")
+        git(self.repo, "worktree", "add", "-q", worktree, "old")
+
+        git_dir, common_dir = git_refs.find_git_dirs(os.path.join(worktree))
+        self.assertEqual(os.path.realpath(common_dir), os.path.realpath(os.path.join(self.repo, ".git")))
+        self.assertEqual(self.builtin("current_branch", cwd=worktree), "old")
+        self.assertEqual(self.builtin("local_branches", cwd=worktree).splitlines(), ["feature/a", "loose", "main"])
+
+    def test_outside_repo(self):
+        self.assertIsNone(git_refs.find_git_dirs(self.tmp))
+
+
+@unittest.skipIf(GIT is None, "needs git")
+class TestGitStateCache(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.env = os.environ.get('alfred_workflow_cache')
+        os.environ['alfred_workflow_cache'] = os.path.join(self.tmp, "cache")
+        git_state_cache.reset_stats()
+
+    def tearDown(self):
+        if self.env is None:
+            del os.environ['alfred_workflow_cache']
+        else:
+            os.environ['alfred_workflow_cache'] = self.env
+        super().tearDown()
+
+    def lookup(self, kind, command):
+        output, fingerprint = git_state_cache.load(self.repo, kind, command)
+        if output is None:
+            output = f"ran {command}"
+            git_state_cache.store(self.repo, kind, command, output, fingerprint)
+        return output
+
+    def test_hit_until_repo_changes(self):
+        self.lookup("index", "staged")
+        self.lookup("refs", "log")
+        self.lookup("index", "staged")
+        self.lookup("refs", "log")
+        self.assertEqual(git_state_cache.stats, {"hits": 2, "misses": 2})
+
+        with open(os.path.join(self.repo, "file.txt"), "w") as file:
+            file.write("new")
+        git(self.repo, "add", "file.txt")
+        self.lookup("index", "staged")
+        self.lookup("refs", "log")
+        self.assertEqual(git_state_cache.stats, {"hits": 3, "misses": 3})
+
+        git(self.repo, "commit", "-q", "-m", "third")
+        self.lookup("refs", "log")
+        self.assertEqual(git_state_cache.stats, {"hits": 3, "misses": 4})
+
+    def test_unknown_kind_is_not_cached(self):
+        self.lookup("sometimes", "log")
+        self.assertEqual(git_state_cache.load(self.repo, "sometimes", "log"), (None, None))
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import unittest
+
+import git_status
+from test_git_refs import GIT, git, RepoTestCase
+
+SAMPLE = b"\0".join([
+    b"# branch.oid 1234567890123456789012345678901234567890",
+    b"# branch.head main",
+    b"# branch.upstream origin/main",
+    b"# branch.ab +2 -1",
+    b"1 M. N... 100644 100644 100644 aaaa bbbb staged.txt",
+    b"1 .M N... 100644 100644 100644 aaaa aaaa with space.txt",
+    b"1 MM N... 100644 100644 100644 aaaa bbbb both.txt",
+    b"2 R. N... 100644 100644 100644 aaaa aaaa R100 new name.txt",
+    b"old name.txt",
+    b"u UU N... 100644 100644 100644 100644 aaaa bbbb cccc conflict.txt",
+    b"? sub/untracked.txt",
+    b"? untracked.txt",
+    b"",
+])
+
+
+class TestStatusSnapshot(unittest.TestCase):
+    def test_parse(self):
+        snapshot = git_status.StatusSnapshot(SAMPLE, "/repo")
+        self.assertEqual(snapshot.branch, "main")
+        self.assertEqual((snapshot.upstream, snapshot.ahead, snapshot.behind), ("origin/main", 2, 1))
+        self.assertEqual(snapshot.paths("staged", "/repo"), [b"both.txt", b"conflict.txt", b"new name.txt", b"staged.txt"])
+        self.assertEqual(snapshot.paths("modified", "/repo"), [b"both.txt", b"conflict.txt", b"with space.txt"])
+        self.assertEqual(snapshot.paths("conflicted", "/repo"), [b"conflict.txt"])
+        self.assertEqual(snapshot.paths("untracked", "/repo"), [b"sub/untracked.txt", b"untracked.txt"])
+        self.assertEqual(snapshot.paths("untracked", "/repo/sub"), [b"untracked.txt"])
+
+    def test_upstream_status(self):
+        snapshot = git_status.StatusSnapshot(b"# branch.oid (initial)\0# branch.head (detached)\0")
+        self.assertIsNone(snapshot.branch)
+        self.assertIsNone(snapshot.oid)
+        self.assertIsNone(snapshot.upstream_status())
+
+        snapshot.upstream = "origin/main"
+        self.assertEqual(snapshot.upstream_status(), "Your branch is based on 'origin/main', but the upstream is gone.")
+        snapshot.ahead, snapshot.behind = 0, 1
+        self.assertEqual(
+            snapshot.upstream_status(), "Your branch is behind 'origin/main' by 1 commit, and can be fast-forwarded."
+        )
+
+
+@unittest.skipIf(GIT is None, "needs git")
+class TestGitStatus(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        git_status.reset()
+        git(self.repo, "remote", "add", "origin", self.repo)
+        git(self.repo, "branch", "--set-upstream-to", "origin/main")
+
+    def git_status_line(self):
+        lines = git(self.repo, "status").splitlines()
+        return next((line for line in lines if "branch is" in line), "!! no remote branch linked yet")
+
+    def test_upstream_matches_git_status(self):
+        # `second` isn't on origin/main yet
+        self.assertEqual(self.builtin("upstream_status"), self.git_status_line())
+
+        git(self.repo, "update-ref", "refs/remotes/origin/main", "HEAD")
+        git_status.reset()
+        self.assertEqual(self.builtin("upstream_status"), self.git_status_line())
+
+        git(self.repo, "reset", "-q", "--hard", "HEAD~1")
+        git_status.reset()
+        self.assertEqual(self.builtin("upstream_status"), self.git_status_line())
+
+    def test_one_status_per_query(self):
+        runs = []
+        original = subprocess.run
+
+        def counting_run(command, *args, **kwargs):
+            runs.append(command)
+            return original(command, *args, **kwargs)
+
+        git_status.subprocess.run = counting_run
+        try:
+            self.assertIs(git_status.for_directory(self.repo), git_status.for_directory(os.path.join(self.repo, ".")))
+            self.builtin("upstream_status")
+            self.builtin("conflicted_files")
+        finally:
+            git_status.subprocess.run = original
+        self.assertEqual(runs, [git_status.COMMAND])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# every keystroke starts a new process (unless the server is running), so imports are paid per query;
+# these are only needed by some queries and must be imported where they're used
+DEFERRED_MODULES = ("copy", "shlex")
+
+# all of the vendored yaml package a read-only load may import, see yaml_loader.py
+YAML_LOADER_MODULES = {
+    "yaml.error", "yaml.tokens", "yaml.events", "yaml.nodes", "yaml.reader", "yaml.scanner", "yaml.parser",
+    "yaml.composer", "yaml.constructor", "yaml.resolver", "yaml.loader",
+}
+
+# the location list query: parses the repo list YAML and lists the locations
+SCRIPT = "\n".join([
+    "import os, sys, git_filtering_internal",
+    "os.environ['input_repo_list'] = '- {title: alpha, path: /tmp/alpha}\\n- {title: beta, path: /tmp/beta}'",
+    "sys.argv = ['git_filtering_internal.py', 'al']",
+    "git_filtering_internal.main()",
+])
+
+
+def import_times(*flags):
+    """
+    Returns:
+        dict: module name -> cumulative import time in microseconds, from `python -X importtime`.
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run([sys.executable, *flags, "-X", "importtime", "-c", SCRIPT], cwd=HERE, env=env, capture_output=True, text=True, check=True)
+    assert '"alpha"' in result.stdout, result.stdout
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_deferred_modules_are_not_imported(self):
+        times = import_times()
+        self.assertIn("git_filtering_internal", times)
+        for name in DEFERRED_MODULES:
+            self.assertNotIn(name, times)
+
+    def test_vendored_yaml_imports_only_the_loader(self):
+        # without site-packages, as with a python that has no PyYAML of its own
+        times = import_times("-S")
+        yaml_modules = {name for name in times if name == "yaml" or name.startswith("yaml.")}
+        self.assertIn("yaml.constructor", yaml_modules)
+        self.assertLessEqual(yaml_modules, YAML_LOADER_MODULES)
+
+
+if __name__ == "__main__":
+    unittest.main()
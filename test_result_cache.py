@@ -0,0 +1,100 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import zsh_pool
+import result_cache
+import git_filtering_internal
+from definitions import ResultItem
+
+# the background refresh runs `zsh -c`; its script is written to run under bash too
+SHELL = shutil.which("zsh") or shutil.which("bash")
+
+
+@unittest.skipIf(SHELL is None, "needs zsh or bash")
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ.update(alfred_workflow_cache=self.tmp, input_subtitle_timeout="0.3", input_subtitle_deadline="0.5")
+        if not shutil.which("zsh"):
+            os.symlink(SHELL, os.path.join(self.tmp, "zsh"))
+            os.environ["PATH"] = self.tmp + os.pathsep + os.environ["PATH"]
+        zsh_pool._pools[()] = zsh_pool.ZshPool([], size=2, shell=SHELL)
+        self.new_query()
+
+    def tearDown(self):
+        zsh_pool._pools.pop(()).close()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmp)
+
+    def new_query(self):
+        git_filtering_internal.command_outputs.clear()
+        git_filtering_internal.needs_rerun = False
+
+    def wait_for(self, key):
+        for _ in range(100):
+            if result_cache.load(key) and not result_cache.is_refreshing(key):
+                return result_cache.load(key)[0]
+            time.sleep(0.05)
+        self.fail("the background refresh didn't land")
+
+    def items(self, *commands):
+        return [ResultItem(command, arg="", autocomplete=command, pending_subtitle_command=command) for command in commands]
+
+    def test_refresh_in_background(self):
+        key = result_cache.key_for("echo refreshed", ())
+        self.assertIsNone(result_cache.load(key))
+        self.assertTrue(result_cache.refresh_in_background(key, "echo refreshed"))
+        self.assertEqual(self.wait_for(key), "refreshed\n")
+        self.assertLess(result_cache.load(key)[1], 5)
+
+        os.environ.pop("alfred_workflow_cache")
+        self.assertFalse(result_cache.refresh_in_background(key, "echo refreshed"))
+
+    def test_failed_refresh_keeps_the_stored_output(self):
+        key = result_cache.key_for("git log", ())
+        result_cache.store(key, "stored\n")
+        self.assertTrue(result_cache.refresh_in_background(key, "echo partial; exit 1"))
+        self.assertEqual(self.wait_for(key), "stored\n")
+        self.assertEqual(os.listdir(result_cache.cache_dir()), [os.path.basename(result_cache._path(key, "out"))])
+
+    def test_slow_subtitle_is_finished_in_the_background(self):
+        slow = "sleep 1; echo slow"
+        items = self.items("echo fast", slow)
+        self.assertTrue(git_filtering_internal.resolve_subtitles(items))
+        self.assertEqual([item.subtitle for item in items], ["fast", git_filtering_internal.SUBTITLE_PLACEHOLDER])
+        self.assertTrue(git_filtering_internal.needs_rerun)
+        self.assertEqual(self.wait_for(result_cache.key_for(slow, ())), "slow\n")
+
+        # the rerun shows the stored output without running the command again
+        self.new_query()
+        runs = []
+        original = zsh_pool.run_batch
+        zsh_pool.run_batch = lambda commands, **kwargs: runs.extend(commands) or original(commands, **kwargs)
+        try:
+            items = self.items("echo fast", slow)
+            self.assertFalse(git_filtering_internal.resolve_subtitles(items))
+        finally:
+            zsh_pool.run_batch = original
+        self.assertEqual([item.subtitle for item in items], ["fast", "slow"])
+        self.assertEqual(runs, ["echo fast"])
+        self.assertFalse(git_filtering_internal.needs_rerun)
+
+        # once it's older than REFRESHED_SUBTITLE_TTL, the command runs again
+        self.new_query()
+        key = result_cache.key_for(slow, ())
+        past = time.time() - git_filtering_internal.REFRESHED_SUBTITLE_TTL
+        os.utime(os.path.join(self.tmp, "results", f"{key}.out"), (past, past))
+        items = self.items(slow)
+        self.assertTrue(git_filtering_internal.resolve_subtitles(items))
+        # the last output stands in for the placeholder
+        self.assertEqual(items[0].subtitle, "slow")
+        self.wait_for(key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import zsh_pool
+import git_filtering_internal
+
+# the pool's worker script is written to run under bash too
+SHELL = shutil.which("zsh") or shutil.which("bash")
+
+
+@unittest.skipIf(SHELL is None, "needs zsh or bash")
+class TestRunCommand(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        zsh_pool._pools[()] = zsh_pool.ZshPool([], size=2, shell=SHELL)
+        git_filtering_internal.command_outputs.clear()
+        # appends a line on every run and prints how many there are
+        self.command = f"echo run >> {zsh_pool.shell_quote(os.path.join(self.tmp, 'runs'))}; wc -l < {zsh_pool.shell_quote(os.path.join(self.tmp, 'runs'))}"
+
+    def tearDown(self):
+        zsh_pool._pools.pop(()).close()
+        git_filtering_internal.command_outputs.clear()
+        shutil.rmtree(self.tmp)
+
+    def runs(self):
+        with open(os.path.join(self.tmp, "runs")) as file:
+            return len(file.readlines())
+
+    def test_once_per_query(self):
+        self.assertEqual(git_filtering_internal.run_command(self.command).strip(), "1")
+        self.assertEqual(git_filtering_internal.run_command(self.command).strip(), "1")
+        self.assertEqual(git_filtering_internal.run_commands([(self.command, None), (self.command, None)]), ["1", "1"])
+        self.assertEqual(self.runs(), 1)
+
+        # a new query runs it again
+        git_filtering_internal.command_outputs.clear()
+        self.assertEqual(git_filtering_internal.run_command(self.command).strip(), "2")
+
+    def test_cache_none_runs_every_time(self):
+        self.assertEqual(git_filtering_internal.run_command(self.command, cache='none').strip(), "1")
+        self.assertEqual(git_filtering_internal.run_command(self.command, cache='none').strip(), "2")
+        outputs = git_filtering_internal.run_commands([(self.command, 'none'), (self.command, 'none')])
+        self.assertEqual(sorted(output.strip() for output in outputs), ["3", "4"])
+        self.assertEqual(self.runs(), 4)
+
+        # nor is its output reused by commands that don't opt out
+        self.assertEqual(git_filtering_internal.run_command(self.command).strip(), "5")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import io
+import os
+import sys
+import json
+import unittest
+import contextlib
+
+import git_filtering_internal
+
+from script_filter_output import ScriptFilterOutput
+from definitions import ResultItem, Modifier, ModifierKey, Text, TextViewAction, TokenizationResult, Location
+
+
+def items():
+    alfred_input = TokenizationResult(location=Location(title="repo", directory="."))
+    mods = [
+        Modifier(arg="git push --force", subtitle="force push", valid=True, key=ModifierKey.CMD),
+        Modifier(arg=None, subtitle="no key", valid=True),
+    ]
+    return [
+        ResultItem("push", arg="git push", subtitle="to origin", alfred_input=alfred_input, valid=True, icon_path="up.png"),
+        ResultItem("héllo \"wörld\"\n", arg="echo '✓'", subtitle=None, alfred_input=alfred_input, should_use_smart_sort=True, quicklookurl="/tmp/a b"),
+        ResultItem("log", arg="", alfred_input=alfred_input, mods=mods, text=Text(copy="c", largetype="L"), type="file"),
+        ResultItem("view", arg="", alfred_input=alfred_input, mods=mods, textview_action=TextViewAction(command="git log ", mods=mods)),
+        ResultItem("empty", arg=None, alfred_input=alfred_input, mods=[Modifier(arg="x")], autocomplete="custom"),
+    ]
+
+
+class TestScriptFilterOutput(unittest.TestCase):
+    def test_items_match_to_dict(self):
+        for item in items():
+            with self.subTest(title=item.title):
+                self.assertEqual(item.to_json(), json.dumps(item.to_dict()))
+
+    def test_stream(self):
+        stream = io.StringIO()
+        output = ScriptFilterOutput(stream)
+        output.add(items()[0])
+        output.extend(items()[1:])
+        output.close(rerun=0.5)
+        self.assertEqual(json.loads(stream.getvalue()), {"items": [item.to_dict() for item in items()], "rerun": 0.5})
+
+    def test_empty(self):
+        stream = io.StringIO()
+        ScriptFilterOutput(stream).close()
+        self.assertEqual(json.loads(stream.getvalue()), {"items": []})
+
+    def test_error_keeps_the_json_valid(self):
+        original = git_filtering_internal.create_result_item_for_location
+
+        def failing(location):
+            if location.title == "beta":
+                raise RuntimeError("broken")
+            return original(location)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        argv, os.environ["input_repo_list"] = sys.argv, "- {title: alpha, path: /tmp/alpha}\n- {title: beta, path: /tmp/beta}"
+        sys.argv = ["git_filtering_internal.py", ""]
+        git_filtering_internal.create_result_item_for_location = failing
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                git_filtering_internal.main()
+        finally:
+            git_filtering_internal.create_result_item_for_location = original
+            sys.argv = argv
+            del os.environ["input_repo_list"]
+
+        items = json.loads(stdout.getvalue())["items"]
+        self.assertEqual([item["title"] for item in items], ["alpha", "Something went wrong"])
+        self.assertEqual(items[1]["subtitle"], "RuntimeError: broken")
+        self.assertIn("Traceback", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
-from git_filtering_internal import tokenize, TokenizationResult, Location, Command
+import git_filtering_internal
+from git_filtering_internal import tokenize, resolve_commands, create_value_commands, best_matches, TokenizationResult, Location, Command, CommandType
+from title_trie import TitleTrie
 
 class TestTokenization(unittest.TestCase):
     # def test_nested_commands(self):
@@ -104,5 +106,134 @@ class TestTokenization(unittest.TestCase):
         self.assertEqual(result.commands[1].title, "feature/blurredBackGround_simple")
         self.assertEqual(result.unfinished_query, "something")
 
+    def test_duplicate_titles_use_the_first(self):
+        commands = [Command(title="main", action="first"), Command(title="main", action="second")]
+        locations = [Location(title="timer", directory=".")]
+
+        result = tokenize("timer main", locations, TitleTrie(commands))
+        self.assertEqual(result.commands[0].action, "first")
+
+    def test_trie_with_base(self):
+        base = TitleTrie([Command(title="checkout", action="base"), Command(title="main", action="base")])
+        trie = TitleTrie([Command(title="main", action="inline"), Command(title="checkout local", action="inline")], base=base)
+        locations = TitleTrie([Location(title="timer", directory="."), Location(title="timer test", directory=".")])
+
+        result = tokenize("timer test checkout local main x", locations, trie, level=2)
+        self.assertEqual(result.location.title, "timer test")
+        self.assertEqual([cmd.action for cmd in result.commands], ["inline", "base"])
+        self.assertEqual(result.unfinished_query, "x")
+
+    def test_expand_only_when_needed(self):
+        commands = [Command(title="checkout", action=""), Command(title="local branches", action="")]
+        locations = [Location(title="timer", directory=".")]
+        calls = []
+
+        def expand():
+            calls.append(1)
+            return [Command(title="main", action=""), Command(title="checkout-old", action="")]
+
+        result = tokenize("timer checkout local branches ", locations, commands, level=2, expand=expand)
+        self.assertEqual([cmd.title for cmd in result.commands], ["checkout", "local branches"])
+        self.assertEqual(calls, [])
+
+        result = tokenize("timer checkout main", locations, commands, level=2, expand=expand)
+        self.assertEqual([cmd.title for cmd in result.commands], ["checkout", "main"])
+
+        # `checkout` doesn't end at a word, so a longer generated title can match
+        result = tokenize("timer checkout-old x", locations, commands, level=1, expand=expand)
+        self.assertEqual([cmd.title for cmd in result.commands], ["checkout-old"])
+        self.assertEqual(len(calls), 2)
+
+    def test_resolve_nested_commands(self):
+        subcommands2 = [Command(title="level 3", action="")]
+        subcommands1 = [Command(title="level 2", action="", subcommands=subcommands2)]
+        commands = [Command(title="subcommands", action="", subcommands=subcommands1), Command(title="level 3 other", action="")]
+        locations = TitleTrie([Location(title="timer", directory="."), Location(title="calc", directory=".")])
+
+        result = resolve_commands("timer subcommands level 2 level", locations, TitleTrie(commands))
+        self.assertEqual(result.location.title, "timer")
+        self.assertEqual([cmd.title for cmd in result.commands], ["subcommands", "level 2"])
+        self.assertEqual(result.unfinished_query, "level")
+
+        # only the children of the previous command can match
+        result = resolve_commands("timer subcommands level 2 level 3 other", locations, TitleTrie(commands))
+        self.assertEqual([cmd.title for cmd in result.commands], ["subcommands", "level 2", "level 3"])
+        self.assertEqual(result.unfinished_query, "other")
+
+    def test_value_commands_reference_their_template(self):
+        subcommands = [Command(title="details", action="")]
+        template = Command(title="tags", action="git checkout [input]", subtitle="a tag", values=["v1", " v2 "], command_type=CommandType.NEEDS_SELECTION, subcommands=subcommands, subtitle_command="slow")
+
+        values = create_value_commands(template)
+        self.assertEqual([cmd.title for cmd in values], ["v1", "v2"])
+        self.assertEqual([cmd.action for cmd in values], ["git checkout v1", "git checkout v2"])
+        self.assertEqual(values[0].command_type, CommandType.SINGLE_ACTION)
+        self.assertEqual(values[0].subtitle, "a tag")
+        self.assertIs(values[0].subcommands, subcommands)
+        self.assertFalse(values[0].has_values())
+
+        values[0].subtitle_command = None
+        self.assertEqual(template.subtitle_command, "slow")
+        self.assertEqual(values[1].subtitle_command, "slow")
+
+    def test_best_matches(self):
+        def matches(query, values, limit, subtitle=lambda value: ""):
+            git_filtering_internal.alfred_input = TokenizationResult(unfinished_query=query)
+            return best_matches(values, lambda value: value, subtitle, limit)
+
+        values = ["item 1", "item 99", "item 199", "99 items", "other", "item 990"]
+        self.assertEqual(matches("", values, 2), ["item 1", "item 99"])
+        self.assertEqual(matches("99", values, None), ["item 99", "item 199", "99 items", "item 990"])
+        # the title starting with the query, then the words starting with it, shown in their original order
+        self.assertEqual(matches("99", values, 3), ["item 99", "99 items", "item 990"])
+        self.assertEqual(matches("oth", values, 3, subtitle=lambda value: "other" if value == "item 1" else ""), ["item 1", "other"])
+
+    def test_cache_settings(self):
+        for cache in ("refs", "index", "background", "none"):
+            commands = git_filtering_internal.create_commands_from_yaml([{"title": "log", "command": "git log", "cache": cache}])
+            self.assertEqual(commands[0].cache, cache)
+        with self.assertRaises(ValueError):
+            git_filtering_internal.create_commands_from_yaml([{"title": "log", "command": "git log", "cache": "always"}])
+
+    def test_max_results(self):
+        # unbounded unless the command or the workflow asks for a limit
+        self.assertIsNone(git_filtering_internal.max_results(Command(title="search", action="")))
+        self.assertEqual(git_filtering_internal.max_results(Command(title="log", action="", max_results=50)), 50)
+        self.assertIsNone(git_filtering_internal.max_results(Command(title="log", action="", max_results=0)))
+
+        for limit in (0, 20):
+            commands = git_filtering_internal.create_commands_from_yaml([{"title": "log", "command": "git log", "max_results": limit}])
+            self.assertEqual(commands[0].max_results, limit)
+        for limit in ("20", 20.5, -1, True):
+            with self.assertRaises(ValueError):
+                git_filtering_internal.create_commands_from_yaml([{"title": "log", "command": "git log", "max_results": limit}])
+
+    def test_matching_result_items_run_only_the_subtitles_they_need(self):
+        location = Location(title="timer", directory=".")
+        commands = [
+            Command(title="push", action="git push", subtitle_command="echo push"),
+            Command(title="pull", action="git pull", subtitle_command="echo pull"),
+            Command(title="ahead", action="git log", subtitle_command="echo 2 to push", should_filter_by_subtitle_command=True),
+            Command(title="behind", action="git log", subtitle_command="echo clean", should_filter_by_subtitle_command=True),
+        ]
+        git_filtering_internal.alfred_input = TokenizationResult(location=location, unfinished_query="push")
+
+        runs = []
+
+        def run_commands(jobs, timeout=None, deadline=None):
+            runs.extend(command for command, _ in jobs)
+            return [command[len("echo "):] for command, _ in jobs]
+
+        original = git_filtering_internal.run_commands
+        git_filtering_internal.run_commands = run_commands
+        try:
+            items = git_filtering_internal.create_matching_result_items(commands, location)
+        finally:
+            git_filtering_internal.run_commands = original
+
+        # `pull` doesn't match, so its subtitle isn't run; the opted in commands match on their subtitle's output
+        self.assertEqual(runs, ["echo push", "echo 2 to push", "echo clean"])
+        self.assertEqual([(item.title, item.subtitle) for item in items], [("push", "push"), ("ahead", "2 to push")])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+import yaml_loader
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONFIGS = ("actions.yaml", "experimental_actions.yaml")
+
+
+# picks the package before anything imports `yaml` the usual way (which finds the vendored copy first)
+LOADER = yaml_loader.loader_class()
+yaml = sys.modules['yaml']
+
+
+@unittest.skipIf(LOADER is yaml.SafeLoader, "needs PyYAML with libyaml")
+class TestLibyamlParity(unittest.TestCase):
+    def test_configs_load_the_same(self):
+        for name in CONFIGS:
+            with open(os.path.join(HERE, name), 'r') as file:
+                text = file.read()
+            with self.subTest(config=name):
+                self.assertEqual(yaml_loader.safe_load(text), yaml.load(text, Loader=yaml.SafeLoader))
+                with open(os.path.join(HERE, name), 'r') as file:
+                    self.assertEqual(yaml_loader.safe_load(file), yaml.load(text, Loader=yaml.SafeLoader))
+
+    def test_errors_are_yaml_errors(self):
+        with self.assertRaises(yaml.YAMLError):
+            yaml_loader.safe_load("- {title: a, path: [")
+
+
+class TestSystemPackage(unittest.TestCase):
+    def test_vendored_copy_is_skipped(self):
+        path = sys.path
+        sys.path = [HERE]
+        try:
+            self.assertIsNone(yaml_loader._system_package_folder())
+        finally:
+            sys.path = path
+
+        folder = yaml_loader._system_package_folder()
+        if folder is not None:
+            self.assertNotEqual(os.path.realpath(folder), os.path.realpath(yaml_loader.VENDORED))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import time
+import shutil
+import unittest
+
+import zsh_pool
+from zsh_pool import ZshPool, WorkerError, shell_quote
+
+# the worker script is written to run under bash too, which keeps these tests runnable without zsh
+SHELL = shutil.which("zsh") or shutil.which("bash")
+
+
+@unittest.skipIf(SHELL is None, "needs zsh or bash")
+class TestZshPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ZshPool([], size=2, shell=SHELL)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_stdout_stderr_and_status(self):
+        result = self.pool.run("echo out; echo err >&2; exit 3")
+        self.assertEqual(result.stdout, "out")
+        self.assertEqual(result.stderr, "err")
+        self.assertEqual(result.returncode, 3)
+
+    def test_quoting_and_multibyte_output(self):
+        result = self.pool.run("printf '%s\\n' \"it's\" 'héllo wörld'; printf 'tab\\there'")
+        self.assertEqual(result.stdout, "it's\nhéllo wörld\ntab\there")
+        self.assertEqual(result.returncode, 0)
+
+    def test_commands_do_not_leak_state(self):
+        self.pool.run("cd /; export GIT_PLUS_TEST=1")
+        result = self.pool.run("echo \"${GIT_PLUS_TEST:-unset}\"")
+        self.assertEqual(result.stdout, "unset")
+
+    def test_timeout_kills_worker(self):
+        with self.assertRaises(TimeoutError):
+            self.pool.run("sleep 5", timeout=0.2)
+        self.assertEqual(self.pool.run("echo next").stdout, "next")
+
+    def test_shell_quote_is_single_line(self):
+        self.assertEqual(shell_quote("a\nb'c\\"), "$'a\\nb\\'c\\\\'")
+
+    def test_batch_keeps_order_and_status(self):
+        results = self.pool.run_batch(["echo one", "echo two >&2; exit 1", "printf 'multi\\nline'"])
+        self.assertEqual([result.stdout for result in results], ["one", "", "multi\nline"])
+        self.assertEqual([result.returncode for result in results], [0, 1, 0])
+        self.assertEqual(results[1].stderr, "two")
+
+    def test_batch_returns_what_finished_before_the_deadline(self):
+        results = self.pool.run_batch(["echo fast", "sleep 5", "echo never"], deadline=time.monotonic() + 0.5)
+        self.assertEqual(results[0].stdout, "fast")
+        self.assertEqual(results[1:], [None, None])
+        self.assertEqual(self.pool.run("echo next").stdout, "next")
+
+    def test_batch_keeps_what_finished_when_the_worker_dies(self):
+        # `$$` is the worker itself, not the command's subshell
+        with self.assertRaises(WorkerError) as raised:
+            self.pool.run_batch(["echo one", "kill -9 $$", "echo three"])
+        self.assertEqual([result.stdout for result in raised.exception.results], ["one"])
+
+        # only the commands that didn't start are run again, in new shells; all three share one worker
+        rerun = []
+        original = zsh_pool._run_in_new_shell
+        os.environ["input_zsh_pool_size"] = "1"
+        zsh_pool._pools[()] = self.pool
+        zsh_pool._run_in_new_shell = lambda command, source_paths, timeout: rerun.append(command) or command
+        try:
+            results = zsh_pool.run_batch(["echo one", "kill -9 $$", "echo three"])
+        finally:
+            zsh_pool._run_in_new_shell = original
+            del zsh_pool._pools[()]
+            del os.environ["input_zsh_pool_size"]
+        self.assertEqual(results[0].stdout, "one")
+        # the one that was running may have had side effects, so it isn't run again
+        self.assertEqual(results[1].returncode, -1)
+        self.assertEqual(results[2], "echo three")
+        self.assertEqual(rerun, ["echo three"])
+
+    def test_command_the_worker_started_is_not_run_again(self):
+        rerun = []
+        original = zsh_pool._run_in_new_shell
+        zsh_pool._pools[()] = self.pool
+        zsh_pool._run_in_new_shell = lambda command, source_paths, timeout: rerun.append(command)
+        try:
+            result = zsh_pool.run("kill -9 $$")
+        finally:
+            zsh_pool._run_in_new_shell = original
+            del zsh_pool._pools[()]
+        self.assertEqual(result.returncode, -1)
+        self.assertEqual(rerun, [])
+
+    def test_no_positional_parameters(self):
+        result = self.pool.run("echo \"$#:$1:$@\"")
+        self.assertEqual(result.stdout, "0::")
+        self.assertEqual(self.pool.run_batch(["echo $#", "echo $#"])[1].stdout, "0")
+
+
+if __name__ == '__main__':
+    unittest.main()
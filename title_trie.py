@@ -0,0 +1,49 @@
+# marks the end of a title in a node; every other key is a single character
+_END = ''
+
+
+class TitleTrie:
+    """
+    A prefix tree of titles that finds the longest title a query starts with, in O(query length).
+
+    When titles are duplicated, the item inserted first wins. `base` is searched too, as if its titles
+    had been inserted first; it lets a small per-query trie (e.g. inline values) extend a cached one.
+    """
+
+    def __init__(self, items=(), base=None):
+        self.root = {}
+        self.base = base
+        for item in items:
+            self.insert(item.title, item)
+
+    def insert(self, title, item):
+        node = self.root
+        for char in title:
+            node = node.setdefault(char, {})
+        node.setdefault(_END, item)
+
+    def match(self, text):
+        """
+        Returns:
+            tuple: `(length, item)` of the longest title `text` starts with, or `(-1, None)`.
+        """
+        length, item = -1, None
+        node = self.root
+        if _END in node:
+            length, item = 0, node[_END]
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if _END in node:
+                length, item = i + 1, node[_END]
+
+        if self.base is not None:
+            base_length, base_item = self.base.match(text)
+            if base_length >= length:
+                return base_length, base_item
+
+        return length, item
+
+    def longest_prefix(self, text):
+        return self.match(text)[1]
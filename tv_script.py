@@ -2,8 +2,10 @@ import sys
 import random
 import json
 import os
+import shlex
 import subprocess
 
+import git_hunks
 from definitions import Modifier, ModifierKey
 
 def get_env_variable(var_name, default=None):
@@ -24,7 +26,7 @@ def get_modifiers_from_env():
             )
     return modifiers
 
-def get_full_command(command):
+def get_source_paths():
     functions_path = os.getenv('input_var_functions_path')
     profile_path = os.getenv('input_var_profile_path')
 
@@ -35,12 +37,10 @@ def get_full_command(command):
         profile_path = os.path.join(os.getcwd(), profile_path)
 
     # Only source if the file exists
-    source_cmds = []
-    if profile_path and os.path.isfile(profile_path):
-        source_cmds.append(f"source '{profile_path}'")
-    if functions_path and os.path.isfile(functions_path):
-        source_cmds.append(f"source '{functions_path}'")
+    return [path for path in (profile_path, functions_path) if path and os.path.isfile(path)]
 
+def get_full_command(command):
+    source_cmds = [f"source '{path}'" for path in get_source_paths()]
     full_command = ";\n".join(source_cmds + [command])
 
     # Find the line with "cd " and ends with ";" and add a space before it - so that the output is easier to read
@@ -51,12 +51,68 @@ def get_full_command(command):
 
     return "\n".join(lines)
 
+# functions.sh functions that are run without a shell, see `run_in_process`
+IN_PROCESS = {'view_hunk': git_hunks.view, 'view_hunks': git_hunks.listing}
+
+# characters zsh treats specially outside quotes
+SHELL_CHARACTERS = set("$`\\;|&<>(){}[]*?~!#\"'")
+
+def is_plain_command(command):
+    """
+    Returns whether a one line command has no expansions, globs or operators, so that `shlex.split` gives the
+    same arguments as zsh.
+    """
+    if "\n" in command:
+        return False
+    lexer = shlex.shlex(command, posix=False, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        return False
+    for token in tokens:
+        quoted = len(token) > 1 and token[0] == token[-1] and token[0] in "'\""
+        if quoted and (token[0] == "'" or not any(char in "$`\\!\"" for char in token[1:-1])):
+            continue
+        if any(char in SHELL_CHARACTERS for char in token):
+            return False
+    return True
+
+def run_in_process(command):
+    """
+    Runs a text view command that is only `cd <repo>;` and a call to one of `IN_PROCESS` (e.g. a hunk view)
+    directly, so it needs a single git call.
+
+    Returns:
+        str: the output, or None if the command needs a shell.
+    """
+    cd, _, call = command.partition(";")
+    cd, call = cd.strip(), call.strip().replace('"$tv_input"', shlex.quote(os.environ.get("tv_input", "")))
+    if not call or not is_plain_command(cd) or not is_plain_command(call):
+        return None
+    cd_args, call_args = shlex.split(cd), shlex.split(call)
+    if len(cd_args) != 2 or cd_args[0] != "cd" or call_args[0] not in IN_PROCESS:
+        return None
+
+    try:
+        os.chdir(cd_args[1])
+        return IN_PROCESS[call_args[0]](*(arg or None for arg in call_args[1:])).strip()
+    except (OSError, KeyError, TypeError):
+        # e.g. a folder that's gone or the wrong arguments, which the shell reports
+        return None
+
 def run_command(command):
+    in_process_output = run_in_process(command)
+    if in_process_output is not None:
+        return in_process_output
+
+    # a text view runs one command per process, so there's no warm zsh to reuse
+    full_command = get_full_command(command)
     try:
-        result = subprocess.run(["zsh", "-c", command], capture_output=True, text=True, check=True)
+        result = subprocess.run(["zsh", "-c", full_command], capture_output=True, text=True, check=True)
         return result.stdout.strip()
     except subprocess.CalledProcessError as e:
-        return f"Error executing {command}: {e.stderr}"
+        return f"Error executing {full_command}: {e.stderr}"
 
 
 def build_footer_from_mods(mods, is_alfred_stacked=True):
@@ -84,7 +140,9 @@ def build_footer_from_mods(mods, is_alfred_stacked=True):
 
 def run(argv):
 
-    # typed_query = argv[1] if len(argv) > 1 else None
+    # what's typed in the text view, for the command and the mods as `$tv_input` (e.g. the hunks to stage)
+    typed_query = argv[1] if len(argv) > 1 else ""
+    os.environ["tv_input"] = typed_query
 
     command = get_env_variable("tv_command")
     should_rerun = bool(int(get_env_variable("should_rerun", default=1)))
@@ -98,7 +156,7 @@ def run(argv):
     full_command = get_full_command(command)
 
     if not should_rerun:
-        output = run_command(full_command) if command else 'None'
+        output = run_command(command) if command else 'None'
         output = f"```\n{output}\n```"
     else:
         output = f"### Running command...\n```\n{full_command}\n```"
@@ -115,6 +173,7 @@ def run(argv):
     result = {
         "variables": {
             "should_rerun": False,
+            "tv_input": typed_query,
         },
         "response": output,
         "footer": build_footer_from_mods(mods, is_alfred_stacked=is_alfred_stacked),
@@ -0,0 +1,131 @@
+import os
+import re
+import sys
+
+# yaml is imported on first use: most queries are answered from caches without parsing any YAML
+
+# the oldest PyYAML whose libyaml bindings are used; 5.4 moved them into the package as `yaml._yaml`
+MIN_SYSTEM_VERSION = (5, 4)
+
+# the vendored copy, which has no compiled bindings
+VENDORED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yaml')
+
+# the loader class picked by `loader_class`, once per process
+_loader = None
+
+
+def __getattr__(name):
+    # `except yaml_loader.YAMLError` only looks the class up when an exception is being handled
+    if name == 'YAMLError':
+        return _package().error.YAMLError
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _system_package_folder():
+    """
+    Returns the folder of a PyYAML installed outside the workflow that has its libyaml bindings and is at least
+    `MIN_SYSTEM_VERSION`, or None. The vendored copy comes first on sys.path, so it's searched for past it.
+    """
+    import importlib.machinery
+
+    paths = [entry for entry in sys.path if os.path.realpath(os.path.join(entry or os.getcwd(), 'yaml')) != os.path.realpath(VENDORED)]
+    spec = importlib.machinery.PathFinder.find_spec('yaml', paths)
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    folder = spec.submodule_search_locations[0]
+
+    try:
+        with open(os.path.join(folder, '__init__.py'), 'r', encoding='utf-8') as file:
+            version = re.search(r"^__version__ = '(\d+)\.(\d+)", file.read(), re.MULTILINE)
+    except OSError:
+        return None
+    if not version or tuple(int(part) for part in version.groups()) < MIN_SYSTEM_VERSION:
+        return None
+
+    names = os.listdir(folder)
+    if not any(f"_yaml{suffix}" in names for suffix in importlib.machinery.EXTENSION_SUFFIXES):
+        return None
+    return folder
+
+
+def _import_system_package(folder):
+    """
+    Imports the PyYAML in `folder` as `yaml`, all of it, so its bindings only ever see their own package.
+
+    Returns:
+        module or None: the package, or None (and nothing imported) if it doesn't have working bindings.
+    """
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location('yaml', os.path.join(folder, '__init__.py'), submodule_search_locations=[folder])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['yaml'] = package
+    try:
+        spec.loader.exec_module(package)
+        if package.__with_libyaml__:
+            return package
+    except Exception:
+        pass
+    for name in [name for name in sys.modules if name == 'yaml' or name.startswith('yaml.')]:
+        del sys.modules[name]
+    return None
+
+
+def _import_vendored_loader():
+    """
+    Imports the vendored package as `yaml` with only what loading needs (reader, scanner, parser, composer,
+    constructor, resolver). Its `__init__`, which imports the dumpers too, only runs once something else is
+    used, e.g. `yaml.dump`.
+    """
+    import importlib
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location('yaml', os.path.join(VENDORED, '__init__.py'), submodule_search_locations=[VENDORED])
+    package = importlib.util.module_from_spec(spec)
+
+    def complete(name):
+        del package.__getattr__
+        spec.loader.exec_module(package)
+        return getattr(package, name)
+
+    package.__getattr__ = complete
+    sys.modules['yaml'] = package
+    importlib.import_module('yaml.loader')
+    return package
+
+
+def _package():
+    package = sys.modules.get('yaml')
+    if package is None:
+        folder = _system_package_folder()
+        package = folder and _import_system_package(folder)
+        if package is None:
+            package = _import_vendored_loader()
+    return package
+
+
+def loader_class():
+    """
+    Returns the loader used for the workflow's YAML: the `CSafeLoader` of a system PyYAML with libyaml when
+    there is one, otherwise the vendored pure-Python `SafeLoader`. Both build the same data.
+    """
+    global _loader
+    if _loader is None:
+        package = _package()
+        # read from the namespace: the vendored package would run its whole `__init__` to look it up
+        if vars(package).get('__with_libyaml__'):
+            _loader = package.CSafeLoader
+        else:
+            _loader = package.loader.SafeLoader
+    return _loader
+
+
+def safe_load(stream):
+    """
+    Same as `yaml.safe_load`, using `loader_class()`. Errors are still `yaml.YAMLError`s.
+    """
+    loader = loader_class()(stream)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
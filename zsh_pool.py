@@ -0,0 +1,438 @@
+import os
+import time
+import atexit
+import select
+import signal
+import threading
+import subprocess
+
+# a worker is restarted after this many commands so a leaky profile/functions file can't build up state
+DEFAULT_MAX_COMMANDS = 50
+DEFAULT_POOL_SIZE = 4
+
+# The worker reads one line of shell code per request, e.g. `__gp_run $'git status'`. Each command runs in
+# a subshell (so `cd`, variables and `exit` don't leak into the next one) and is answered with a frame:
+#
+#   <sentinel> <exit status> <stdout bytes> <stderr bytes>\n<stdout><stderr><sentinel>\n
+#
+# It is written to run under both zsh and bash.
+_WORKER_SCRIPT = """
+{sources}
+__gp_frame() {{
+  local __gp_cmd="$1" __gp_out __gp_err __gp_status
+  # the command sees no positional parameters, as under `zsh -c`
+  set --
+  __gp_out=$( (eval "$__gp_cmd") 2>{errfile} </dev/null )
+  __gp_status=$?
+  __gp_err=$(<{errfile})
+  local LC_ALL=C
+  printf '%s %d %d %d\\n' {sentinel} "$__gp_status" "${{#__gp_out}}" "${{#__gp_err}}"
+  printf '%s%s%s\\n' "$__gp_out" "$__gp_err" {sentinel}
+}}
+__gp_run() {{
+  local __gp_cmd
+  for __gp_cmd in "$@"; do
+    __gp_frame "$__gp_cmd"
+  done
+}}
+while IFS= read -r __gp_line; do
+  eval "$__gp_line"
+done
+"""
+
+_QUOTE_TABLE = {i: f"\\x{i:02x}" for i in range(32)}
+_QUOTE_TABLE.update({ord('\\'): '\\\\', ord("'"): "\\'", ord('\n'): '\\n', ord('\t'): '\\t', 127: '\\x7f'})
+
+
+def shell_quote(text):
+    """
+    Quotes `text` as a single-line `$'...'` string, which both zsh and bash understand.
+    """
+    return "$'" + text.translate(_QUOTE_TABLE) + "'"
+
+
+class WorkerError(Exception):
+    # whether the commands had reached the worker (which may have started them), and what a batch's worker
+    # finished before it failed, see `ZshPool.run_batch`
+    sent = False
+    results = []
+
+
+class CommandResult:
+    def __init__(self, stdout, stderr, returncode):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+
+    def __repr__(self):
+        return f"CommandResult(returncode={self.returncode!r}, stdout={self.stdout!r})"
+
+
+class ZshWorker:
+    def __init__(self, shell, source_paths):
+        import tempfile
+
+        self.cwd = os.getcwd()
+        self.env_key = environment_key()
+        self.commands_run = 0
+        self.buffer = b''
+
+        self.sentinel = os.urandom(12).hex().encode('ascii')
+        fd, self.errfile = tempfile.mkstemp(prefix="git-plus-", suffix=".err")
+        os.close(fd)
+
+        sources = "\n".join(f"source {shell_quote(path)}" for path in source_paths)
+        script = _WORKER_SCRIPT.format(
+            sources=sources,
+            errfile=shell_quote(self.errfile),
+            sentinel=self.sentinel.decode('ascii')
+        )
+
+        self.proc = subprocess.Popen(
+            [shell, "-c", script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+    def _read_until(self, predicate, deadline):
+        fd = self.proc.stdout.fileno()
+        while True:
+            result = predicate()
+            if result is not None:
+                return result
+
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    raise TimeoutError()
+
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                raise TimeoutError()
+
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise WorkerError("worker exited")
+            self.buffer += chunk
+
+    def _read_frame(self, deadline):
+        def header():
+            end = self.buffer.find(b'\n')
+            return end if end != -1 else None
+
+        end = self._read_until(header, deadline)
+        parts = self.buffer[:end].split(b' ')
+        if len(parts) != 4 or parts[0] != self.sentinel:
+            raise WorkerError("unexpected output from worker")
+
+        returncode, out_size, err_size = (int(part) for part in parts[1:])
+        self.buffer = self.buffer[end + 1:]
+
+        trailer = self.sentinel + b'\n'
+        total = out_size + err_size
+        self._read_until(lambda: True if len(self.buffer) >= total + len(trailer) else None, deadline)
+        payload, self.buffer = self.buffer[:total], self.buffer[total:]
+
+        # the sizes are counted by the shell, so make sure they really ended where the frame does
+        if not self.buffer.startswith(trailer):
+            raise WorkerError("unexpected output from worker")
+        self.buffer = self.buffer[len(trailer):]
+
+        return CommandResult(
+            stdout=payload[:out_size].decode('utf-8', errors='replace'),
+            stderr=payload[out_size:].decode('utf-8', errors='replace'),
+            returncode=returncode
+        )
+
+    def send(self, commands):
+        line = "__gp_run " + " ".join(shell_quote(command) for command in commands) + "\n"
+        try:
+            self.proc.stdin.write(line.encode('utf-8'))
+            self.proc.stdin.flush()
+        except OSError as e:
+            raise WorkerError(str(e))
+        self.commands_run += len(commands)
+
+    def run(self, command, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self.send([command])
+        try:
+            return self._read_frame(deadline)
+        except WorkerError as e:
+            e.sent = True
+            raise
+
+    def is_usable(self, max_commands):
+        return (
+            self.proc.poll() is None
+            and self.commands_run < max_commands
+            and self.cwd == os.getcwd()
+            and self.env_key == environment_key()
+        )
+
+    def close(self, kill=False):
+        try:
+            if kill:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            else:
+                self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=None if kill else 1)
+        except subprocess.TimeoutExpired:
+            self.close(kill=True)
+            return
+        self.proc.stdout.close()
+        try:
+            os.unlink(self.errfile)
+        except OSError:
+            pass
+
+
+def _frame_deadline(timeout, deadline):
+    if timeout is None:
+        return deadline
+    frame_deadline = time.monotonic() + timeout
+    return frame_deadline if deadline is None else min(frame_deadline, deadline)
+
+
+def environment_key():
+    return hash(frozenset(os.environ.items()))
+
+
+class ZshPool:
+    """
+    A set of pre-warmed zsh processes that have already sourced `source_paths`.
+
+    Workers are started on demand (up to `size` at once, for concurrent callers) and are replaced after
+    `max_commands` commands or when the working directory or environment changes.
+    """
+
+    def __init__(self, source_paths, size=DEFAULT_POOL_SIZE, shell="zsh", max_commands=DEFAULT_MAX_COMMANDS):
+        self.source_paths = list(source_paths)
+        self.size = max(1, size)
+        self.shell = shell
+        self.max_commands = max_commands
+        self.idle = []
+        self.busy = 0
+        self.condition = threading.Condition()
+
+    def _checkout(self):
+        with self.condition:
+            while True:
+                while self.idle:
+                    worker = self.idle.pop()
+                    if worker.is_usable(self.max_commands):
+                        self.busy += 1
+                        return worker
+                    worker.close()
+
+                if self.busy < self.size:
+                    self.busy += 1
+                    break
+                self.condition.wait()
+
+        try:
+            return ZshWorker(self.shell, self.source_paths)
+        except Exception:
+            self._checkin(None)
+            raise
+
+    def _checkin(self, worker):
+        with self.condition:
+            self.busy -= 1
+            if worker is not None:
+                self.idle.append(worker)
+            self.condition.notify()
+
+    def run(self, command, timeout=None):
+        """
+        Runs `command` in a worker.
+
+        Raises:
+            TimeoutError: the command didn't finish in `timeout` seconds (its worker is killed).
+            WorkerError: the worker could not run the command; `sent` if it may have started it.
+        """
+        worker = self._checkout()
+        try:
+            result = worker.run(command, timeout=timeout)
+        except BaseException:
+            worker.close(kill=True)
+            self._checkin(None)
+            raise
+        self._checkin(worker)
+        return result
+
+    def run_batch(self, commands, timeout=None, deadline=None):
+        """
+        Runs `commands` one after another in a worker, sending them all in a single request.
+
+        Parameters:
+            timeout (float): seconds each command may take once the previous one finished.
+            deadline (float): `time.monotonic()` by which all of them must be done.
+
+        Returns:
+            List[CommandResult or None]: None for the commands that didn't finish in time (the worker is killed).
+
+        Raises:
+            WorkerError: the worker could not run the commands; its `results` are the ones that did finish and
+                `sent` is set if the next one may have started.
+        """
+        worker = self._checkout()
+        results = []
+        sent = False
+        try:
+            worker.send(commands)
+            sent = True
+            for _ in commands:
+                results.append(worker._read_frame(_frame_deadline(timeout, deadline)))
+        except TimeoutError:
+            worker.close(kill=True)
+            self._checkin(None)
+            return results + [None] * (len(commands) - len(results))
+        except WorkerError as e:
+            worker.close(kill=True)
+            self._checkin(None)
+            e.results = results
+            e.sent = sent
+            raise
+        except BaseException:
+            worker.close(kill=True)
+            self._checkin(None)
+            raise
+        self._checkin(worker)
+        return results
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_size():
+    try:
+        return int(os.getenv('input_zsh_pool_size', DEFAULT_POOL_SIZE))
+    except ValueError:
+        return DEFAULT_POOL_SIZE
+
+
+def get_pool(source_paths):
+    key = tuple(source_paths)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ZshPool(source_paths, size=pool_size())
+        return _pools[key]
+
+
+def run(command, source_paths=(), timeout=None):
+    """
+    Runs `command` with zsh after sourcing `source_paths`, reusing a warm worker when possible.
+
+    Set `input_zsh_pool_size` to 0 to start a fresh `zsh -c` for every command instead.
+
+    Returns:
+        CommandResult: stdout, stderr and exit status of the command.
+    """
+    if pool_size() > 0:
+        try:
+            return get_pool(source_paths).run(command, timeout=timeout)
+        except TimeoutError:
+            raise
+        except WorkerError as e:
+            if e.sent:
+                # it may have started, and running it again could repeat its side effects (e.g. `git stash`)
+                return _unfinished_result()
+        except OSError:
+            # e.g. the worker couldn't start; run it the slow way
+            pass
+
+    return _run_in_new_shell(command, source_paths, timeout)
+
+
+def run_batch(commands, source_paths=(), timeout=None, deadline=None):
+    """
+    Runs `commands` in as few round trips as possible: they are shared out over up to `pool_size()` workers
+    (so a slow one doesn't hold up all the others), each of which gets its share in a single request.
+
+    Parameters:
+        timeout (float): seconds each command may take once the previous one in its share finished.
+        deadline (float): `time.monotonic()` by which all of them must be done.
+
+    Returns:
+        List[CommandResult or None]: in the order of `commands`; None for the ones that didn't finish in time.
+    """
+    results = [None] * len(commands)
+    shares = max(1, min(len(commands), pool_size()))
+
+    def run_share(first):
+        indices = range(first, len(commands), shares)
+        share = [commands[i] for i in indices]
+        for i, result in zip(indices, _run_share(share, source_paths, timeout, deadline)):
+            results[i] = result
+
+    if shares == 1:
+        run_share(0)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=shares) as executor:
+            list(executor.map(run_share, range(shares)))
+
+    return results
+
+
+def _run_share(commands, source_paths, timeout, deadline):
+    results = []
+    if pool_size() > 0:
+        try:
+            return get_pool(source_paths).run_batch(commands, timeout=timeout, deadline=deadline)
+        except WorkerError as e:
+            # what finished or may have started isn't run again (commands may have side effects), only the rest
+            results = list(e.results)
+            if e.sent:
+                results.append(_unfinished_result())
+        except OSError:
+            pass
+
+    for command in commands[len(results):]:
+        frame_deadline = _frame_deadline(timeout, deadline)
+        remaining = None if frame_deadline is None else frame_deadline - time.monotonic()
+        try:
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError()
+            results.append(_run_in_new_shell(command, source_paths, remaining))
+        except TimeoutError:
+            results.append(None)
+    return results
+
+
+def _unfinished_result():
+    return CommandResult(stdout='', stderr="the shell running it exited", returncode=-1)
+
+
+def _run_in_new_shell(command, source_paths, timeout):
+    sources = "".join(f"source {shell_quote(path)};\n" for path in source_paths)
+    try:
+        result = subprocess.run(["zsh", "-c", sources + command], capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise TimeoutError()
+    return CommandResult(stdout=result.stdout, stderr=result.stderr, returncode=result.returncode)
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)